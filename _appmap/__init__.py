@@ -1,6 +1,18 @@
 """PYTEST_DONT_REWRITE"""
 
-from . import configuration, event, importer, metadata, recorder, recording, web_framework
+from . import (
+    configuration,
+    describers,
+    event,
+    flight_recorder,
+    importer,
+    metadata,
+    plan_cache,
+    recorder,
+    recording,
+    web_framework,
+    writer,
+)
 from . import env as appmapenv
 from .py_version_check import check_py_version
 
@@ -8,13 +20,17 @@ from .py_version_check import check_py_version
 def initialize(**kwargs):
     check_py_version()
     appmapenv.initialize(**kwargs)
+    describers.initialize()
     event.initialize()
     importer.initialize()
+    plan_cache.initialize()
     recorder.initialize()
     configuration.initialize()  # needs to be initialized after recorder
     metadata.initialize()
     web_framework.initialize()
+    flight_recorder.initialize()
     recording.initialize()
+    writer.initialize()
 
 
 initialize()
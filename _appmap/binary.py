@@ -0,0 +1,402 @@
+"""
+A compact binary format for AppMaps, that's cheaper to write than JSON, and can be converted to
+JSON later (e.g. with appmap-convert), off the machine that recorded it.
+
+A file starts with MAGIC, followed by a sequence of records. Each record is a tag byte, the length
+of its body as a varint, and its body:
+
+  HEADER: the JSON for [APPMAP_VERSION, metadata]
+  EVENTS: a batch of events
+  CLASSMAP: the JSON for the classMap
+
+The body of an EVENTS record is a sequence of items, each a tag byte followed by its contents:
+
+  STRING: a varint length, and that many bytes of UTF-8. The string gets the next string index.
+  SHAPE: a varint count, and that many varint string indexes. These are the keys of a dict, and the
+    shape gets the next shape index.
+  EVENT: a value, which is the dict for the event.
+
+Strings and shapes are only written the first time they're used, and their indexes carry over from
+one batch to the next. Values are encoded as a tag byte, followed by:
+
+  NONE, FALSE, TRUE: nothing
+  INT: a zigzag-encoded varint
+  INT64: a zigzag-encoded int, as 8 little-endian bytes. Used for big ints (e.g. object ids), which
+    are quicker to pack than to encode as varints.
+  FLOAT: an 8-byte, little-endian double
+  STR: a varint string index
+  LIST: a varint count, and that many values
+  DICT: a varint shape index, and a value for each of its keys
+  NANOS: a varint count of nanoseconds, for the elapsed time of a return event. It's converted back
+    to seconds.
+
+Events are turned into dicts the same way generation.write does, so converting a file produces the
+same AppMap that would have been written as JSON, apart from elapsed times being rounded to the
+nearest nanosecond.
+"""
+
+import json
+import struct
+
+from . import generation
+
+MAGIC = b"APPMAPB\x01"
+
+# Record tags
+HEADER = 1
+EVENTS = 2
+CLASSMAP = 3
+
+# Item tags
+STRING = 1
+SHAPE = 2
+EVENT = 3
+
+# Value tags
+NONE = 0
+FALSE = 1
+TRUE = 2
+INT = 3
+FLOAT = 4
+STR = 5
+LIST = 6
+DICT = 7
+NANOS = 8
+INT64 = 9
+
+_DOUBLE = struct.Struct("<d")
+_UINT64 = struct.Struct("<Q")
+
+# The number of events in each EVENTS record.
+_BATCH_SIZE = 1000
+
+
+class BinaryFormatError(Exception):
+    pass
+
+
+def _varint(out, n):
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(buf, pos):
+    ret = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos += 1
+        ret |= (b & 0x7F) << shift
+        if b < 0x80:
+            return ret, pos
+        shift += 7
+
+
+class _Encoder:
+    """
+    Encodes values. This is where the time writing an AppMap goes, so the encodings of strings, and
+    the prefixes of dicts, are kept as bytes, ready to be copied.
+    """
+
+    def __init__(self):
+        self._strings = {}
+        self._shapes = {}
+        # Definitions of new strings and shapes, which must precede the event that uses them.
+        self._defs = bytearray()
+
+    def _new_string(self, s):
+        defs = self._defs
+        data = s.encode("utf-8", "surrogatepass")
+        defs.append(STRING)
+        _varint(defs, len(data))
+        defs += data
+
+        code = bytearray([STR])
+        _varint(code, len(self._strings))
+        ret = self._strings[s] = bytes(code)
+        return ret
+
+    def _string_index(self, s):
+        code = self._strings.get(s) or self._new_string(s)
+        return _read_varint(code, 1)[0]
+
+    def _new_shape(self, keys):
+        # As in JSON, keys that aren't strings are converted to strings.
+        indexes = [self._string_index(k if type(k) is str else json.dumps(k)) for k in keys]
+        defs = self._defs
+        defs.append(SHAPE)
+        _varint(defs, len(indexes))
+        for i in indexes:
+            _varint(defs, i)
+
+        prefix = bytearray([DICT])
+        _varint(prefix, len(self._shapes))
+        elapsed = keys.index("elapsed") if "elapsed" in keys else None
+        ret = self._shapes[keys] = (bytes(prefix), elapsed)
+        return ret
+
+    def value(self, out, v):  # pylint: disable=too-many-branches
+        t = type(v)
+        if t is str:
+            out += self._strings.get(v) or self._new_string(v)
+        elif t is dict:
+            keys = tuple(v)
+            prefix, elapsed = self._shapes.get(keys) or self._new_shape(keys)
+            out += prefix
+            strings = self._strings
+            for i, item in enumerate(v.values()):
+                # Strings are by far the most common values, so handle them here.
+                if type(item) is str:  # pylint: disable=unidiomatic-typecheck
+                    out += strings.get(item) or self._new_string(item)
+                elif i == elapsed and type(item) is float:  # pylint: disable=unidiomatic-typecheck
+                    out.append(NANOS)
+                    _varint(out, max(round(item * 1e9), 0))
+                else:
+                    self.value(out, item)
+        elif t is int:
+            n = v << 1 if v >= 0 else ((-v) << 1) - 1
+            if n < 0x80:
+                out += bytes((INT, n))
+            elif 1 << 28 <= n < 1 << 64:
+                out.append(INT64)
+                out += _UINT64.pack(n)
+            else:
+                out.append(INT)
+                _varint(out, n)
+        elif v is None:
+            out.append(NONE)
+        elif t is bool:
+            out.append(TRUE if v else FALSE)
+        elif t in (list, tuple):
+            out.append(LIST)
+            _varint(out, len(v))
+            for item in v:
+                self.value(out, item)
+        elif t is float:
+            out.append(FLOAT)
+            out += _DOUBLE.pack(v)
+        else:
+            self.value(out, _to_native(v))
+
+    def batch(self, dicts):
+        """Return the body of an EVENTS record for dicts."""
+        ret = bytearray()
+        event = bytearray()
+        for d in dicts:
+            event.clear()
+            self.value(event, d)
+            if self._defs:
+                ret += self._defs
+                self._defs.clear()
+            ret.append(EVENT)
+            ret += event
+        return ret
+
+
+def _to_native(v):
+    """
+    Return a value the encoder handles natively for v, as it would be written as JSON: subclasses of
+    the native types are written as their base types, and anything else that isn't an Event (e.g.
+    bytes) as its str.
+    """
+    if isinstance(v, str):
+        return str.__str__(v)
+    if isinstance(v, int):
+        return int.__int__(v)
+    if isinstance(v, float):
+        return float.__float__(v)
+    if isinstance(v, dict):
+        return dict(v)
+    if isinstance(v, (list, tuple)):
+        return list(v)
+    return generation._default(v)  # pylint: disable=protected-access
+
+
+def _write_record(f, tag, body):
+    header = bytearray([tag])
+    _varint(header, len(body))
+    f.write(header)
+    f.write(body)
+
+
+def write(recording, f, metadata=None):
+    """
+    Write the AppMap for recording to the binary file f, in the binary format.
+    """
+    events = recording.events
+    if hasattr(events, "flush"):
+        events.flush()
+
+    encode = generation.json_encoder()
+    f.write(MAGIC)
+    metadata = generation._metadata(metadata)  # pylint: disable=protected-access
+    _write_record(f, HEADER, encode([generation.APPMAP_VERSION, metadata]).encode("utf-8"))
+
+    encoder = _Encoder()
+    if hasattr(events, "event_dicts"):
+        # The events were spilled to disk, already turned into dicts.
+        for dicts in events.event_dicts():
+            _write_record(f, EVENTS, encoder.batch(dicts))
+    else:
+        # Use the same dicts for the events as generation.write would.
+        serializer = generation.EventSerializer(encode)
+        batch = []
+        for e in events:
+            batch.append(e)
+            if len(batch) >= _BATCH_SIZE:
+                _write_record(f, EVENTS, encoder.batch(serializer.to_dicts(batch)))
+                batch = []
+        if batch:
+            _write_record(f, EVENTS, encoder.batch(serializer.to_dicts(batch)))
+
+    classmap_entries = list(generation.classmap(recording).values())
+    _write_record(f, CLASSMAP, encode(classmap_entries).encode("utf-8"))
+
+
+class _Decoder:
+    def __init__(self):
+        self._strings = []
+        self._shapes = []
+
+    def value(self, buf, pos):  # pylint: disable=too-many-branches,too-many-return-statements
+        tag = buf[pos]
+        pos += 1
+        if tag == STR:
+            i, pos = _read_varint(buf, pos)
+            return self._strings[i], pos
+        if tag == DICT:
+            i, pos = _read_varint(buf, pos)
+            ret = {}
+            for k in self._shapes[i]:
+                ret[k], pos = self.value(buf, pos)
+            return ret, pos
+        if tag == INT:
+            n, pos = _read_varint(buf, pos)
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+        if tag == INT64:
+            n = _UINT64.unpack_from(buf, pos)[0]
+            return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos + _UINT64.size
+        if tag == NONE:
+            return None, pos
+        if tag in (TRUE, FALSE):
+            return tag == TRUE, pos
+        if tag == LIST:
+            n, pos = _read_varint(buf, pos)
+            ret = []
+            for _ in range(n):
+                item, pos = self.value(buf, pos)
+                ret.append(item)
+            return ret, pos
+        if tag == NANOS:
+            n, pos = _read_varint(buf, pos)
+            return n / 1e9, pos
+        if tag == FLOAT:
+            return _DOUBLE.unpack_from(buf, pos)[0], pos + _DOUBLE.size
+        raise BinaryFormatError(f"unknown value tag {tag} at {pos - 1}")
+
+    def batch(self, buf):
+        """Return the events in buf, the body of an EVENTS record."""
+        try:
+            return self._batch(buf)
+        except (IndexError, struct.error, UnicodeDecodeError) as exc:
+            # e.g. a read past the end of the record, or an index of a string or shape that was
+            # never defined.
+            raise BinaryFormatError(f"corrupt events record: {exc}") from exc
+
+    def _batch(self, buf):
+        ret = []
+        pos = 0
+        end = len(buf)
+        while pos < end:
+            tag = buf[pos]
+            pos += 1
+            if tag == EVENT:
+                e, pos = self.value(buf, pos)
+                ret.append(e)
+            elif tag == STRING:
+                n, pos = _read_varint(buf, pos)
+                if pos + n > end:
+                    raise BinaryFormatError(f"truncated string at {pos}")
+                self._strings.append(bytes(buf[pos : pos + n]).decode("utf-8", "surrogatepass"))
+                pos += n
+            elif tag == SHAPE:
+                n, pos = _read_varint(buf, pos)
+                keys = []
+                for _ in range(n):
+                    i, pos = _read_varint(buf, pos)
+                    keys.append(self._strings[i])
+                self._shapes.append(tuple(keys))
+            else:
+                raise BinaryFormatError(f"unknown item tag {tag} at {pos - 1}")
+        return ret
+
+
+def _read_records(f):
+    try:
+        yield from _read_raw_records(f)
+    except EOFError as exc:
+        # A compressed file that was cut short.
+        raise BinaryFormatError("truncated file") from exc
+
+
+def _read_raw_records(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise BinaryFormatError("not a binary AppMap")
+
+    while True:
+        tag = f.read(1)
+        if not tag:
+            return
+        length = 0
+        shift = 0
+        while True:
+            b = f.read(1)
+            if not b:
+                raise BinaryFormatError("truncated record")
+            length |= (b[0] & 0x7F) << shift
+            if b[0] < 0x80:
+                break
+            shift += 7
+        body = f.read(length)
+        if len(body) != length:
+            raise BinaryFormatError("truncated record")
+        yield tag[0], body
+
+
+def convert(f, out):
+    """
+    Read the binary AppMap from the binary file f, and write it as JSON to the text file out.
+    """
+    encode = generation.json_encoder()
+    decoder = _Decoder()
+    separator = None
+    classmap_json = "[]"
+    for tag, body in _read_records(f):
+        if tag == HEADER:
+            try:
+                version, metadata = json.loads(body)
+            except (ValueError, TypeError) as exc:
+                raise BinaryFormatError(f"corrupt header: {exc}") from exc
+            separator = ""
+            out.write('{"version": %s, "metadata": %s, "events": [' % (
+                encode(version), encode(metadata)
+            ))
+        elif separator is None:
+            raise BinaryFormatError("missing header")
+        elif tag == EVENTS:
+            events = decoder.batch(body)
+            if events:
+                out.write(separator + encode(events)[1:-1])
+                separator = ", "
+        elif tag == CLASSMAP:
+            try:
+                classmap_json = body.decode("utf-8")
+            except UnicodeDecodeError as exc:
+                raise BinaryFormatError(f"corrupt classMap: {exc}") from exc
+        else:
+            raise BinaryFormatError(f"unknown record tag {tag}")
+    if separator is None:
+        raise BinaryFormatError("missing header")
+    out.write('], "classMap": %s}' % classmap_json)
@@ -0,0 +1,263 @@
+"""A compact, columnar store for recorded events"""
+
+from array import array
+
+from . import generation
+from .event import CallEvent, ExceptionEvent, FuncReturnEvent, ReturnEvent
+
+_CALL = 0
+_RETURN = 1
+_EXCEPTION = 2
+_OTHER = 3
+
+_NO_FUNCTION = -1
+_NO_PARENT = 0
+_NO_ELAPSED = float("nan")
+
+# The keys of a value's description whose values are shared by many events. Only the strings for
+# these are interned: the rest (e.g. the value itself) are mostly different for each event.
+_INTERNED_KEYS = frozenset(["name", "class"])
+
+
+class _Columns:  # pylint: disable=too-few-public-methods
+    """The columns of a ColumnarEvents, one entry per event."""
+
+    __slots__ = ["kinds", "ids", "thread_ids", "parent_ids", "elapsed", "fn_indexes", "values"]
+
+    def __init__(self):
+        self.kinds = array("b")
+        self.ids = array("q")
+        self.thread_ids = array("l")
+        self.parent_ids = array("q")
+        self.elapsed = array("d")
+        self.fn_indexes = array("l")
+        self.values = []
+
+    def extend(self, other, fn_indexes):
+        """
+        Add the rows of the _Columns other. fn_indexes maps the indexes into the function table of
+        other to the indexes into this one.
+        """
+        self.kinds.extend(other.kinds)
+        self.ids.extend(other.ids)
+        self.thread_ids.extend(other.thread_ids)
+        self.parent_ids.extend(other.parent_ids)
+        self.elapsed.extend(other.elapsed)
+        self.fn_indexes.extend(fn_indexes[i] if i != _NO_FUNCTION else i for i in other.fn_indexes)
+        self.values.extend(other.values)
+
+
+class _FunctionTable:
+    """The FunctionInfo for each function called by the events in a ColumnarEvents."""
+
+    __slots__ = ["functions", "indexes"]
+
+    def __init__(self):
+        self.functions = []
+        self.indexes = {}
+
+    def __getitem__(self, i):
+        return self.functions[i]
+
+    def __len__(self):
+        return len(self.functions)
+
+    def add(self, fninfo):
+        """Add fninfo to the table, and return its index."""
+        self.indexes[fninfo] = len(self.functions)
+        self.functions.append(fninfo)
+        return self.indexes[fninfo]
+
+    def merge(self, other):
+        """
+        Add the functions in the _FunctionTable other that aren't already in this one. Return a
+        list that maps each index into other to the index of the same function in this one.
+        """
+        indexes = self.indexes
+        return [
+            indexes[fninfo] if fninfo in indexes else self.add(fninfo)
+            for fninfo in other.functions
+        ]
+
+
+class ColumnarEvents:
+    """
+    A replacement for the list of events held by a Recorder, that keeps the events in columns
+    rather than as individual Event objects.
+
+    The values every event has (id, thread_id, parent_id, elapsed, and the index of the function
+    called) are held in arrays. The FunctionInfo for each function is held in a table indexed by
+    the function column. The values that are different for each event (parameters, receiver,
+    return_value) are kept as tuples, with their keys, names, and class names interned.
+
+    Events that don't come from instrumented functions (e.g. HTTP requests, SQL queries) are kept
+    as they are. They're relatively few, and some of them get updated after they're recorded.
+
+    Iterating over the store produces a dict for each event, so the events should only be iterated
+    when they're being written.
+    """
+
+    def __init__(self):
+        self._columns = _Columns()
+        self._functions = _FunctionTable()
+        # Maps the keys of each description to them, and the positions of the values to intern.
+        self._shapes = {}
+        self._strings = {}
+        self.classmap = generation.ClassMap()
+
+    def _compact(self, value):
+        """
+        Turn the dict value (as returned by describe_value) into a tuple of its keys and a tuple of
+        its values. The keys tuples, and the strings for the keys in _INTERNED_KEYS, are shared
+        between events.
+        """
+        if value is None:
+            return None
+
+        shape = tuple(value.keys())
+        entry = self._shapes.get(shape)
+        if entry is None:
+            interned = tuple(i for i, k in enumerate(shape) if k in _INTERNED_KEYS)
+            entry = self._shapes[shape] = (shape, interned)
+        shape, interned = entry
+
+        values = list(value.values())
+        strings = self._strings
+        for i in interned:
+            v = values[i]
+            if type(v) is str:  # pylint: disable=unidiomatic-typecheck
+                values[i] = strings.setdefault(v, v)
+        return (shape, tuple(values))
+
+    @staticmethod
+    def _expand(compacted):
+        if compacted is None:
+            return None
+        shape, values = compacted
+        return dict(zip(shape, values))
+
+    def _function_index(self, e):
+        fninfo = e.fninfo
+        ret = self._functions.indexes.get(fninfo)
+        if ret is None:
+            ret = self._functions.add(fninfo)
+            generation.add_to_classmap(self.classmap, e)
+        return ret
+
+    def append(self, e):
+        # Check the exact type, so subclasses (which may add attributes) get stored as they are.
+        t = type(e)
+        if t is dict:
+            # An event that's already been serialized, e.g. by a SpilledEvents. The store it came
+            # from has the classmap for it.
+            event_id, thread_id = e["id"], e["thread_id"]
+        else:
+            event_id, thread_id = e.id, e.thread_id
+        parent_id = _NO_PARENT
+        elapsed = _NO_ELAPSED
+        fn_index = _NO_FUNCTION
+        if t is CallEvent:
+            kind = _CALL
+            fn_index = self._function_index(e)
+            value = (self._compact(e.receiver), tuple(self._compact(p) for p in e.parameters))
+        elif t in (FuncReturnEvent, ExceptionEvent, ReturnEvent):
+            kind = _RETURN if t is not ExceptionEvent else _EXCEPTION
+            parent_id = e.parent_id
+            elapsed = e.elapsed
+            if t is FuncReturnEvent:
+                value = self._compact(e.return_value)
+            else:
+                value = getattr(e, "exceptions", None)
+        else:
+            kind = _OTHER
+            value = e
+            if t is not dict:
+                self.classmap.add(e)
+
+        columns = self._columns
+        columns.kinds.append(kind)
+        columns.ids.append(event_id)
+        columns.thread_ids.append(thread_id)
+        columns.parent_ids.append(parent_id)
+        columns.elapsed.append(elapsed)
+        columns.fn_indexes.append(fn_index)
+        columns.values.append(value)
+
+    def tables(self):
+        """Return the columns and the function table of the store, to merge into another one."""
+        return self._columns, self._functions
+
+    def extend(self, events):
+        if not isinstance(events, ColumnarEvents):
+            for e in events:
+                self.append(e)
+            # The events of a store that keeps its own classmap may be dicts, which don't get added
+            # to the classmap when they're appended.
+            classmap = getattr(events, "classmap", None)
+            if classmap is not None:
+                self.classmap.update(classmap)
+            return
+
+        # Iterating another ColumnarEvents would produce dicts, so merge its columns instead. Only
+        # the indexes into its function table need to change.
+        columns, functions = events.tables()
+        self._columns.extend(columns, self._functions.merge(functions))
+        self.classmap.update(events.classmap)
+
+    def __iadd__(self, events):
+        self.extend(events)
+        return self
+
+    def __len__(self):
+        return len(self._columns.ids)
+
+    def __bool__(self):
+        return len(self._columns.ids) > 0
+
+    def _row(self, i):
+        # The keys are produced in the same order Event.to_dict would produce them, so the output
+        # doesn't change.
+        columns = self._columns
+        kind = columns.kinds[i]
+        value = columns.values[i]
+        if kind == _OTHER:
+            if type(value) is dict:  # pylint: disable=unidiomatic-typecheck
+                return value
+            return value.to_dict()
+
+        ret = {}
+        if kind == _CALL:
+            fninfo = self._functions[columns.fn_indexes[i]]
+            ret["static"] = fninfo.static
+            receiver, parameters = value
+            if receiver is not None:
+                ret["receiver"] = self._expand(receiver)
+            ret["parameters"] = [self._expand(p) for p in parameters]
+            if fninfo.auxtype is not None:
+                ret["auxtype"] = fninfo.auxtype
+            ret["id"] = columns.ids[i]
+            ret["event"] = "call"
+            ret["thread_id"] = columns.thread_ids[i]
+            ret["defined_class"] = fninfo.defined_class
+            ret["method_id"] = fninfo.method_id
+            ret["path"] = fninfo.path
+            ret["lineno"] = fninfo.lineno
+            return ret
+
+        if value is not None:
+            if kind == _RETURN:
+                ret["return_value"] = self._expand(value)
+            else:
+                ret["exceptions"] = value
+        ret["parent_id"] = columns.parent_ids[i]
+        ret["elapsed"] = columns.elapsed[i]
+        ret["id"] = columns.ids[i]
+        ret["event"] = "return"
+        ret["thread_id"] = columns.thread_ids[i]
+        return ret
+
+    def __iter__(self):
+        return (self._row(i) for i in range(len(self._columns.ids)))
+
+    def __repr__(self):
+        return f"<ColumnarEvents count: {len(self)} functions: {len(self._functions)}>"
@@ -24,7 +24,8 @@ from appmap.labeling import presets as label_presets
 from . import utils
 from .env import Env
 from .importer import Filter, Importer
-from .instrument import instrument
+from .event import DEFAULT_SCHEMA_LIMITS, SchemaLimits
+from .instrument import instrument, is_instrumented
 
 logger = Env.current.getLogger(__name__)
 
@@ -170,6 +171,11 @@ class Config(metaclass=SingletonMeta):
     def packages(self):
         return self._config["packages"]
 
+    @property
+    def schema(self):
+        """The default limits on the schemas inferred for parameters and return values"""
+        return schema_limits(self._config.get("schema"))
+
     @property
     def record_test_cases(self):
         return self._config.get("record_test_cases", False)
@@ -363,13 +369,21 @@ def startswith(prefix, sequence):
 
 
 class PathMatcher:
-    def __init__(self, prefix, excludes=None, shallow=False):
+    def __init__(self, prefix, excludes=None, shallow=False, schema=DEFAULT_SCHEMA_LIMITS):
         excludes = excludes or []
         self.prefix = []
         if prefix:
             self.prefix = prefix.split(".")
         self.excludes = [x.split(".") for x in excludes]
         self.shallow = shallow
+        self.schema = schema
+
+    def accepts(self, filterable):  # pylint: disable=unused-argument
+        """
+        Check anything about filterable other than its name. MatcherTrie only compares names, so
+        this is called on the matchers whose prefix and excludes it finds match.
+        """
+        return True
 
     def matches(self, filterable):
         fqname = name = filterable.fqname.split(".")
@@ -391,23 +405,51 @@ class PathMatcher:
         )
 
 
+def _normpath(path):
+    return os.path.normcase(os.path.abspath(path))
+
+
 class DistMatcher(PathMatcher):
     def __init__(self, dist, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.dist = dist
-        dist_files = importlib.metadata.files(dist)
-        self.files = [str(pp.locate()) for pp in dist_files] if dist_files is not None else []
+        self._files = None
+        # Whether each source file is in the dist, keyed by the name inspect.getfile returns for it.
+        self._in_dist = {}
 
-    def matches(self, filterable):
+    @property
+    def files(self):
+        """
+        The normalized paths of the files in the dist. They're read the first time they're needed,
+        when something that matches the dist's path is imported.
+        """
+        if self._files is None:
+            try:
+                dist_files = importlib.metadata.files(self.dist)
+            except importlib.metadata.PackageNotFoundError:
+                logger.warning("Distribution %r not found", self.dist)
+                dist_files = None
+            self._files = frozenset(_normpath(str(pp.locate())) for pp in dist_files or [])
+        return self._files
+
+    def accepts(self, filterable):
+        obj = filterable.obj
+        if getattr(obj, "_appmap_instrumented", False):
+            # A plain wrapper's code is its own, so look at the function it wraps.
+            obj = getattr(obj, "__wrapped__", obj)
         try:
-            obj = filterable.obj
-            logger.trace("%r.matches(%r): %s in %r", self, obj, inspect.getfile(obj), self.files)
-            if inspect.getfile(obj) not in self.files:
-                return False
+            path = inspect.getfile(obj)
         except TypeError:
             # builtins don't have file associated
             return False
-        return super().matches(filterable)
+        ret = self._in_dist.get(path)
+        if ret is None:
+            ret = self._in_dist[path] = _normpath(path) in self.files
+        logger.trace("%r.accepts(%r): %s -> %r", self, obj, path, ret)
+        return ret
+
+    def matches(self, filterable):
+        return self.accepts(filterable) and super().matches(filterable)
 
     def __repr__(self):
         return "DistMatcher(%r, %r, %r, shallow=%r)" % (
@@ -418,19 +460,103 @@ class DistMatcher(PathMatcher):
         )
 
 
+class _TrieNode:  # pylint: disable=too-few-public-methods
+    __slots__ = ["children", "rules", "excludes"]
+
+    def __init__(self):
+        self.children = {}
+        # The indexes of the matchers whose prefix ends here,
+        self.rules = []
+        # and of those that exclude everything from here down.
+        self.excludes = []
+
+
+class MatcherTrie:
+    """
+    The prefixes and excludes of a list of PathMatchers, compiled into a single trie over the
+    components of dotted names. Finding the matchers that match a name takes one walk down the trie,
+    rather than comparing the name to the prefix and excludes of every matcher.
+    """
+
+    def __init__(self, matchers):
+        self.matchers = matchers
+        self._root = _TrieNode()
+        for i, m in enumerate(matchers):
+            self._node(m.prefix).rules.append(i)
+            for x in m.excludes:
+                self._node(m.prefix + x).excludes.append(i)
+
+    def _node(self, components):
+        node = self._root
+        for component in components:
+            node = node.children.setdefault(component, _TrieNode())
+        return node
+
+    def _walk(self, components):
+        """
+        Walk down the trie along components, as far as it goes. Returns the last node reached, the
+        indexes of the matchers whose prefix was passed, and the indexes of those whose excludes
+        were.
+        """
+        node = self._root
+        rules = list(node.rules)
+        excluded = set()
+        for component in components:
+            node = node.children.get(component)
+            if node is None:
+                break
+            rules += node.rules
+            excluded.update(node.excludes)
+        return node, rules, excluded
+
+    def matching(self, fqname):
+        """
+        Return the indexes of the matchers whose prefix fqname starts with, and whose excludes it
+        doesn't, in order.
+        """
+        _, rules, excluded = self._walk(fqname.split("."))
+        if not excluded:
+            return sorted(rules)
+        if any(i in excluded for i in rules):
+            logger.info("%r excluded", fqname)
+        return sorted(i for i in rules if i not in excluded)
+
+    def could_match(self, modname):
+        """
+        Return False if nothing in the module modname (its functions, or its classes and their
+        methods) can be matched.
+        """
+        node, rules, excluded = self._walk(modname.split("."))
+        if any(i not in excluded for i in rules):
+            return True
+        # If the walk didn't stop short of the end of modname, there may be prefixes (or excludes)
+        # further down, that name things in the module.
+        return node is not None and bool(node.children)
+
+
+# Tells MatcherFilter.wrap to find the matcher to use.
+_MATCH = object()
+
+
 class MatcherFilter(Filter):
     def __init__(self, matchers, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.matchers = matchers
+        self._trie = MatcherTrie(matchers)
 
     def filter(self, filterable):
-        result = any(
-            m.matches(filterable) for m in self.matchers
-        ) or self.next_filter.filter(filterable)
+        result = self.match(filterable) is not None or self.next_filter.filter(filterable)
         logger.trace("ConfigFilter.filter(%r) -> %r", filterable.fqname, result)
         return result
 
-    def wrap(self, filterable):
+    def could_match(self, modname):
+        return self._trie.could_match(modname) or self.next_filter.could_match(modname)
+
+    def wrap(self, filterable, rule=_MATCH, param_shape=None):
+        """
+        Wrap filterable.obj. rule is the matcher whose settings are used; it's found with match, if
+        it isn't given. param_shape is passed on to instrument.
+        """
         # For historical reasons, this implementation is a little weird.
         #
         # It used to be that this function would use self.match to decide whether or not a
@@ -441,36 +567,66 @@ class MatcherFilter(Filter):
         # whether a shallow mapping is turned on for a package, setting _appmap_shallow as
         # appropriate.
         #
-        rule = self.match(filterable)
-        wrapped = getattr(filterable.obj, "_appmap_instrumented", None)
-        if not wrapped:
+        if rule is _MATCH:
+            rule = self.match(filterable)
+        if not is_instrumented(filterable):
             logger.trace("  wrapping %s", filterable.fqname)
             Config.current.labels.apply(filterable)
-            ret = instrument(filterable)
-            if rule and rule.shallow:
-                setattr(ret, "_appmap_shallow", rule)
+            ret = instrument(
+                filterable,
+                schema=rule.schema if rule else Config.current.schema,
+                param_shape=param_shape,
+                shallow=rule if rule and rule.shallow else None,
+            )
         else:
             logger.trace("  already wrapped %s", filterable.fqname)
             ret = filterable.obj
         return ret
 
     def match(self, filterable):
-        return next((m for m in self.matchers if m.matches(filterable)), None)
+        matchers = self.matchers
+        for i in self._trie.matching(filterable.fqname):
+            if matchers[i].accepts(filterable):
+                return matchers[i]
+        return None
+
+
+def schema_limits(config, default=DEFAULT_SCHEMA_LIMITS):
+    """
+    Return the SchemaLimits specified by config, the value of a schema key in appmap.yml. Any limit
+    that isn't specified is taken from default.
+    """
+    if not config:
+        return default
+
+    try:
+        unknown = set(config) - set(SchemaLimits._fields)
+        if unknown:
+            logger.warning("ignoring unknown schema limits %s", ", ".join(sorted(unknown)))
+        return default._replace(
+            **{k: int(v) for k, v in config.items() if k in SchemaLimits._fields}
+        )
+    except (TypeError, ValueError):
+        logger.warning("invalid schema limits %r, using %r", config, default)
+        return default
 
 
 def matcher_of_config(package):
     dist = package.get("dist", None)
+    schema = schema_limits(package.get("schema"), Config.current.schema)
     if dist:
         return DistMatcher(
             dist,
             package.get("path", None),
             package.get("exclude", []),
             shallow=package.get("shallow", True),
+            schema=schema,
         )
     return PathMatcher(
         package["path"],
         package.get("exclude", []),
         shallow=package.get("shallow", False),
+        schema=schema,
     )
 
 
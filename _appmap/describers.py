@@ -0,0 +1,99 @@
+"""
+Describers give custom descriptions of the values recorded for parameters, receivers, and return
+values.
+
+A describer is a function that's called with a value and display_value (whether the value itself may
+be displayed). It returns a dict with the fields that describe the value, e.g. "class", "value", and
+"properties". name and object_id are filled in by the caller, as is "class", if it's missing. A
+describer must not include anything derived from the value itself when display_value is false.
+
+Describers can be registered for a class with appmap.register_describer, or with an entry point in
+the "appmap.describers" group. The name of the entry point is the fully-qualified name of the class
+(e.g. myapp.models.Order), so the modules that define classes aren't imported until a value of that
+class is described.
+
+A describer registered for a class is also used for its subclasses, unless they have their own.
+"""
+
+import importlib.metadata
+from functools import lru_cache
+
+from .env import Env
+from .utils import fqname
+
+logger = Env.current.getLogger(__name__)
+
+ENTRY_POINT_GROUP = "appmap.describers"
+
+# The describers registered for each class.
+_describers = {}
+
+# The describer to use for each type that's been described, found by searching its MRO. Types are
+# held on to, but the number of types an app passes around is small.
+_resolved = {}
+
+# Entry points that haven't been loaded yet, keyed by class name.
+_entry_points = None
+
+
+@lru_cache(maxsize=4096)
+def class_name(val_type):
+    """Return (and cache) the fully-qualified name of val_type."""
+    return fqname(val_type)
+
+
+def register(cls, describer):
+    """Use describer to describe values of cls, and its subclasses."""
+    _describers[cls] = describer
+    _resolved.clear()
+
+
+def _load_entry_points():
+    eps = importlib.metadata.entry_points()
+    if hasattr(eps, "select"):
+        eps = eps.select(group=ENTRY_POINT_GROUP)
+    else:
+        # Before Python 3.10, entry_points returned a dict of lists.
+        eps = eps.get(ENTRY_POINT_GROUP, [])
+    return {ep.name: ep for ep in eps}
+
+
+def _from_entry_point(cls):
+    global _entry_points  # pylint: disable=global-statement
+    if _entry_points is None:
+        _entry_points = _load_entry_points()
+    if not _entry_points:
+        return None
+
+    ep = _entry_points.pop(class_name(cls), None)
+    if ep is None:
+        return None
+    try:
+        describer = ep.load()
+    except Exception:  # pylint: disable=broad-except
+        logger.warning("failed to load describer %s", ep.value, exc_info=True)
+        return None
+    _describers[cls] = describer
+    return describer
+
+
+def describer_for(val_type):
+    """Return the describer to use for values of val_type, or None if there isn't one."""
+    try:
+        return _resolved[val_type]
+    except KeyError:
+        pass
+
+    ret = None
+    for cls in val_type.__mro__:
+        ret = _describers.get(cls) or _from_entry_point(cls)
+        if ret is not None:
+            break
+    _resolved[val_type] = ret
+    return ret
+
+
+def initialize():
+    global _entry_points  # pylint: disable=global-statement
+    _entry_points = None
+    _resolved.clear()
@@ -57,6 +57,7 @@ class Env(metaclass=SingletonMeta):
             self._display_labeled_params = True
 
         logger = logging.getLogger(__name__)
+
         # The user shouldn't set APPMAP_OUTPUT_DIR, but some tests depend on being able to use it.
         appmap_output_dir = self.get("APPMAP_OUTPUT_DIR", None)
         if appmap_output_dir is not None:
@@ -75,6 +76,22 @@ class Env(metaclass=SingletonMeta):
     def get(self, name, default=None):
         return self._env.get(name, default)
 
+    def get_int(self, name, default):
+        """
+        Return the value of the setting name as an int, or default if it's not set. If it's not an
+        int, log a warning and return default.
+        """
+        value = self._env.get(name)
+        if value is None:
+            return default
+        try:
+            return int(value)
+        except ValueError:
+            logging.getLogger(__name__).warning(
+                "%s should be an integer, not %r, using %r", name, value, default
+            )
+            return default
+
     def delete(self, name):
         del self._env[name]
 
@@ -146,6 +163,15 @@ class Env(metaclass=SingletonMeta):
     def display_labeled_params(self):
         return self._display_labeled_params
 
+    @cached_property
+    def max_value_length(self):
+        """
+        The length displayed values are truncated to, or None if they're never truncated (because
+        APPMAP_MAX_VALUE_LENGTH isn't positive).
+        """
+        max_value_length = self.get_int("APPMAP_MAX_VALUE_LENGTH", 10_000)
+        return max_value_length if max_value_length > 0 else None
+
     def getLogger(self, name) -> trace_logger.TraceLogger:
         return cast(trace_logger.TraceLogger, logging.getLogger(name))
 
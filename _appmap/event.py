@@ -3,12 +3,16 @@ import inspect
 import logging
 import operator
 import threading
-from functools import lru_cache, partial
+from collections import namedtuple
+from functools import cached_property, lru_cache, partial
 from inspect import Parameter, Signature
-from itertools import chain
+from itertools import chain, islice
+from types import FunctionType
 
+from .describers import class_name, describer_for
 from .env import Env
 from .recorder import Recorder
+from .reprs import TRUNCATION_MARKER, limited_repr
 from .utils import (
     FnType,
     FqFnName,
@@ -45,27 +49,43 @@ class _EventIds:
         cls._next_thread_id = 0
 
 
-def display_string(val, display_value=False):
+def render_value(val, display_value=False, max_length=None):
+    """
+    Like display_string, but also return the original length of the value if it was truncated (or
+    None, if it wasn't).
+    """
     # If we're asked to display parameters, make a best-effort attempt
     # to get a string value for the parameter. str types are returned as-is;
     # other types use repr(). If parameter display is disabled, or repr() has
     # raised, just formulate a value from the class and id.
-    value = None
     if display_value:
+        if max_length is None:
+            max_length = Env.current.max_value_length
         try:
             # Use issubclass(type()) instead of isinstance() to avoid side effects on lazy objects
-            value = val if issubclass(type(val), str) else repr(val)
+            if issubclass(type(val), str):
+                if max_length is None or len(val) <= max_length:
+                    return val, None
+                return val[:max_length] + TRUNCATION_MARKER % (len(val) - max_length), len(val)
+            if max_length is None:
+                return repr(val), None
+            return limited_repr(val, max_length)
         except Exception:  # pylint: disable=broad-except
             pass
 
-    if value is None:
-        class_name = fqname(type(val))
-        object_id = id(val)
-        value = "<%s object at %#02x>" % (class_name, object_id)
+    object_id = id(val)
+    return "<%s object at %#02x>" % (class_name(type(val)), object_id), None
+
 
-    return value
+def display_string(val, display_value=False, max_length=None):
+    """
+    Return the string that should be recorded as the value of val. If it's displayed, it's
+    truncated to (about) max_length characters, which defaults to APPMAP_MAX_VALUE_LENGTH.
+    """
+    return render_value(val, display_value=display_value, max_length=max_length)[0]
 
 
+@lru_cache(maxsize=4096)
 def _is_list_or_dict(val_type):
     # We cannot use isinstance here because it uses __class__
     # and val could be overloading it and calling it could cause side effects.
@@ -80,34 +100,62 @@ def _is_list_or_dict(val_type):
     return issubclass(val_type, list), issubclass(val_type, dict)
 
 
-def _describe_schema(name, val, depth, max_depth, display_value=False):
+# Limits on the schema inferred for a value. Lists are described by (at most) their first
+# max_items elements, and dicts are described to a depth of max_depth.
+SchemaLimits = namedtuple("SchemaLimits", "max_depth max_items")
+DEFAULT_SCHEMA_LIMITS = SchemaLimits(max_depth=5, max_items=10)
+
+
+# typed, so names that are equal but of different types (e.g. 1 and True) are kept apart.
+@lru_cache(maxsize=4096, typed=True)
+def _flat_property(name, val_type):
+    # The description of a property whose value is a scalar depends only on its name and the type of
+    # its value, so it can be shared by all the dicts that have it.
+    return {"name": name, "class": class_name(val_type)}
+
+
+def _items_schema(val, depth, limits):
+    elts = val if limits.max_items is None else islice(val, limits.max_items)
+    schema = []
+    for v in elts:
+        s = _describe_schema(None, v, depth + 1, True, limits)
+        # Lists are usually homogeneous, so only keep one copy of each element schema.
+        if s not in schema:
+            schema.append(s)
+    return schema
+
+
+def _properties_schema(val, depth, limits):
+    schema = []
+    for k, v in val.items():
+        v_type = type(v)
+        if any(_is_list_or_dict(v_type)):
+            return [_describe_schema(k, v, depth + 1, True, limits) for k, v in val.items()]
+        schema.append(_flat_property(k, v_type))
+    return schema
 
+
+def _describe_schema(name, val, depth, display_value, limits):
     val_type = type(val)
 
     ret = {}
     if name is not None:
         ret["name"] = name
-    ret["class"] = fqname(val_type)
+    ret["class"] = class_name(val_type)
 
     if not display_value:
         return ret
 
     islist, isdict = _is_list_or_dict(val_type)
-    if not (islist or isdict) or (depth >= max_depth and isdict):
-        return ret
-
     if islist:
-        elts = [(None, v) for v in val]
+        schema = _items_schema(val, depth, limits)
         schema_key = "items"
-    else:
-        assert isdict
-        elts = val.items()
+    elif isdict and depth < limits.max_depth:
+        schema = _properties_schema(val, depth, limits)
         schema_key = "properties"
+    else:
+        return ret
 
-    schema = [
-        _describe_schema(k, v, depth + 1, max_depth, display_value=display_value)
-        for k, v in elts
-    ]
     # schema will be [None] if depth is exceeded, don't use it
     if any(schema):
         ret[schema_key] = schema
@@ -115,19 +163,55 @@ def _describe_schema(name, val, depth, max_depth, display_value=False):
     return ret
 
 
-def describe_value(name, val, max_depth=5, display_value=False):
-    ret = _describe_schema(name, val, 0, max_depth, display_value=display_value)
+def describe_value(
+    name,
+    val,
+    max_depth=DEFAULT_SCHEMA_LIMITS.max_depth,
+    display_value=False,
+    max_items=DEFAULT_SCHEMA_LIMITS.max_items,
+):
+    val_type = type(val)
+    describer = describer_for(val_type)
+    if describer is not None:
+        ret = {} if name is None else {"name": name}
+        try:
+            ret.update(describer(val, display_value))
+        except Exception:  # pylint: disable=broad-except
+            # A broken describer mustn't break the app. Describe the value as though there were no
+            # describer for it.
+            logger.warning("describer for %s failed", class_name(val_type), exc_info=True)
+        else:
+            ret.setdefault("class", class_name(val_type))
+            ret["object_id"] = id(val)
+            return ret
+
+    limits = SchemaLimits(max_depth, max_items) if display_value else None
+    ret = _describe_schema(name, val, 0, display_value, limits)
+    value, length = render_value(val, display_value=display_value)
     ret.update({
         "object_id": id(val),
-        "value": display_string(val, display_value=display_value),
+        "value": value,
     })
+    if length is not None:
+        # The value was truncated, record how long it really was.
+        ret["value_length"] = length
 
-    if display_value and any(_is_list_or_dict(type(val))):
+    if display_value and any(_is_list_or_dict(val_type)):
         ret["size"] = len(val)
 
     return ret
 
 
+@lru_cache(maxsize=None)
+def public_slots(cls):
+    """Return the names of the public slots of cls, and its superclasses."""
+    return tuple(
+        k
+        for k in chain.from_iterable(getattr(c, "__slots__", []) for c in cls.__mro__)
+        if k[0] != "_"
+    )
+
+
 class Event:
     __slots__ = ["id", "event", "thread_id"]
 
@@ -139,9 +223,7 @@ class Event:
     def to_dict(self, attrs=None):
         ret = {}
         if attrs is None:
-            attrs = chain.from_iterable(
-                getattr(cls, "__slots__", []) for cls in type(self).__mro__
-            )
+            attrs = public_slots(type(self))
         for k in attrs:
             if k[0] == "_":  # skip internal attrs
                 continue
@@ -159,28 +241,247 @@ class Param:
     __slots__ = ["name", "kind", "default", "default_class"]
 
     def __init__(self, sigp):
-        self.name = sigp.name
         has_default = sigp.default is not Signature.empty
+        kind = None
         if sigp.kind in (Parameter.POSITIONAL_ONLY, Parameter.POSITIONAL_OR_KEYWORD):
-            self.kind = "opt" if has_default else "req"
+            kind = "opt" if has_default else "req"
         elif sigp.kind == Parameter.VAR_POSITIONAL:
-            self.kind = "rest"
+            kind = "rest"
         elif sigp.kind == Parameter.KEYWORD_ONLY:
-            self.kind = "key" if has_default else "keyreq"
+            kind = "key" if has_default else "keyreq"
         elif sigp.kind == Parameter.VAR_KEYWORD:
-            self.kind = "keyrest"
-        if has_default:
-            self.default = sigp.default
+            kind = "keyrest"
+        self._init(sigp.name, kind, sigp.default)
+
+    def _init(self, name, kind, default):
+        self.name = name
+        if kind is not None:
+            self.kind = kind
+        if default is not Signature.empty:
+            self.default = default
             self.default_class = fqname(type(self.default))
 
+    @classmethod
+    def of(cls, name, kind, default=Signature.empty):
+        """Make a Param from its name, kind, and default, rather than from a signature."""
+        ret = cls.__new__(cls)
+        ret._init(name, kind, default)  # pylint: disable=protected-access
+        return ret
+
     def __repr__(self):
         return "<Param name: %s kind: %s>" % (self.name, self.kind)
 
-    def to_dict(self, value, display_value=False):
+    def to_dict(self, value, display_value=False, schema=DEFAULT_SCHEMA_LIMITS):
         ret = {"kind": self.kind}
-        ret.update(describe_value(self.name, value, display_value=display_value))
+        ret.update(
+            describe_value(
+                self.name,
+                value,
+                display_value=display_value,
+                max_depth=schema.max_depth,
+                max_items=schema.max_items,
+            )
+        )
         return ret
 
+
+# The locals instrumentation adds to a function, e.g. the one rewrite adds to hold the call in
+# progress. They're never reported as parameters.
+INSTRUMENTATION_LOCALS = frozenset(["__appmap_call__"])
+
+
+class ParamBinder:
+    """
+    Turns the arguments of a call into a list of parameter descriptions.
+
+    The binding is done by a function generated from the kinds of the parameters, so each call
+    just indexes into args and kwargs, rather than examining each Param.
+    """
+
+    __slots__ = ["params", "bind", "shape"]
+
+    def __init__(self, params, cacheable=False):
+        self.params = params
+        self.bind = _compile_binder(params)
+        # The (name, kind) of each parameter, if the params can be made again from them (by
+        # params_from_shape).
+        self.shape = tuple((p.name, p.kind) for p in params) if cacheable else None
+
+    def __repr__(self):
+        return "<ParamBinder %r>" % self.params
+
+    def bind_locals(self, frame_locals, display_value, schema):
+        """
+        Describe the parameters, taking their values from frame_locals, the locals of the function's
+        frame when it starts.
+        """
+        return [
+            p.to_dict(
+                frame_locals.get(p.name) if p.name not in INSTRUMENTATION_LOCALS else None,
+                display_value=display_value,
+                schema=schema,
+            )
+            for p in self.params
+        ]
+
+
+class LazyParamBinder:
+    """
+    A ParamBinder for a function that isn't made until it's first used, i.e. until a call to the
+    function is recorded. Most of the functions instrumented in an app are never called while it's
+    being recorded, so there's no need to inspect their signatures, and generate their binders,
+    when they're instrumented.
+    """
+
+    __slots__ = ["_filterable", "_shape", "_binder"]
+
+    def __init__(self, filterable, shape=None):
+        self._filterable = filterable
+        self._shape = shape
+        self._binder = None
+
+    def __repr__(self):
+        return "<LazyParamBinder %r>" % (self._binder or self._filterable.fqname)
+
+    def _get(self):
+        binder = self._binder
+        if binder is None:
+            binder = self._binder = CallEvent.make_params(self._filterable, self._shape)
+            self._filterable = None
+        return binder
+
+    @property
+    def shape(self):
+        """The shape of the params, if it's known yet."""
+        binder = self._binder
+        return binder.shape if binder is not None else self._shape
+
+    @property
+    def params(self):
+        return self._get().params
+
+    def bind(
+        self, instance, args, kwargs, display_value, schema
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        return self._get().bind(instance, args, kwargs, display_value, schema)
+
+    def bind_locals(self, frame_locals, display_value, schema):
+        return self._get().bind_locals(frame_locals, display_value, schema)
+
+
+# The compiled code of the binders that have been generated, by the (name, kind) of each of their
+# parameters. The code only depends on those, so functions with the same parameters share it.
+_binder_codes = {}
+
+
+def _compile_binder(params):
+    shape = tuple((p.name, p.kind) for p in params)
+    code = _binder_codes.get(shape)
+    if code is None:
+        code = _binder_codes[shape] = compile(_binder_source(params), "<appmap binder>", "exec")
+    namespace = {f"p{i}": p for i, p in enumerate(params)}
+    exec(code, namespace)  # pylint: disable=exec-used
+    return namespace["bind"]
+
+
+def _binder_source(params):
+    # HACK: this is to detect cases when this is a method, yet the self
+    # parameter is None. Unfortunately wrapt tries to be too smart
+    # by separating the instance argument, and as a consequence
+    # we can't differentiate here between a function and a method
+    # bound to None. Thus we rely on 'self' being the conventional
+    # name for the self argument. This is usually correct but
+    # theoretically could be wrong with code that's off-style.
+    takes_self = params and params[0].name == "self"
+
+    lines = ["def bind(instance, args, kwargs, display_value, schema):"]
+    if takes_self:
+        lines.append("    args = (instance, *args)")
+    else:
+        lines.append("    if instance is not None:")
+        lines.append("        args = (instance, *args)")
+    lines.append("    nargs = len(args)")
+    lines.append("    ret = []")
+
+    # Positional arguments fill the positional parameters, in order. Any positional parameter not
+    # filled that way may have been passed by keyword.
+    pos = 0
+    for i, p in enumerate(params):
+        name = repr(p.name)
+        append = f"ret.append(p{i}.to_dict(%s, display_value=display_value, schema=schema))"
+        if p.kind == "req":
+            lines.append(f"    if nargs > {pos}:")
+            lines.append("        " + append % f"args[{pos}]")
+            lines.append(f"    elif {name} in kwargs:")
+            lines.append("        " + append % f"kwargs[{name}]")
+            pos += 1
+        elif p.kind == "opt":
+            value = f"args[{pos}] if nargs > {pos} else kwargs.get({name}, p{i}.default)"
+            lines.append("    " + append % f"({value})")
+            pos += 1
+        elif p.kind == "keyreq":
+            lines.append(f"    if {name} in kwargs:")
+            lines.append("        " + append % f"kwargs[{name}]")
+        elif p.kind == "key":
+            lines.append("    " + append % f"kwargs.get({name}, p{i}.default)")
+        elif p.kind == "rest":
+            lines.append("    " + append % f"tuple(args[{pos}:])")
+        elif p.kind == "keyrest":
+            lines.append("    " + append % "kwargs")
+        else:
+            # If all the parameter types are handled, this
+            # shouldn't ever happen...
+            raise RuntimeError("Unknown parameter with desc %s" % (repr(p)))
+    lines.append("    return ret")
+    return "\n".join(lines)
+
+
+def _is_plain_function(fn):
+    """
+    Return True if fn's signature comes straight from its code, its __defaults__, and its
+    __kwdefaults__, i.e. it isn't wrapped, and doesn't have an explicit signature.
+    """
+    return (
+        type(fn) is FunctionType  # pylint: disable=unidiomatic-typecheck
+        and not hasattr(fn, "__wrapped__")
+        and getattr(fn, "__signature__", None) is None
+    )
+
+
+def params_from_shape(fn, shape):
+    """
+    Make the Params of the plain function fn from shape, the (name, kind) of each of its parameters,
+    as saved from ParamBinder.shape. The defaults are taken from fn. Returns None if fn isn't a
+    plain function, or shape doesn't fit it.
+    """
+    if not _is_plain_function(fn):
+        return None
+
+    code = fn.__code__
+    names = code.co_varnames[: code.co_argcount + code.co_kwonlyargcount]
+    if tuple(n for n, k in shape if k not in ("rest", "keyrest")) != names:
+        return None
+
+    defaults = fn.__defaults__ or ()
+    kwdefaults = fn.__kwdefaults__ or {}
+    if sum(1 for _, k in shape if k == "opt") != len(defaults):
+        return None
+
+    ret = []
+    next_default = 0
+    for name, kind in shape:
+        if kind == "opt":
+            ret.append(Param.of(name, kind, defaults[next_default]))
+            next_default += 1
+        elif kind == "key":
+            if name not in kwdefaults:
+                return None
+            ret.append(Param.of(name, kind, kwdefaults[name]))
+        else:
+            ret.append(Param.of(name, kind))
+    return ret
+
+
 def _get_name_parts(filterable):
     """
     Return the module name and qualname for filterable.obj.
@@ -207,9 +508,72 @@ def _get_name_parts(filterable):
             qualname = getattr(fn.__class__, "__name__", "unknown")
     return modname, qualname
 
+
+class FunctionInfo:
+    """
+    The static description of an instrumented function. It's created once, when the function is
+    instrumented, and shared by all the CallEvents for the function. The parts that require
+    introspection are only computed the first time they're needed.
+    """
+
+    def __init__(self, filterable, labels):
+        self._fn = filterable.obj
+        modname, qualname = _get_name_parts(filterable)
+        self._fqfn = FqFnName(modname, qualname)
+
+        fntype = filterable.fntype
+        self.fntype = fntype
+        self.static = fntype in FnType.STATIC | FnType.CLASS | FnType.MODULE
+        self.has_receiver = fntype in FnType.CLASS | FnType.INSTANCE
+        self.labels = labels
+        self.auxtype = None
+        if fntype & FnType.GET:
+            self.auxtype = "get"
+        elif fntype & FnType.SET:
+            self.auxtype = "set"
+        elif fntype & FnType.DEL:
+            self.auxtype = "del"
+
+    @cached_property
+    def function_name(self):
+        return self._fqfn.fqfn
+
+    @cached_property
+    def defined_class(self):
+        return self._fqfn.fqclass
+
+    @cached_property
+    def method_id(self):
+        ret = self._fqfn.fqfn[1]
+        if self.auxtype is not None:
+            ret = f"{ret} ({self.auxtype})"
+        return ret
+
+    @cached_property
+    def function_location(self):
+        return get_function_location(self._fn)
+
+    @property
+    def path(self):
+        return self.function_location[0]
+
+    @property
+    def lineno(self):
+        return self.function_location[1]
+
+    @cached_property
+    def comment(self):
+        comment = inspect.getdoc(self._fn)
+        if comment is None:
+            comment = inspect.getcomments(self._fn)
+        return comment
+
+    def __repr__(self):
+        return "<FunctionInfo %s.%s>" % self.function_name
+
+
 class CallEvent(Event):
-    # pylint: disable=method-cache-max-size-none
-    __slots__ = ["_fn", "_fqfn", "static", "receiver", "parameters", "labels", "auxtype"]
+    __slots__ = ["_fninfo", "receiver", "parameters"]
 
     @staticmethod
     def make(filterable):
@@ -224,21 +588,27 @@ class CallEvent(Event):
         if labels:
             del fn._appmap_labels
 
-        return partial(CallEvent, filterable, labels=labels)
+        return partial(CallEvent, FunctionInfo(filterable, labels))
 
     @staticmethod
-    def make_params(filterable):
+    def make_params(filterable, shape=None):
+        """
+        Make the ParamBinder for the function filterable.obj. If shape, the shape of its params
+        saved from an earlier ParamBinder, is given, it's used instead of inspecting the function's
+        signature, if it can be.
+        """
+        fn = filterable.obj
+        sig_fn = fn if filterable.fntype != FnType.CLASS else filterable.static_fn.__func__
+        if shape is not None:
+            params = params_from_shape(sig_fn, shape)
+            if params is not None:
+                return ParamBinder(params, cacheable=True)
+
         try:
-            fn = filterable.obj
-            if filterable.fntype != FnType.CLASS:
-                sig = inspect.signature(fn, follow_wrapped=True)
-            else:
-                sig = inspect.signature(
-                    filterable.static_fn.__func__, follow_wrapped=True
-                )
+            sig = inspect.signature(sig_fn, follow_wrapped=True)
         except ValueError:
             # Can't get signatures built-ins
-            return []
+            return ParamBinder([])
 
         if logger.isEnabledFor(logging.DEBUG):
             # inspect.signature is relatively expensive, and signature
@@ -250,136 +620,85 @@ class CallEvent(Event):
                 logger.debug("sig: %r", sig)
                 logger.debug("wrapped_sig: %r", wrapped_sig)
 
-        return [Param(p) for p in sig.parameters.values()]
+        return ParamBinder(
+            [Param(p) for p in sig.parameters.values()], cacheable=_is_plain_function(sig_fn)
+        )
 
     @staticmethod
-    def set_params(params, instance, args, kwargs, display_value=False):
-        # pylint: disable=too-many-branches
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def set_params(
+        params, instance, args, kwargs, display_value=False, schema=DEFAULT_SCHEMA_LIMITS
+    ):
         # Note that set_params expects args and kwargs as a tuple and
         # dict, respectively. It operates on them as collections, so
         # it doesn't unpack them.
-        ret = []
-
-        # HACK: this is to detect cases when this is a method, yet the self
-        # parameter is None. Unfortunately wrapt tries to be too smart
-        # by separating the instance argument, and as a consequence
-        # we can't differentiate here between a function and a method
-        # bound to None. Thus we rely on 'self' being the conventional
-        # name for the self argument. This is usually correct but
-        # theoretically could be wrong with code that's off-style.
-        takes_self = params and params[0].name == "self"
-
-        if instance is not None or takes_self:
-            args = [instance, *args]
-        else:
-            # we're popping the front repeatedly, lists are better at this
-            args = list(args)
-
-        for p in params:
-            if p.kind == "req":
-                # A 'req' argument can be either keyword or
-                # positional.
-                if p.name in kwargs:
-                    value = kwargs[p.name]
-                else:
-                    if args:
-                        value = args.pop(0)
-                    else:
-                        continue  # required argument missing
-            elif p.kind == "keyreq":
-                if p.name in kwargs:
-                    value = kwargs[p.name]
-                else:
-                    continue  # required argument missing
-            elif p.kind in ("opt", "key"):
-                value = kwargs.get(p.name, p.default)
-            elif p.kind == "rest":
-                value = tuple(args)
-            elif p.kind == "keyrest":
-                value = kwargs
-            else:
-                # If all the parameter types are handled, this
-                # shouldn't ever happen...
-                raise RuntimeError("Unknown parameter with desc %s" % (repr(p)))
-            ret.append(p.to_dict(value, display_value=display_value))
-        return ret
+        return params.bind(instance, args, kwargs, display_value, schema)
+
+    @property
+    def fninfo(self):
+        return self._fninfo
 
     @property
-    @lru_cache(maxsize=None)
     def function_name(self):
-        return self._fqfn.fqfn
+        return self._fninfo.function_name
 
     @property
-    @lru_cache(maxsize=None)
     def defined_class(self):
-        return self._fqfn.fqclass
+        return self._fninfo.defined_class
 
     @property
-    @lru_cache(maxsize=None)
     def method_id(self):
-        ret = self._fqfn.fqfn[1]
-        if self.auxtype is not None:
-            ret = f"{ret} ({self.auxtype})"
-        return ret
-
-    @property
-    @lru_cache(maxsize=None)
-    def function_location(self):
-        return get_function_location(self._fn)
+        return self._fninfo.method_id
 
     @property
-    @lru_cache(maxsize=None)
     def path(self):
-        return self.function_location[0]
+        return self._fninfo.path
 
     @property
-    @lru_cache(maxsize=None)
     def lineno(self):
-        return self.function_location[1]
+        return self._fninfo.lineno
 
     @property
-    @lru_cache(maxsize=None)
     def comment(self):
-        comment = inspect.getdoc(self._fn)
-        if comment is None:
-            comment = inspect.getcomments(self._fn)
-        return comment
+        return self._fninfo.comment
 
-    def __init__(self, filterable, parameters, labels):
-        super().__init__("call")
-        fn = filterable.obj
-        self._fn = fn
-        modname, qualname = _get_name_parts(filterable)
-        self._fqfn = FqFnName(modname, qualname)
+    @property
+    def static(self):
+        return self._fninfo.static
 
-        fntype = filterable.fntype
-        self.static = fntype in FnType.STATIC | FnType.CLASS | FnType.MODULE
+    @property
+    def labels(self):
+        return self._fninfo.labels
+
+    @property
+    def auxtype(self):
+        return self._fninfo.auxtype
+
+    def __init__(self, fninfo, parameters):
+        super().__init__("call")
+        self._fninfo = fninfo
         self.receiver = None
-        if fntype in FnType.CLASS | FnType.INSTANCE:
+        if fninfo.has_receiver:
             self.receiver = parameters[0]
             parameters = parameters[1:]
         self.parameters = parameters
-        self.labels = labels
-        self.auxtype = None
-        if fntype & FnType.GET:
-            self.auxtype = "get"
-        elif fntype & FnType.SET:
-            self.auxtype = "set"
-        elif fntype & FnType.DEL:
-            self.auxtype = "del"
 
     def to_dict(self, attrs=None):
-        ret = super().to_dict()  # get the attrs defined in __slots__
-        if "labels" in ret:
-            del ret["labels"]  # labels should only appear in the classmap
-
-        # update with the computed properties
-        ret.update(
-            super().to_dict(attrs=["defined_class", "method_id", "path", "lineno"])
+        # labels should only appear in the classmap
+        return super().to_dict(
+            attrs=[
+                "static",
+                "receiver",
+                "parameters",
+                "auxtype",
+                *Event.__slots__,
+                "defined_class",
+                "method_id",
+                "path",
+                "lineno",
+            ]
         )
 
-        return ret
-
 
 class SqlEvent(Event):  # pylint: disable=too-few-public-methods
     __slots__ = ["sql_query"]
@@ -504,13 +823,22 @@ class ReturnEvent(Event):
 class FuncReturnEvent(ReturnEvent):
     __slots__ = ["return_value"]
 
-    def __init__(self, parent_id, elapsed, return_value, display_value=False):
+    # pylint: disable-next=too-many-arguments,too-many-positional-arguments
+    def __init__(
+        self, parent_id, elapsed, return_value, display_value=False, schema=DEFAULT_SCHEMA_LIMITS
+    ):
         super().__init__(parent_id, elapsed)
         # Import here to prevent circular dependency
         # pylint: disable=import-outside-toplevel
         from _appmap.instrument import recording_disabled # noqa: F401
         with recording_disabled():
-            self.return_value = describe_value(None, return_value, display_value=display_value)
+            self.return_value = describe_value(
+                None,
+                return_value,
+                display_value=display_value,
+                max_depth=schema.max_depth,
+                max_items=schema.max_items,
+            )
 
 
 class HttpResponseEvent(ReturnEvent):
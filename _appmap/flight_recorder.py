@@ -0,0 +1,181 @@
+"""
+A flight recorder for process recording.
+
+When APPMAP_FLIGHT_RECORDER_EVENTS and/or APPMAP_FLIGHT_RECORDER_SECONDS are set, a process
+recording only keeps the most recent events, in a ring. The ring is written as an AppMap when the
+process receives SIGUSR1, when an exception goes uncaught, when appmap.dump_flight_recording() is
+called, and when the process exits.
+"""
+
+import signal
+import sys
+import threading
+import time
+from collections import deque
+
+from .env import Env
+from .recorder import Recorder, SharedRecorder
+
+logger = Env.current.getLogger(__name__)
+
+# pylint: disable=global-statement
+_writer = None
+_writer_lock = threading.Lock()
+# Whether the hooks that dump the ring have been installed. They're only ever installed once, so
+# they don't get chained to themselves when the flight recorder is started again.
+_hooks_installed = False
+
+
+def _fields(e):
+    """
+    Return the kind, id, and parent id of the event e. e may also be the dict an event was
+    serialized to (e.g. by a ColumnarEvents or a SpilledEvents).
+    """
+    if type(e) is dict:  # pylint: disable=unidiomatic-typecheck
+        return e["event"], e["id"], e.get("parent_id")
+    return e.event, e.id, getattr(e, "parent_id", None)
+
+
+class RingEvents:
+    """
+    A replacement for the list of events held by a Recorder, that holds only the last max_events
+    events, and/or those added in the last max_seconds seconds.
+
+    Iterating over a RingEvents only produces returns whose calls are still in the ring, so the
+    calls and returns in a recording made from it stay consistent.
+    """
+
+    def __init__(self, max_events=None, max_seconds=None):
+        self._ring = deque(maxlen=max_events)
+        self._max_seconds = max_seconds
+
+    def append(self, event):
+        now = time.monotonic()
+        ring = self._ring
+        ring.append((now, event))
+        if self._max_seconds is not None:
+            cutoff = now - self._max_seconds
+            while ring[0][0] < cutoff:
+                ring.popleft()
+
+    def extend(self, events):
+        for e in events:
+            self.append(e)
+
+    def __iadd__(self, events):
+        self.extend(events)
+        return self
+
+    def __len__(self):
+        return len(self._ring)
+
+    def __bool__(self):
+        return len(self._ring) > 0
+
+    def __iter__(self):
+        return iter(self.snapshot())
+
+    def snapshot(self):
+        """
+        Return a list of the events in the ring, dropping returns whose calls have been dropped.
+        """
+        events = [e for _, e in list(self._ring)]
+        fields = [_fields(e) for e in events]
+        calls = {event_id for kind, event_id, _ in fields if kind == "call"}
+        return [
+            e
+            for e, (kind, _, parent_id) in zip(events, fields)
+            if kind != "return" or parent_id in calls
+        ]
+
+    def __repr__(self):
+        return f"<RingEvents count: {len(self._ring)}>"
+
+
+def ring_from_env():
+    """Return a new RingEvents if the flight recorder has been configured, None otherwise."""
+    env = Env.current
+    max_events = env.get("APPMAP_FLIGHT_RECORDER_EVENTS")
+    max_seconds = env.get("APPMAP_FLIGHT_RECORDER_SECONDS")
+    if max_events is None and max_seconds is None:
+        return None
+
+    return RingEvents(
+        max_events=int(max_events) if max_events is not None else None,
+        max_seconds=float(max_seconds) if max_seconds is not None else None,
+    )
+
+
+def dump(reason="api"):
+    """
+    Write the events currently in the flight recorder's ring as an AppMap. Returns the path to the
+    file written, or None if the flight recorder isn't running or is already writing a dump.
+    """
+    if _writer is None:
+        return None
+
+    events = Recorder.get_global().events
+    if not isinstance(events, RingEvents):
+        return None
+
+    with SharedRecorder._lock:  # pylint: disable=protected-access
+        snapshot = events.snapshot()
+
+    # Only one dump can be written at a time. dump is called from a signal handler and the
+    # excepthooks, which can interrupt a dump in the same thread, so waiting for the lock could
+    # deadlock. Skip this dump instead: the one in progress has (nearly) the same events.
+    if not _writer_lock.acquire(blocking=False):  # pylint: disable=consider-using-with
+        logger.info("flight recorder already dumping, skipping dump (%s)", reason)
+        return None
+    try:
+        logger.info("flight recorder dumping %d events (%s)", len(snapshot), reason)
+        return _writer(snapshot, reason)
+    finally:
+        _writer_lock.release()
+
+
+def _on_signal(previous):
+    def handler(signum, frame):
+        dump("signal")
+        if callable(previous):
+            previous(signum, frame)
+
+    return handler
+
+
+def _on_exception(previous):
+    def hook(*args):
+        dump("exception")
+        previous(*args)
+
+    return hook
+
+
+def install(writer):
+    """
+    Start dumping the ring when a signal arrives or an exception goes uncaught. writer will be
+    called with the list of events to write and the reason they're being written.
+    """
+    global _writer, _hooks_installed
+    _writer = writer
+    if _hooks_installed:
+        # The hooks already installed dump with the new writer.
+        return
+    _hooks_installed = True
+
+    sys.excepthook = _on_exception(sys.excepthook)
+    threading.excepthook = _on_exception(threading.excepthook)
+
+    sigusr1 = getattr(signal, "SIGUSR1", None)
+    if sigusr1 is None:
+        return
+    try:
+        signal.signal(sigusr1, _on_signal(signal.getsignal(sigusr1)))
+    except ValueError:
+        # Signal handlers can only be installed from the main thread.
+        logger.warning("flight recorder can't handle SIGUSR1, not on the main thread")
+
+
+def initialize():
+    global _writer
+    _writer = None
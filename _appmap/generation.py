@@ -1,9 +1,15 @@
 """Generate an AppMap"""
+import io
 import json
 
-from .event import Event
+from .env import Env
+from .event import CallEvent, Event, public_slots
 from .metadata import Metadata
 
+logger = Env.current.getLogger(__name__)
+
+APPMAP_VERSION = "1.9"
+
 
 # ClassMapDict needs to quack a little like a dict. If it's actually a
 # subclass of dict, though, json tries to process it without calling
@@ -18,6 +24,15 @@ class ClassMapDict:
     def values(self):
         return self._dict.values()
 
+    def update(self, other):
+        """Merge the entries of the ClassMapDict other into this one."""
+        for entry in other.values():
+            if isinstance(entry, FuncEntry):
+                self.setdefault(entry.location, entry)
+            else:
+                mine = self.setdefault(entry.name, type(entry)(entry.name))
+                mine.children.update(entry.children)
+
 
 class ClassMapEntry:  # pylint: disable=too-few-public-methods
     # pylint: disable=redefined-builtin
@@ -53,63 +68,178 @@ class FuncEntry(ClassMapEntry):  # pylint: disable=too-few-public-methods
         self.comment = e.comment
 
 
-def classmap(recording):
-    ret = ClassMapDict()
-    for e in recording.events:
-        try:
-            if e.event != "call":
-                continue
-
-            packages, *classes = e.defined_class.rsplit(".", 1)
-            # If there's only a single component in the name
-            # (e.g. it's a module name), use it as a class.
-            if len(classes) == 0:
-                class_ = packages
-                packages = []
-            else:
-                class_ = classes[0]
-                packages = packages.split(".")
+class _SerializedEvent:  # pylint: disable=too-few-public-methods
+    """The dict an event was serialized to, with its keys as attributes."""
+
+    def __init__(self, d):
+        self._d = d
+
+    def __getattr__(self, name):
+        return self._d.get(name)
+
 
-            children = ret
-            for p in packages:
-                entry = children.setdefault(p, PackageEntry(p))
-                children = entry.children
+def add_to_classmap(ret, e):
+    """Add the function called by the event e to the ClassMapDict ret."""
+    if type(e) is dict:  # pylint: disable=unidiomatic-typecheck
+        # e.g. an event produced by a ColumnarEvents or a SpilledEvents.
+        e = _SerializedEvent(e)
+    try:
+        if e.event != "call":
+            return
 
-            entry = children.setdefault(class_, ClassEntry(class_))
+        packages, *classes = e.defined_class.rsplit(".", 1)
+        # If there's only a single component in the name
+        # (e.g. it's a module name), use it as a class.
+        if len(classes) == 0:
+            class_ = packages
+            packages = []
+        else:
+            class_ = classes[0]
+            packages = packages.split(".")
+
+        children = ret
+        for p in packages:
+            entry = children.setdefault(p, PackageEntry(p))
             children = entry.children
 
-            loc = "%s:%s" % (e.path, e.lineno)
-            children.setdefault(loc, FuncEntry(e))
-        except AttributeError:
-            # Event might not have a defined_class attribute;
-            # SQL events for example are calls without it.
-            # Ignore them when building the class map.
-            continue
+        entry = children.setdefault(class_, ClassEntry(class_))
+        children = entry.children
+
+        loc = "%s:%s" % (e.path, e.lineno)
+        children.setdefault(loc, FuncEntry(e))
+    except AttributeError:
+        # Event might not have a defined_class attribute;
+        # SQL events for example are calls without it.
+        # Ignore them when building the class map.
+        pass
+
+
+class ClassMap(ClassMapDict):
+    """
+    The root of a classmap that's built incrementally, as events are recorded. A function is only
+    added the first time it's called, so adding an event for a function that's already in the
+    classmap costs no more than a set lookup.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._functions = set()
+
+    def add(self, e):
+        if e.event != "call":
+            return
+
+        fninfo = getattr(e, "fninfo", None)
+        if fninfo is not None:
+            if fninfo in self._functions:
+                return
+            self._functions.add(fninfo)
+        add_to_classmap(self, e)
+
+    def update(self, other):
+        super().update(other)
+        self._functions.update(getattr(other, "_functions", ()))
+
+
+class EventList(list):
+    """
+    The list of events held by a Recorder. It keeps a classmap of the functions called by its events
+    up to date as they're appended, so the classmap doesn't need to be built from all the events
+    when an AppMap is generated.
+
+    Only append, extend, and += update the classmap.
+    """
+
+    __slots__ = ["classmap"]
+
+    def __init__(self, events=()):
+        super().__init__()
+        self.classmap = ClassMap()
+        self.extend(events)
+
+    def append(self, e):
+        super().append(e)
+        self.classmap.add(e)
+
+    def extend(self, events):
+        classmap_ = getattr(events, "classmap", None)
+        if classmap_ is None:
+            for e in events:
+                self.append(e)
+            return
+
+        # The store keeps a classmap of its own, so merge that, rather than adding each event. Some
+        # stores (e.g. ColumnarEvents) produce dicts for their events, which can't be added.
+        super().extend(events)
+        self.classmap.update(classmap_)
+
+    def __iadd__(self, events):
+        self.extend(events)
+        return self
+
+
+def classmap(recording):
+    events = recording.events
+    # Event stores (including EventList) that maintain their own classmap already have one.
+    ret = getattr(events, "classmap", None)
+    if ret is not None:
+        return ret
+
+    ret = ClassMapDict()
+    for e in events:
+        add_to_classmap(ret, e)
 
     return ret
 
 
-def appmap(recording, metadata):
+def _metadata(metadata):
     appmap_metadata = Metadata()
     if metadata:
         appmap_metadata.update(metadata)
+    return appmap_metadata
+
+
+def appmap(recording, metadata):
+    events = recording.events
+    if not isinstance(events, list):
+        # Event stores (e.g. ColumnarEvents) produce their events when they're iterated.
+        events = list(events)
 
     return {
-        "version": "1.9",
-        "metadata": appmap_metadata,
-        "events": recording.events,
+        "version": APPMAP_VERSION,
+        "metadata": _metadata(metadata),
+        "events": events,
         "classMap": list(classmap(recording).values()),
     }
 
 
+def _to_native(o):
+    """
+    Return a representation of o that a JSON encoder can handle natively, or raise TypeError if
+    there isn't one.
+    """
+    if isinstance(o, Event):
+        return o.to_dict()
+    if isinstance(o, ClassMapDict):
+        return list(o.values())
+    if isinstance(o, ClassMapEntry):
+        return o.to_dict()
+    raise TypeError(f"Object of type {type(o).__name__} is not JSON serializable")
+
+
+def _default(o):
+    try:
+        return _to_native(o)
+    except TypeError:
+        return str(o)
+
+
 class AppMapEncoder(json.JSONEncoder):
     def default(self, o):
-        if isinstance(o, Event):
-            return o.to_dict()
-        if isinstance(o, ClassMapDict):
-            return list(o.values())
-        if isinstance(o, ClassMapEntry):
-            return o.to_dict()
+        try:
+            return _to_native(o)
+        except TypeError:
+            pass
 
         try:
             return json.JSONEncoder.default(self, o)
@@ -117,6 +247,202 @@ class AppMapEncoder(json.JSONEncoder):
             return str(o)
 
 
+def _orjson_encoder(fallback):
+    import orjson  # pylint: disable=import-outside-toplevel
+
+    dumps = orjson.dumps
+    option = orjson.OPT_NON_STR_KEYS
+
+    def encode(o):
+        try:
+            return dumps(o, default=_default, option=option).decode("utf-8")
+        except orjson.JSONEncodeError:
+            # e.g. an int that's too big, or nesting that's too deep.
+            return fallback(o)
+
+    return encode
+
+
+def _msgspec_encoder(fallback):
+    import msgspec  # pylint: disable=import-outside-toplevel
+
+    encoder = msgspec.json.Encoder(enc_hook=_default)
+
+    def encode(o):
+        try:
+            return encoder.encode(o).decode("utf-8")
+        except (TypeError, ValueError, OverflowError):
+            return fallback(o)
+
+    return encode
+
+
+_JSON_BACKENDS = {
+    "orjson": _orjson_encoder,
+    "msgspec": _msgspec_encoder,
+}
+
+
+def json_encoder():
+    """
+    Return a function that encodes a value as JSON.
+
+    APPMAP_JSON_BACKEND chooses the encoder: "orjson", "msgspec", or "json" (the standard library's
+    encoder). By default, orjson or msgspec is used if it can be imported, otherwise json. If a
+    value can't be encoded by orjson or msgspec, it's encoded by json instead.
+    """
+    fallback = AppMapEncoder().encode
+    backend = Env.current.get("APPMAP_JSON_BACKEND", "auto").lower()
+    if backend == "json":
+        return fallback
+
+    if backend == "auto":
+        candidates = list(_JSON_BACKENDS)
+    elif backend in _JSON_BACKENDS:
+        candidates = [backend]
+    else:
+        logger.warning("Unknown APPMAP_JSON_BACKEND %r, using json", backend)
+        return fallback
+
+    for name in candidates:
+        try:
+            return _JSON_BACKENDS[name](fallback)
+        except ImportError:
+            if backend != "auto":
+                logger.warning("APPMAP_JSON_BACKEND is %r, but it can't be imported", name)
+    return fallback
+
+
+class EventSerializer:
+    """
+    Turns events into the dicts that get serialized to JSON, producing the same output
+    json.dumps(cls=AppMapEncoder) would.
+
+    The way to convert each class of event is worked out the first time an event of that class is
+    seen. For call events, by far the most common, the attributes that come from the function called
+    are only collected once per function.
+
+    A batch of events is encoded with a single call to the encoder, because each call has a fixed
+    cost that would otherwise be paid for each event.
+    """
+
+    def __init__(self, encode=None):
+        self._encode = encode or json_encoder()
+        self._converters = {}
+        self._function_attrs = {}
+
+    def to_dicts(self, events):
+        """Return the dicts for events."""
+        converters = self._converters
+        dicts = []
+        for e in events:
+            converter = converters.get(type(e))
+            if converter is None:
+                converter = converters[type(e)] = self._converter_for(type(e))
+            dicts.append(converter(e))
+        return dicts
+
+    def encode(self, events):
+        """
+        Return the JSON for events, as the members of an array (without the enclosing brackets).
+        """
+        return self._encode(self.to_dicts(events))[1:-1]
+
+    def _converter_for(self, cls):
+        if cls is CallEvent:
+            return self._convert_call
+
+        if not issubclass(cls, Event):
+            # e.g. the dicts produced by ColumnarEvents, which the encoder handles.
+            return lambda e: e
+
+        if cls.to_dict is not Event.to_dict:
+            return cls.to_dict
+
+        attrs = public_slots(cls)
+
+        def convert(e):
+            ret = {}
+            for k in attrs:
+                v = getattr(e, k, None)
+                if v is not None:
+                    ret[k] = v
+            return ret
+
+        return convert
+
+    def _convert_call(self, e):
+        # This must produce the attributes in the same order as CallEvent.to_dict.
+        fninfo = e.fninfo
+        ret = {"static": fninfo.static}
+        if e.receiver is not None:
+            ret["receiver"] = e.receiver
+        ret["parameters"] = e.parameters
+        if fninfo.auxtype is not None:
+            ret["auxtype"] = fninfo.auxtype
+        ret["id"] = e.id
+        ret["event"] = "call"
+        ret["thread_id"] = e.thread_id
+
+        function_attrs = self._function_attrs.get(fninfo)
+        if function_attrs is None:
+            function_attrs = {
+                "defined_class": fninfo.defined_class,
+                "method_id": fninfo.method_id,
+                "path": fninfo.path,
+                "lineno": fninfo.lineno,
+            }
+            function_attrs = {k: v for k, v in function_attrs.items() if v is not None}
+            self._function_attrs[fninfo] = function_attrs
+        ret.update(function_attrs)
+        return ret
+
+
+# The number of events that are serialized, and written, at a time.
+_WRITE_BATCH_SIZE = 1000
+
+
 def dump(recording, metadata=None, indent=None):
+    if indent is None:
+        f = io.StringIO()
+        write(recording, f, metadata)
+        return f.getvalue()
+
     a = appmap(recording, metadata)
     return json.dumps(a, cls=AppMapEncoder, indent=indent)
+
+
+def write(recording, f, metadata=None):
+    """
+    Write the AppMap for recording to the file f, as the events are serialized, rather than
+    producing the whole document first.
+
+    If the recording's events have been spilled to disk, they're copied to f, rather than being read
+    back into memory. When APPMAP_JSON_BACKEND is "json", the output is the same as
+    json.dumps(appmap(recording, metadata), cls=AppMapEncoder) would produce. The other backends
+    produce the same JSON, formatted more compactly.
+    """
+    events = recording.events
+    if hasattr(events, "flush"):
+        events.flush()
+
+    encode = json_encoder()
+    f.write('{"version": %s, "metadata": %s, "events": [' % (
+        encode(APPMAP_VERSION), encode(_metadata(metadata))
+    ))
+    if hasattr(events, "write_events"):
+        events.write_events(f)
+    else:
+        serializer = EventSerializer(encode)
+        separator = ""
+        batch = []
+        for e in events:
+            batch.append(e)
+            if len(batch) >= _WRITE_BATCH_SIZE:
+                f.write(separator + serializer.encode(batch))
+                batch = []
+                separator = ", "
+        if batch:
+            f.write(separator + serializer.encode(batch))
+    classmap_entries = list(classmap(recording).values())
+    f.write('], "classMap": %s}' % encode(classmap_entries))
@@ -1,4 +1,6 @@
 import functools
+import importlib.abc
+import importlib.machinery
 import inspect
 import sys
 import types
@@ -9,6 +11,7 @@ from functools import reduce
 
 from _appmap import wrapt
 
+from . import instrument, plan_cache, rewrite
 from .env import Env
 from .utils import FnType, Scope
 
@@ -72,6 +75,13 @@ class Filter(ABC):  # pylint: disable=too-few-public-methods
         not be, or call the next filter if this filter can't decide.
         """
 
+    def could_match(self, modname):  # pylint: disable=unused-argument
+        """
+        Return False if the filter chain can't match anything in the module modname, so there's no
+        need to look at its members. Filters that can't tell should return True.
+        """
+        return True
+
 
 class NullFilter(Filter):  # pylint: disable=too-few-public-methods
     def __init__(self, next_filter=None):
@@ -80,6 +90,9 @@ class NullFilter(Filter):  # pylint: disable=too-few-public-methods
     def filter(self, filterable):
         return False
 
+    def could_match(self, modname):
+        return False
+
 
 def is_class(c):
     # We don't want to use inspect.isclass here. It uses isinstance to
@@ -159,6 +172,8 @@ def get_members(cls):
 class Importer:
     filter_stack = [NullFilter]
     filter_chain = None
+    # The package_functions the prefixes were computed for, and the prefixes of their names.
+    _package_function_prefixes = (None, frozenset())
 
     def get_filter_stack(self):
         return self.filter_stack
@@ -167,14 +182,18 @@ class Importer:
     def initialize(cls):
         cls.filter_stack = []
         cls.filter_chain = []
+        cls._package_function_prefixes = (None, frozenset())
         cls._skip_instrumenting = ("appmap", "_appmap")
         cls.instrument_properties = (
             Env.current.get("APPMAP_INSTRUMENT_PROPERTIES", "true").lower() == "true"
         )
+        cls.plain_wrappers = Env.current.get("APPMAP_PLAIN_WRAPPERS", "false").lower() == "true"
 
     @classmethod
     def use_filter(cls, filter_class):
         cls.filter_stack.append(filter_class)
+        # Modules may have been imported (and the chain made) before all the filters were added.
+        cls.filter_chain = []
 
     @classmethod
     def instrument_function(cls, fn_name, filterableFn: FilterableFn, selected_functions=None):
@@ -187,15 +206,111 @@ class Importer:
 
         return filterableFn.obj
 
+    @classmethod
+    def _instrument_planned(
+        cls, key, fn_name, filterableFn, selected_functions, plan
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        """
+        Instrument the function as instrument_function does, following plan, the ModulePlan for its
+        module, if it was cached. Otherwise, record what was done in plan.
+        """
+        if plan is None:
+            return cls.instrument_function(fn_name, filterableFn, selected_functions)
+
+        chain = cls.filter_chain
+        scope = filterableFn.fqname[: -len(fn_name) - 1]
+        if plan.cached:
+            planned = plan.functions(scope).get(key)
+            if planned is None:
+                return filterableFn.obj
+            matcher_index, param_shape = planned
+            rule = chain.matchers[matcher_index] if matcher_index >= 0 else None
+            return chain.wrap(filterableFn, rule, param_shape)
+
+        matched = chain.filter(filterableFn)
+        selected = selected_functions and fn_name in selected_functions
+        if not (selected or matched):
+            return filterableFn.obj
+
+        rule = chain.match(filterableFn)
+        ret = chain.wrap(filterableFn, rule)
+        plan.add_function(
+            scope,
+            key,
+            chain.matchers.index(rule) if rule is not None else -1,
+            getattr(ret, "_appmap_params", None),
+        )
+        return ret
+
+    @classmethod
+    def _includes(cls, filterable, plan):
+        """Return True if the functions of the module or class filterable should be instrumented."""
+        if plan is not None and plan.cached:
+            return plan.includes(filterable.fqname)
+
+        ret = cls.filter_chain.filter(filterable)
+        if ret and plan is not None:
+            plan.add_scope(filterable.fqname)
+        return ret
+
+    @classmethod
+    def _has_package_functions(cls, modname, package_functions):
+        """
+        Return True if package_functions names functions in the module modname, or its classes.
+        """
+        prefixes = cls._package_function_prefixes
+        if prefixes[0] is not package_functions:
+            names = set()
+            for k in package_functions:
+                parts = k.split(".")
+                names.update(".".join(parts[:i]) for i in range(1, len(parts) + 1))
+            prefixes = cls._package_function_prefixes = (package_functions, names)
+        return modname in prefixes[1]
+
+    @classmethod
+    def _get_filter_chain(cls):
+        if not cls.filter_chain:
+            cls.filter_chain = reduce(lambda acc, e: e(acc), cls.filter_stack, NullFilter(None))
+        return cls.filter_chain
+
+    @classmethod
+    def may_instrument(cls, modname):
+        """Return True if anything in the module modname might be instrumented."""
+        if modname.startswith(cls._skip_instrumenting):
+            return False
+
+        # Import Config here, to avoid circular top-level imports.
+        from .configuration import Config  # pylint: disable=import-outside-toplevel
+
+        return cls._get_filter_chain().could_match(modname) or cls._has_package_functions(
+            modname, Config.current.package_functions
+        )
+
+    @classmethod
+    def _module_plan(cls, mod):
+        """Return the plan for instrumenting mod, or None if plans aren't being cached."""
+        cache = plan_cache.get()
+        # Plans record which matcher applied to each function, so only filters that have matchers
+        # can follow them.
+        if cache is None or not hasattr(cls.filter_chain, "matchers"):
+            return None
+        return cache.module_plan(mod)
+
     @classmethod
     def do_import(cls, *args, **kwargs):
         mod = args[0]
-        if mod.__name__.startswith(cls._skip_instrumenting):
+        # may_instrument also skips the modules that must never be instrumented.
+        if not cls.may_instrument(mod.__name__):
+            # Classes the module imports from elsewhere were considered when their own module was.
+            logger.trace("  nothing to instrument in %s", mod.__name__)
             return
-
         logger.trace("do_import, mod %s args %s kwargs %s", mod, args, kwargs)
-        if not cls.filter_chain:
-            cls.filter_chain = reduce(lambda acc, e: e(acc), cls.filter_stack, NullFilter(None))
+
+        # Import Config here, to avoid circular top-level imports.
+        from .configuration import Config  # pylint: disable=import-outside-toplevel
+
+        package_functions = Config.current.package_functions
+        plan = cls._module_plan(mod)
 
         def instrument_functions(filterable, selected_functions=None):
             # pylint: disable=too-many-locals
@@ -205,10 +320,20 @@ class Importer:
 
             for fn_name, static_fn, fn in functions:
                 filterableFn = FilterableFn(filterable, fn_name, fn, static_fn)
-                new_fn = cls.instrument_function(fn_name, filterableFn, selected_functions)
+                new_fn = cls._instrument_planned(
+                    fn_name, fn_name, filterableFn, selected_functions, plan
+                )
                 if new_fn != fn:
-                    fw = wrapt.wrap_function_wrapper(filterable.obj, fn_name, new_fn)
-                    fw._appmap_instrumented = True  # pylint: disable=protected-access
+                    plain = (
+                        instrument.plain_wrapper(filterableFn, new_fn)
+                        if cls.plain_wrappers
+                        else None
+                    )
+                    if plain is not None:
+                        setattr(filterable.obj, fn_name, plain)
+                    else:
+                        fw = wrapt.wrap_function_wrapper(filterable.obj, fn_name, new_fn)
+                        fw._appmap_instrumented = True  # pylint: disable=protected-access
 
             # Now that we've instrumented all the functions, go through the properties and update
             # them
@@ -220,7 +345,9 @@ class Importer:
                     filterableFn = FilterableFn(filterable, prop_name, fn, fn, auxtype)
                     if getattr(fn, "_appmap_instrumented", None):
                         continue
-                    new_fn = cls.instrument_function(prop_name, filterableFn, selected_functions)
+                    new_fn = cls._instrument_planned(
+                        f"{prop_name} ({k})", prop_name, filterableFn, selected_functions, plan
+                    )
                     if new_fn != fn:
                         new_fn = wrapt.FunctionWrapper(fn, new_fn)
                         # Set _appmap_instrumented on the FunctionWrapper, not on the wrapped
@@ -232,14 +359,10 @@ class Importer:
                     instrumented_fns["doc"] = prop.__doc__
                     setattr(filterable.obj, prop_name, property(**instrumented_fns))
 
-        # Import Config here, to avoid circular top-level imports.
-        from .configuration import Config  # pylint: disable=import-outside-toplevel
-
-        package_functions = Config.current.package_functions
         fm = FilterableMod(mod)
         if fm.fqname in package_functions:
             instrument_functions(fm, package_functions.get(fm.fqname))
-        elif cls.filter_chain.filter(fm):
+        elif cls._includes(fm, plan):
             instrument_functions(fm)
 
         classes = get_classes(mod)
@@ -251,7 +374,7 @@ class Importer:
                 continue
             if fc.fqname in package_functions:
                 instrument_functions(fc, package_functions.get(fc.fqname))
-            elif cls.filter_chain.filter(fc):
+            elif cls._includes(fc, plan):
                 instrument_functions(fc)
 
 
@@ -290,53 +413,67 @@ def wrap_exec_module(exec_module):
     return wrap_finder_function(exec_module, wrapped_exec_module)
 
 
-@wrapt.decorator
-def wrapped_find_spec(find_spec, _, args, kwargs):
-    spec = find_spec(*args, **kwargs)
-    if spec is not None:
-        if getattr(spec.loader, "exec_module", None) is not None:
-            loader = spec.loader
-            # This is kind of gross. As the comment linked to below describes, wrapt has trouble
-            # identifying methods decorated with @staticmethod. It offers two suggested fixes:
-            # update the class definition, or patch the function found in __dict__. We can't do the
-            # former, so do the latter instead.
-            #   https://github.com/GrahamDumpleton/wrapt/blob/1.14.1/src/wrapt/wrappers.py#L730
-            #
-            # TODO: determine if we can use wrapt.wrap_function_wrapper to simplify this code
-            exec_module = inspect.getattr_static(loader, "exec_module")
-            if isinstance(exec_module, staticmethod):
-                loader.exec_module = wrap_exec_module(exec_module)
-            else:
-                loader.exec_module = wrap_exec_module(loader.exec_module)
+def _hook_spec(spec):
+    """Arrange for the module that spec is for to be instrumented, once it's been executed."""
+    # Only plain source files are rewritten: subclasses of SourceFileLoader may do their own
+    # thing with the source.
+    # pylint: disable-next=unidiomatic-typecheck
+    if type(spec.loader) is importlib.machinery.SourceFileLoader and rewrite.enabled():
+        spec.loader = rewrite.RewritingLoader(spec.name, spec.origin)
+    if getattr(spec.loader, "exec_module", None) is not None:
+        loader = spec.loader
+        # This is kind of gross. As the comment linked to below describes, wrapt has trouble
+        # identifying methods decorated with @staticmethod. It offers two suggested fixes:
+        # update the class definition, or patch the function found in __dict__. We can't do the
+        # former, so do the latter instead.
+        #   https://github.com/GrahamDumpleton/wrapt/blob/1.14.1/src/wrapt/wrappers.py#L730
+        #
+        # TODO: determine if we can use wrapt.wrap_function_wrapper to simplify this code
+        exec_module = inspect.getattr_static(loader, "exec_module")
+        if isinstance(exec_module, staticmethod):
+            loader.exec_module = wrap_exec_module(exec_module)
         else:
-            logger.trace("no exec_module for loader %r", spec.loader)
+            loader.exec_module = wrap_exec_module(loader.exec_module)
+    else:
+        logger.trace("no exec_module for loader %r", spec.loader)
     return spec
 
 
-def wrap_finder_find_spec(finder):
-    # Prior to 3.11, it worked fine to just grab find_spec from the finder and wrap it. The
-    # implementation of builtin finders must have changed with 3.11, because we now need the same
-    # kind of workaround we use above for exec_module.
-    if sys.version_info[1] < 11:
-        find_spec = getattr(finder, "find_spec", None)
-        if find_spec is None:
-            logger.trace("no find_spec for finder %r", finder)
-            return
+class AppMapFinder(importlib.abc.MetaPathFinder):
+    """
+    The finder that hooks the modules that might have something instrumented in them. It's kept
+    first on sys.meta_path. It finds those modules by asking the finders after it, and returns None
+    straight away for any other module, so that importing it costs (almost) nothing extra.
+    """
 
-        finder.find_spec = wrap_finder_function(find_spec, wrapped_find_spec)
-    else:
-        find_spec = inspect.getattr_static(finder, "find_spec", None)
-        if find_spec is None:
-            logger.trace("no find_spec for finder %r", finder)
-            return
+    def find_spec(self, fullname, path=None, target=None):
+        if not (Env.current.enabled and Importer.may_instrument(fullname)):
+            return None
 
-        if isinstance(find_spec, (classmethod, staticmethod)):
-            finder.find_spec = wrap_finder_function(find_spec, wrapped_find_spec)
-        else:
-            finder.find_spec = wrap_finder_function(finder.find_spec, wrapped_find_spec)
+        meta_path = sys.meta_path
+        meta_path = getattr(meta_path, "_meta_path", meta_path)
+        for finder in list(meta_path):
+            if finder is self:
+                continue
+            find_spec = getattr(finder, "find_spec", None)
+            if find_spec is None:
+                logger.trace("no find_spec for finder %r", finder)
+                continue
+            spec = find_spec(fullname, path, target)
+            if spec is not None:
+                return _hook_spec(spec)
+        return None
+
+    def __repr__(self):
+        return "<AppMapFinder>"
+
+
+_finder = AppMapFinder()
 
 
 class MetapathObserver(MutableSequence):
+    """Keeps _finder first on sys.meta_path, even when other finders are inserted at the front."""
+
     def __init__(self, meta_path):
         self._meta_path = meta_path
 
@@ -353,7 +490,10 @@ class MetapathObserver(MutableSequence):
         return self._meta_path.__len__()
 
     def insert(self, index, value):
-        wrap_finder_find_spec(value)
+        if index < 0:
+            index = max(len(self._meta_path) + index, 0)
+        if index == 0 and self._meta_path and self._meta_path[0] is _finder:
+            index = 1
         self._meta_path.insert(index, value)
 
     def copy(self):
@@ -365,12 +505,11 @@ def initialize():
     # If we're not enabled, there's no reason to hook the finders.
     if Env.current.enabled:
         logger.trace("sys.metapath: %s", sys.meta_path)
-        for finder in sys.meta_path:
-            wrap_finder_find_spec(finder)
+        meta_path = [f for f in sys.meta_path if f is not _finder]
+        meta_path.insert(0, _finder)
 
-        # Make sure we instrument any finders that get added in the
-        # future.
-        sys.meta_path = MetapathObserver(sys.meta_path.copy())
+        # Make sure our finder stays ahead of any finders that get added in the future.
+        sys.meta_path = MetapathObserver(meta_path)
 
 
 def instrument_module(module):
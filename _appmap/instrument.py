@@ -1,13 +1,15 @@
+import functools
 import sys
 import time
 from collections import namedtuple
 from contextlib import contextmanager
+from types import FunctionType, MethodType
 
-from . import event
+from . import event, monitoring, rewrite
 from .env import Env
 from .event import CallEvent
 from .recorder import Recorder, AppMapLimitExceeded
-from .utils import appmap_tls
+from .utils import FnType, appmap_tls
 
 logger = Env.current.getLogger(__name__)
 
@@ -47,9 +49,17 @@ def track_shallow(fn):
     the performance hit, your best bet is to record without shallow
     and postprocess the appmap to your liking.
     """
-    tls = appmap_tls()
     rule = getattr(fn, "_appmap_shallow", None)
     logger.trace("track_shallow(%r) [%r]", fn, rule)
+    return track_shallow_rule(rule)
+
+
+def track_shallow_rule(rule):
+    """
+    Check if a function matched by rule should be skipped, as track_shallow does for an instrumented
+    function.
+    """
+    tls = appmap_tls()
     result = rule and tls.get("last_rule", None) == rule
     tls["last_rule"] = rule
     return result
@@ -70,7 +80,8 @@ def saved_shallow_rule():
 
 
 _InstrumentedFn = namedtuple(
-    "_InstrumentedFn", "fn fntype instrumented_fn make_call_event params display_params"
+    "_InstrumentedFn",
+    "fn fntype instrumented_fn make_call_event params display_params schema",
 )
 
 
@@ -85,7 +96,7 @@ def call_instrumented(f, instance, args, kwargs):
     with recording_disabled():
         logger.trace("%s args %s kwargs %s", f.fn, args, kwargs)
         params = CallEvent.set_params(
-            f.params, instance, args, kwargs, display_value=f.display_params
+            f.params, instance, args, kwargs, display_value=f.display_params, schema=f.schema
         )
         call_event = f.make_call_event(parameters=params)
     Recorder.add_event(call_event)
@@ -98,7 +109,7 @@ def call_instrumented(f, instance, args, kwargs):
 
         return_event = event.FuncReturnEvent(
             return_value=ret, parent_id=call_event_id, elapsed=elapsed_time,
-            display_value=f.display_params
+            display_value=f.display_params, schema=f.schema
         )
         Recorder.add_event(return_event)
         return ret
@@ -119,20 +130,46 @@ def call_instrumented(f, instance, args, kwargs):
         raise
 
 
-def instrument(filterable):
-    """return an instrumented function"""
+def is_instrumented(filterable):
+    """Return True if the function filterable has already been instrumented, however it was done."""
+    return bool(
+        getattr(filterable.obj, "_appmap_instrumented", None)
+        or monitoring.is_monitored(filterable.static_fn)
+        or rewrite.is_registered(filterable.static_fn)
+    )
+
+
+def instrument(filterable, schema=event.DEFAULT_SCHEMA_LIMITS, param_shape=None, shallow=None):
+    """
+    return an instrumented function. schema limits the schemas inferred for its parameters and
+    return value. param_shape, if given, is the shape of the function's parameters, saved from an
+    earlier instrumentation of it. shallow is the shallow rule that matched the function, if any.
+
+    If the function can be monitored with sys.monitoring (see _appmap.monitoring), or was rewritten
+    when its module was imported (see _appmap.rewrite), it's returned unchanged.
+    """
     logger.debug("hooking %s", filterable.fqname)
+    code = monitoring.code_to_monitor(filterable) if monitoring.enabled() else None
+    site = rewrite.site_of(filterable) if code is None else None
 
     # note this has to happen before CallEvent.make, which clears this attribute
     has_labels = hasattr(filterable.obj, "_appmap_labels")
 
     make_call_event = event.CallEvent.make(filterable)
-    params = CallEvent.make_params(filterable)
+    params = event.LazyParamBinder(filterable, param_shape)
 
     display_params = Env.current.display_params or (
         has_labels and Env.current.display_labeled_params
     )
 
+    if code is not None:
+        handler = monitoring.Handler(make_call_event, params, display_params, schema, shallow)
+        monitoring.monitor(code, handler)
+        return filterable.obj
+    if site is not None:
+        rewrite.register(site, make_call_event, params, display_params, schema, shallow)
+        return filterable.obj
+
     # django depends on being able to find the cache_clear attribute
     # on functions. (You can see this by trying to map
     # https://github.com/chicagopython/chypi.org.) Make sure it gets
@@ -140,13 +177,92 @@ def instrument(filterable):
     #
     # Going forward, we should consider how to make this more general.
     def instrumented_fn(wrapped, instance, args, kwargs):
+        if not Recorder._active_recorders:  # pylint: disable=protected-access
+            return wrapped(*args, **kwargs)
+
         with saved_shallow_rule():
             f = _InstrumentedFn(
                 wrapped, filterable.fntype, instrumented_fn, make_call_event, params,
-                display_params
+                display_params, schema
             )
             return call_instrumented(f, instance, args, kwargs)
 
     ret = instrumented_fn
     setattr(ret, "_appmap_instrumented", True)
+    setattr(ret, "_appmap_params", params)
+    if shallow:
+        setattr(ret, "_appmap_shallow", shallow)
     return ret
+
+
+# The sources of the plain wrappers, for functions (and staticmethods), and for methods (and
+# classmethods). The first argument of a method is its instance (or class), which instrumented_fn
+# expects to be separated from the others, as wrapt does.
+_PLAIN_WRAPPER_SOURCES = {
+    False: """\
+def wrapper(*args, **kwargs):
+    if not Recorder._active_recorders:
+        return fn(*args, **kwargs)
+    return instrumented_fn(fn, None, args, kwargs)
+""",
+    True: """\
+def wrapper(*args, **kwargs):
+    if not (args and Recorder._active_recorders):
+        return fn(*args, **kwargs)
+    instance = args[0]
+    return instrumented_fn(MethodType(fn, instance), instance, args[1:], kwargs)
+""",
+}
+_plain_wrapper_codes = {}
+
+
+def _plain_wrapper_code(is_method):
+    code = _plain_wrapper_codes.get(is_method)
+    if code is None:
+        namespace = {}
+        exec(  # pylint: disable=exec-used
+            compile(_PLAIN_WRAPPER_SOURCES[is_method], "<appmap wrapper>", "exec"), namespace
+        )
+        code = _plain_wrapper_codes[is_method] = namespace["wrapper"].__code__
+    return code
+
+
+def plain_wrapper(filterable, instrumented_fn):
+    """
+    Return a plain function that calls instrumented_fn (as returned by instrument) the way a wrapt
+    FunctionWrapper would, to install in place of the function filterable. Calling it, and looking
+    it up on a class, costs much less than a FunctionWrapper does, because there's no proxy to go
+    through, and no BoundFunctionWrapper made each time a method is looked up.
+
+    Returns None if the function should be wrapped with wrapt instead, because it isn't a plain
+    function, a staticmethod, or a classmethod.
+    """
+    static_fn = filterable.static_fn
+    fntype = filterable.fntype
+    fn = static_fn.__func__ if fntype & (FnType.STATIC | FnType.CLASS) else static_fn
+    if type(fn) is not FunctionType:  # pylint: disable=unidiomatic-typecheck
+        return None
+
+    # The wrapper's code is named for fn, so tracebacks and profiles show which function it wraps.
+    # It keeps its own file and line, though: fn can be found through __wrapped__.
+    fn_code = fn.__code__
+    changes = {"co_name": fn_code.co_name}
+    if sys.version_info >= (3, 11):
+        changes["co_qualname"] = fn_code.co_qualname
+    code = _plain_wrapper_code(bool(fntype & (FnType.INSTANCE | FnType.CLASS))).replace(**changes)
+    wrapper_globals = {
+        "fn": fn,
+        "instrumented_fn": instrumented_fn,
+        "MethodType": MethodType,
+        "Recorder": Recorder,
+    }
+    wrapper = FunctionType(code, wrapper_globals, fn.__name__)
+
+    # Copying fn's __dict__ keeps attributes other code expects to find on it, e.g. cache_clear.
+    functools.update_wrapper(wrapper, fn)
+    wrapper._appmap_instrumented = True  # pylint: disable=protected-access
+    if fntype & FnType.STATIC:
+        return staticmethod(wrapper)
+    if fntype & FnType.CLASS:
+        return classmethod(wrapper)
+    return wrapper
@@ -0,0 +1,247 @@
+"""
+Instrumentation that uses sys.monitoring (PEP 669), in Python 3.12 and later.
+
+When APPMAP_INSTRUMENTATION is "monitoring", the functions selected for instrumentation aren't
+replaced by wrappers. Instead, PY_START and PY_RETURN events are turned on for their code objects,
+and the callbacks here add the CallEvents and ReturnEvents the wrappers would have. A function that
+raises is seen by the PY_UNWIND callback, which adds an ExceptionEvent. PY_UNWIND can't be turned on
+for individual code objects, so it's turned on for all of them, and the callback ignores the code
+that isn't monitored.
+
+When nothing is being recorded, the callbacks return DISABLE, so CPython stops calling them for that
+function until recording starts again. The functions disabled are remembered, and only their events
+are turned back on then: sys.monitoring.restart_events would turn back on the events every tool
+(e.g. a coverage tool) has disabled, in every function.
+
+Functions that can't be monitored this way are still wrapped: builtins, generators and coroutines
+(whose code starts and returns more than once per call), and functions whose code may be shared
+with other functions, e.g. the wrappers made by decorators. A function that's instrumented under
+more than one name (e.g. a module function that's also used as a property's getter) is recorded
+under the first.
+"""
+
+import inspect
+import sys
+import threading
+import time
+from collections import namedtuple
+
+from . import event, instrument
+from .env import Env
+from .recorder import AppMapLimitExceeded, Recorder
+from .utils import appmap_tls
+
+logger = Env.current.getLogger(__name__)
+
+_monitoring = getattr(sys, "monitoring", None)
+
+# inspect sets the CO_ flags from dis.COMPILER_FLAG_NAMES, so pylint can't see them.
+# pylint: disable=no-member
+_NOT_MONITORED = (
+    inspect.CO_GENERATOR
+    | inspect.CO_COROUTINE
+    | inspect.CO_ITERABLE_COROUTINE
+    | inspect.CO_ASYNC_GENERATOR
+)
+# pylint: enable=no-member
+
+# What's needed to record the calls to a monitored function.
+Handler = namedtuple("Handler", "make_call_event params display_params schema shallow")
+
+_Monitored = namedtuple("_Monitored", ("code",) + Handler._fields)
+
+# The functions being monitored, by the ids of their code objects. (Hashing a code object hashes its
+# contents, which is too slow to do on every call.)
+_monitored = {}
+
+# The ids of the monitored code objects that have had an event disabled since recording last
+# started.
+_disabled = set()
+
+# pylint: disable=global-statement
+# The tool id claimed from sys.monitoring, None if it hasn't been claimed yet, or False if it
+# couldn't be.
+_tool_id = None
+
+# Each thread's stack of the calls in progress to monitored functions, as (frame, the shallow rule
+# to restore when it returns, the id of its CallEvent or None if it isn't being recorded, the time
+# it started).
+_local = threading.local()
+
+
+def enabled():
+    """Return True if functions should be monitored, rather than wrapped."""
+    if Env.current.get("APPMAP_INSTRUMENTATION", "wrapper").lower() != "monitoring":
+        return False
+    if _monitoring is None:
+        logger.warning("APPMAP_INSTRUMENTATION=monitoring needs Python 3.12 or later")
+        return False
+    return _claim_tool_id()
+
+
+def _claim_tool_id():
+    global _tool_id
+    if _tool_id is None:
+        try:
+            _monitoring.use_tool_id(_monitoring.PROFILER_ID, "appmap")
+        except ValueError:
+            logger.warning(
+                "sys.monitoring profiler id is in use by %s, wrapping functions instead",
+                _monitoring.get_tool(_monitoring.PROFILER_ID),
+            )
+            _tool_id = False
+            return False
+        _tool_id = _monitoring.PROFILER_ID
+        events = _monitoring.events
+        _monitoring.register_callback(_tool_id, events.PY_START, _on_start)
+        _monitoring.register_callback(_tool_id, events.PY_RETURN, _on_return)
+        _monitoring.register_callback(_tool_id, events.PY_UNWIND, _on_unwind)
+        _monitoring.set_events(_tool_id, events.PY_UNWIND)
+        Recorder.add_activity_listener(_on_activity)
+    return bool(_tool_id)
+
+
+def _code(fn):
+    return getattr(getattr(fn, "__func__", fn), "__code__", None)
+
+
+def code_to_monitor(filterable):
+    """
+    Return the code object to monitor for the function filterable, or None if it should be wrapped
+    instead.
+    """
+    fn = getattr(filterable.static_fn, "__func__", filterable.static_fn)
+    if not event._is_plain_function(fn):  # pylint: disable=protected-access
+        return None
+    code = fn.__code__
+    if code.co_flags & _NOT_MONITORED:
+        return None
+    # A function whose code has a different name (e.g. because functools.wraps renamed it), or
+    # that was defined inside another function, may share its code with other functions.
+    if code.co_qualname != fn.__qualname__ or "<locals>" in code.co_qualname:
+        return None
+    return code
+
+
+def is_monitored(fn):
+    return id(_code(fn)) in _monitored
+
+
+def monitor(code, handler):
+    """Start monitoring the function whose code is code, recording its calls with the Handler."""
+    if id(code) in _monitored:
+        return
+    _monitored[id(code)] = _Monitored(code, *handler)
+    events = _monitoring.events
+    _monitoring.set_local_events(_tool_id, code, events.PY_START | events.PY_RETURN)
+
+
+def _on_activity(active):
+    if active:
+        # Start a new stack in each thread, rather than trying to match up the calls that started
+        # before, and turn back on the events that were disabled while nothing was recorded.
+        global _local, _disabled
+        _local = threading.local()
+        disabled, _disabled = _disabled, set()
+        events = _monitoring.events
+        for code_id in disabled:
+            f = _monitored.get(code_id)
+            if f is None:
+                continue
+            # Changing a code object's events turns back on any of them that were disabled.
+            _monitoring.set_local_events(_tool_id, f.code, 0)
+            _monitoring.set_local_events(_tool_id, f.code, events.PY_START | events.PY_RETURN)
+
+
+def _disable(code):
+    _disabled.add(id(code))
+    return _monitoring.DISABLE
+
+
+def _on_start(code, _offset):
+    f = _monitored.get(id(code))
+    # There's a race here: a recorder may be enabled after this check, but before CPython disables
+    # the event. If it is, the function won't be seen until the next recorder starts.
+    if f is None or not Recorder._active_recorders:  # pylint: disable=protected-access
+        return _disable(code)
+
+    frame = sys._getframe(1)  # pylint: disable=protected-access
+    tls = appmap_tls()
+    current_rule = tls.get("last_rule", None)
+    call = [frame, current_rule, None, None]
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+    stack.append(call)
+
+    if (
+        (not Recorder.get_enabled())
+        or instrument.is_instrumentation_disabled()
+        or instrument.track_shallow_rule(f.shallow)
+    ):
+        return None
+
+    with instrument.recording_disabled():
+        params = f.params.bind_locals(frame.f_locals, f.display_params, f.schema)
+        call_event = f.make_call_event(parameters=params)
+    Recorder.add_event(call_event)
+    call[2] = call_event.id
+    call[3] = start_time = time.time()
+    Recorder.check_time(start_time)
+    return None
+
+
+def _pop_call(frame):
+    """
+    Remove the call for frame from this thread's stack, and return it. Returns None if it isn't
+    there, e.g. because it started before recording did.
+    """
+    stack = getattr(_local, "stack", None)
+    if not stack:
+        return None
+    for i in range(len(stack) - 1, -1, -1):
+        if stack[i][0] is frame:
+            # Anything above it started while nothing was recorded, and never saw its return.
+            ret = stack[i]
+            del stack[i:]
+            appmap_tls()["last_rule"] = ret[1]
+            return ret
+    return None
+
+
+def _on_return(code, _offset, retval):
+    f = _monitored.get(id(code))
+    call = _pop_call(sys._getframe(1)) if f is not None else None  # pylint: disable=protected-access
+    if call is None:
+        if not Recorder._active_recorders:  # pylint: disable=protected-access
+            return _disable(code)
+        return None
+
+    _, _, call_event_id, start_time = call
+    if call_event_id is not None:
+        elapsed_time = time.time() - start_time
+        Recorder.add_event(
+            event.FuncReturnEvent(
+                return_value=retval,
+                parent_id=call_event_id,
+                elapsed=elapsed_time,
+                display_value=f.display_params,
+                schema=f.schema,
+            )
+        )
+    return None
+
+
+def _on_unwind(code, _offset, exc):
+    if id(code) not in _monitored:
+        return
+
+    call = _pop_call(sys._getframe(1))  # pylint: disable=protected-access
+    if call is None or call[2] is None or isinstance(exc, AppMapLimitExceeded):
+        return
+    elapsed_time = time.time() - call[3]
+    Recorder.add_event(
+        event.ExceptionEvent(
+            parent_id=call[2], elapsed=elapsed_time, exc_info=(type(exc), exc, exc.__traceback__)
+        )
+    )
@@ -0,0 +1,224 @@
+"""
+A cache of the decisions made instrumenting modules, so they don't have to be made again the next
+time the app starts.
+
+When APPMAP_PLAN_CACHE is "true", the plan for each module instrumented is saved when the process
+exits: which of its scopes (the module itself, and its classes) had their functions considered, and
+which of those functions were wrapped, with the matcher that applied to them, and the shape of their
+parameters, if any calls to them were recorded.
+
+The cache only holds that data, as JSON: nothing read from it is executed. The binders for the
+parameters are generated again from their shapes, when calls to the functions are recorded.
+
+The cache is kept in a file in APPMAP_PLAN_CACHE_DIR (by default, plan_cache in the output
+directory), named for a hash of the configuration, so changing appmap.yml starts a new cache. The
+plan for a module is only used if its file has the same mtime and size it had when the plan was
+made.
+"""
+
+import atexit
+import hashlib
+import importlib.util
+import json
+import os
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from .env import Env
+
+logger = Env.current.getLogger(__name__)
+
+# Change this when the contents of the cache change.
+_FORMAT_VERSION = 2
+
+
+class ModulePlan:
+    """
+    The plan for instrumenting a module. scopes maps the fqname of each scope whose functions are
+    instrumented to a dict, that maps the name of each function wrapped to (the index of the matcher
+    that applied to it, or -1 if none did, and the shape of its parameters, or None).
+
+    A plan that came from the cache is followed; a new one is filled in as the module is
+    instrumented.
+    """
+
+    __slots__ = ["scopes", "cached"]
+
+    def __init__(self, scopes=None):
+        self.cached = scopes is not None
+        self.scopes = scopes if scopes is not None else {}
+
+    def includes(self, scope):
+        return scope in self.scopes
+
+    def functions(self, scope):
+        return self.scopes.get(scope, {})
+
+    def add_scope(self, scope):
+        self.scopes.setdefault(scope, {})
+
+    def add_function(self, scope, name, matcher_index, params):
+        """
+        Add a function to the plan. params is its ParamBinder (or LazyParamBinder), or the shape of
+        its parameters, or None. A binder's shape is taken when the plan is saved, since it may not
+        be known until the function's been called.
+        """
+        self.scopes.setdefault(scope, {})[name] = (matcher_index, params)
+
+
+def _stamp(mod):
+    path = getattr(mod, "__file__", None)
+    if not path:
+        return None
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+def _shape(params):
+    return params if params is None or isinstance(params, tuple) else params.shape
+
+
+def _load_modules(modules):
+    """Turn the modules read from the cache back into the form they were saved from."""
+    return {
+        name: {
+            "stamp": tuple(entry["stamp"]),
+            "scopes": {
+                scope: {
+                    fn: (int(i), tuple(map(tuple, shape)) if shape is not None else None)
+                    for fn, (i, shape) in functions.items()
+                }
+                for scope, functions in entry["scopes"].items()
+            },
+        }
+        for name, entry in modules.items()
+    }
+
+
+def config_key(packages, package_functions, instrument_properties):
+    """Return a hash of the configuration that the decisions in a plan depend on."""
+    config = [
+        _FORMAT_VERSION,
+        importlib.util.MAGIC_NUMBER.hex(),
+        packages,
+        sorted((k, sorted(v)) for k, v in package_functions.items()),
+        instrument_properties,
+    ]
+    return hashlib.sha256(json.dumps(config, sort_keys=True, default=repr).encode()).hexdigest()
+
+
+class PlanCache:
+    def __init__(self, path):
+        self.path = path
+        self._modules = self._read()
+        # The names of the modules whose plans were made by this process, rather than read from the
+        # cache.
+        self._made = set()
+
+    def _read(self):
+        """Return the modules saved in the cache file, or an empty dict if there aren't any."""
+        try:
+            data = json.loads(self.path.read_bytes())
+            if data.get("version") != _FORMAT_VERSION:
+                return {}
+            return _load_modules(data["modules"])
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, TypeError, KeyError, AttributeError):
+            logger.warning("ignoring invalid plan cache %s", self.path, exc_info=True)
+        return {}
+
+    def module_plan(self, mod):
+        """
+        Return the ModulePlan for mod. It's the cached plan, if there is one and mod's file hasn't
+        changed, otherwise it's a new plan that will be saved. Returns None if mod doesn't have a
+        file.
+        """
+        stamp = _stamp(mod)
+        if stamp is None:
+            return None
+
+        name = mod.__name__
+        entry = self._modules.get(name)
+        if entry is not None and entry["stamp"] == stamp:
+            return ModulePlan(entry["scopes"])
+
+        ret = ModulePlan()
+        self._modules[name] = {"stamp": stamp, "scopes": ret.scopes}
+        self._made.add(name)
+        return ret
+
+    def save(self):
+        """
+        Save the plans made by this process. Other processes running the same app may have saved
+        their plans since the cache was read, so the file is read again, and these plans are merged
+        into it, before it's replaced.
+        """
+        if not self._made:
+            return
+        modules = self._read()
+        for name in self._made:
+            entry = self._modules[name]
+            modules[name] = {
+                "stamp": entry["stamp"],
+                "scopes": {
+                    scope: {k: (i, _shape(params)) for k, (i, params) in functions.items()}
+                    for scope, functions in entry["scopes"].items()
+                },
+            }
+        data = {"version": _FORMAT_VERSION, "modules": modules}
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with NamedTemporaryFile(
+                mode="w", encoding="utf-8", dir=self.path.parent, delete=False
+            ) as tmp:
+                json.dump(data, tmp)
+            os.replace(tmp.name, self.path)
+        except (OSError, ValueError):
+            logger.warning("failed to save plan cache %s", self.path, exc_info=True)
+
+
+# pylint: disable=global-statement
+_cache = None
+
+
+def get():
+    """Return the PlanCache, or None if the cache isn't enabled."""
+    global _cache
+    if _cache is None:
+        _cache = _make_cache() or False
+    return _cache or None
+
+
+def _make_cache():
+    env = Env.current
+    if env.get("APPMAP_PLAN_CACHE", "false").lower() != "true":
+        return None
+
+    # Import these here, to avoid circular top-level imports.
+    # pylint: disable=import-outside-toplevel
+    from .configuration import Config
+    from .importer import Importer
+
+    config = Config.current
+    key = config_key(config.packages, config.package_functions, Importer.instrument_properties)
+    cache_dir = env.get("APPMAP_PLAN_CACHE_DIR")
+    cache_dir = Path(cache_dir) if cache_dir else env.output_dir / "plan_cache"
+    return PlanCache(cache_dir / f"{key}.json")
+
+
+def save():
+    if _cache:
+        _cache.save()
+
+
+atexit.register(save)
+
+
+def initialize():
+    global _cache
+    save()
+    _cache = None
@@ -1,7 +1,10 @@
+import heapq
+import itertools
 import threading
 import time
 import traceback
 from abc import ABC, abstractmethod
+from operator import itemgetter
 
 from .env import Env
 from .utils import appmap_tls
@@ -22,6 +25,27 @@ _MAX_TIME = Env.current.get("APPMAP_MAX_TIME")
 if _MAX_TIME is not None:
     _MAX_TIME = int(_MAX_TIME)
 
+# When per-thread buffers are in use, each thread reserves this many event ids at a time, so it
+# only needs to take _next_event_id_lock once per block.
+_EVENT_ID_BLOCK_SIZE = 1024
+
+
+def _new_events():
+    """
+    Return a new collection for a Recorder's events. This is an EventList, unless
+    APPMAP_EVENT_STORE has been set to "columnar".
+    """
+    # generation and columnar depend on event, which depends on this module.
+    # pylint: disable=import-outside-toplevel
+    if Env.current.get("APPMAP_EVENT_STORE", "list").lower() != "columnar":
+        from .generation import EventList
+
+        return EventList()
+
+    from .columnar import ColumnarEvents
+
+    return ColumnarEvents()
+
 
 class AppMapLimitExceeded(RuntimeError):
     """Class of events thrown when some limit has been exceeded"""
@@ -44,20 +68,84 @@ class Recorder(ABC):
 
     _aborting = False
 
+    # The number of recorders that are enabled, in any thread. Instrumented functions check this
+    # before anything else, so they cost next to nothing when nothing is being recorded. It may
+    # overcount (e.g. if an enabled recorder is discarded), but it never undercounts.
+    _active_recorders = 0
+    _active_recorders_lock = threading.Lock()
+    # Functions called with True when a recorder is enabled and none was, and with False when the
+    # last enabled recorder is disabled.
+    _activity_listeners = []
+
     @property
     @abstractmethod
     def events(self):
         return self._events
 
+    @property
+    def _enabled(self):
+        return self._is_enabled
+
+    @_enabled.setter
+    def _enabled(self, value):
+        value = bool(value)
+        with Recorder._active_recorders_lock:
+            if value != self._is_enabled:
+                Recorder._active_recorders += 1 if value else -1
+                if Recorder._active_recorders == (1 if value else 0):
+                    for listener in Recorder._activity_listeners:
+                        listener(value)
+            self._is_enabled = value
+
+    @classmethod
+    def add_activity_listener(cls, listener):
+        """
+        Call listener(True) whenever recording starts with no other recorder enabled, and
+        listener(False) whenever the last enabled recorder stops.
+        """
+        if listener not in Recorder._activity_listeners:
+            Recorder._activity_listeners.append(listener)
+
     _next_event_id = 0
     _next_event_id_lock = threading.Lock()
 
+    # Set by SharedRecorder when it's using per-thread buffers. _event_id_epoch changes every time
+    # the ids are reset, so threads can tell that the block they reserved is stale.
+    _event_id_blocks = False
+    _event_id_epoch = 0
+    _event_id_local = threading.local()
+
     @classmethod
     def next_event_id(cls):
+        if cls._event_id_blocks:
+            return cls._next_event_id_from_block()
+
         with cls._next_event_id_lock:
             cls._next_event_id += 1
             return cls._next_event_id
 
+    @classmethod
+    def _next_event_id_from_block(cls):
+        # Note that this uses a threading.local, rather than appmap_tls. The ids in a block must
+        # only ever be handed out by a single thread, and the context that holds appmap_tls can be
+        # shared.
+        local = cls._event_id_local
+        if getattr(local, "epoch", None) != cls._event_id_epoch or local.next_id >= local.end_id:
+            with cls._next_event_id_lock:
+                local.epoch = cls._event_id_epoch
+                local.next_id = cls._next_event_id + 1
+                cls._next_event_id += _EVENT_ID_BLOCK_SIZE
+                local.end_id = cls._next_event_id + 1
+        ret = local.next_id
+        local.next_id += 1
+        return ret
+
+    @classmethod
+    def _reset_event_ids(cls):
+        with cls._next_event_id_lock:
+            Recorder._next_event_id = 0
+            Recorder._event_id_epoch += 1
+
     # It might be nice to put @property on the getters here. The python maintainers have gone back
     # and forth on whether you should be able to combine @classmethod and @property. In 3.11,
     # they've decided you can't: https://docs.python.org/3.11/library/functions.html#classmethod.
@@ -121,13 +209,15 @@ class Recorder(ABC):
     @classmethod
     def add_event(cls, event):
         """
-        Add the given event to the global recorder, as well as the thread's recorder (if it has
-        one).
+        Add the given event to the recorders that are recording it: the global recorder, and the
+        thread's recorder (if it has one), if they're enabled.
         """
+        # pylint: disable=protected-access
         perthread, shared = cls._get_current()
-        shared._add_event(event)  # pylint: disable=protected-access
-        if perthread:
-            perthread._add_event(event)  # pylint: disable=protected-access
+        if shared._is_enabled:
+            shared._add_event(event)
+        if perthread and perthread._is_enabled:
+            perthread._add_event(event)
 
     _RECORDER_KEY = "appmap_recorder"
 
@@ -137,12 +227,17 @@ class Recorder(ABC):
 
         return [perthread, _default_recorder]
 
-    def clear(self):
+    def clear(self, events=None):
+        """
+        Discard the recorded events. If events is provided, it will collect the events that get
+        recorded from now on, instead of a new list.
+        """
         Recorder._aborting = False
-        self._events = []
+        self._events = _new_events() if events is None else events
 
     def __init__(self, enabled=False):
-        self._events = []
+        self._events = _new_events()
+        self._is_enabled = False
         self._enabled = enabled
         self.start_tb = None
         self._start_time = None
@@ -160,10 +255,15 @@ class Recorder(ABC):
 
     @abstractmethod
     def _stop_recording(self):
+        """
+        Stop recording, and hand the events recorded over to the caller. The recorder starts a new
+        collection of events, so it doesn't hold on to them.
+        """
         logger.debug("AppMap recording stopped")
         self._enabled = False
         self.start_tb = None
-        return self._events
+        events, self._events = self._events, _new_events()
+        return events
 
     @abstractmethod
     def _add_event(self, event):
@@ -209,23 +309,105 @@ class ThreadRecorder(Recorder):
     # pragma pylint: enable=useless-super-delegation
 
 
+class _ThreadBuffer:
+    """
+    The events a thread has added to a SharedRecorder, each with the count that orders it among
+    all the events added. The lock is only ever contended when the buffers are being merged.
+    """
+
+    __slots__ = ["lock", "entries"]
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.entries = []
+
+    def append(self, count, event):
+        with self.lock:
+            self.entries.append((count, event))
+
+    def copy(self):
+        with self.lock:
+            return list(self.entries)
+
+    def take(self):
+        with self.lock:
+            ret, self.entries = self.entries, []
+        return ret
+
+
 class SharedRecorder(Recorder):
     """
     A shared Recorder. The global recorder is an instance of this class.
+
+    If APPMAP_THREAD_BUFFERS is "true", each thread appends its events to a buffer of its own, and
+    takes its event ids from a block reserved for it. Neither requires a shared lock, so threads
+    recording concurrently don't contend with each other. The buffers are only merged when the
+    events are retrieved. They aren't used once the recorder has been given a store of its own to
+    collect the events in.
+
+    The events in the buffers are merged in the order they were recorded, which isn't the order of
+    their ids: each block of ids is only used by one thread, so a thread's events can have higher
+    ids than events another thread recorded later. The ids are still unique, but there are gaps in
+    them, where a thread didn't use all the ids it reserved.
     """
 
     _lock = threading.RLock()
 
     def __init__(self):
         super().__init__()
-        Recorder._next_event_id = 0
+        self._spill = None
+        self._thread_buffers = Env.current.get("APPMAP_THREAD_BUFFERS", "false").lower() == "true"
+        Recorder._event_id_blocks = self._thread_buffers
+        self._reset_buffers()
+        Recorder._reset_event_ids()
+
+    def clear(self, events=None):
+        super().clear(events)
+        # A store that's given a spill method (e.g. SpilledEvents) does the work of writing its
+        # events out in it. That doesn't need the lock, so it's called after the lock is released.
+        self._spill = getattr(self._events, "spill", None)
+        if events is not None and self._thread_buffers:
+            # The thread buffers get merged into an EventList, so events would never reach the store
+            # provided (e.g. a flight recorder's ring, which would then grow without limit).
+            logger.warning("Not using thread buffers, events are being collected by %r", events)
+            self._thread_buffers = Recorder._event_id_blocks = False
+        self._reset_buffers()
+        Recorder._reset_event_ids()
+
+    def _reset_buffers(self):
+        # Replacing the threading.local orphans the buffers any thread was using, so they'll each
+        # register a new one the next time they add an event.
+        self._buffers = []
+        self._buffer_local = threading.local()
+        self._event_count = itertools.count(1)
+
+    def _thread_buffer(self):
+        buffer = getattr(self._buffer_local, "buffer", None)
+        if buffer is None:
+            buffer = self._buffer_local.buffer = _ThreadBuffer()
+            with self._lock:
+                self._buffers.append(buffer)
+        return buffer
+
+    def _merge_buffers(self, take=False):
+        """
+        Merge the events in the thread buffers, in the order they were recorded. If take is true,
+        the buffers are emptied.
+        """
+        with self._lock:
+            buffers = list(self._buffers)
+        # Each buffer is already in order.
+        entries = [buffer.take() if take else buffer.copy() for buffer in buffers]
+        # generation depends on event, which depends on this module.
+        from .generation import EventList  # pylint: disable=import-outside-toplevel
 
-    def clear(self):
-        super().clear()
-        Recorder._next_event_id = 0
+        return EventList(e for _, e in heapq.merge(*entries, key=itemgetter(0)))
 
     @property
     def events(self):
+        if self._thread_buffers:
+            return self._merge_buffers()
+
         with self._lock:
             return super().events
 
@@ -235,11 +417,34 @@ class SharedRecorder(Recorder):
 
     def _stop_recording(self):
         with self._lock:
-            return super()._stop_recording()
+            events = super()._stop_recording()
+            self._spill = None
+            if self._thread_buffers:
+                # Recording has been disabled, but a thread may still be adding an event it started
+                # recording before, so each buffer is taken under its lock.
+                events = self._merge_buffers(take=True)
+                self._reset_buffers()
+        return events
 
     def _add_event(self, event):
-        with self._lock:
-            super()._add_event(event)
+        if not self._thread_buffers:
+            with self._lock:
+                super()._add_event(event)
+                spill = self._spill
+            if spill is not None:
+                spill()
+            return
+
+        if Recorder._aborting:
+            return
+
+        # next() on an itertools.count is atomic, so this doesn't need the shared lock. The count
+        # also records the order the events were added in, for merging the buffers.
+        count = next(self._event_count)
+        self._thread_buffer().append(count, event)
+        if _MAX_EVENTS is not None and count > _MAX_EVENTS:
+            Recorder._aborting = True
+            raise AppMapTooManyEvents(f"Session exceeded {_MAX_EVENTS} events")
 
 
 def initialize():
@@ -1,9 +1,14 @@
 import atexit
+import gzip
+import io
+import itertools
 import os
+from contextlib import ExitStack, suppress
 from datetime import datetime, timezone
 from tempfile import NamedTemporaryFile
 
-from _appmap import generation
+from _appmap import binary, flight_recorder, generation
+from _appmap.spill import SpilledEvents
 from _appmap.web_framework import APPMAP_SUFFIX, HASH_LEN, NAME_MAX, name_hash
 
 from .env import Env
@@ -11,6 +16,10 @@ from .recorder import Recorder
 
 logger = Env.current.getLogger(__name__)
 
+BINARY_SUFFIX = ".appmap.bin"
+GZIP_SUFFIX = ".gz"
+_DEFAULT_GZIP_LEVEL = 6
+
 
 class Recording:
     """
@@ -35,7 +44,13 @@ class Recording:
         if not Env.current.enabled:
             return
 
-        self.events += Recorder.stop_recording()
+        # The recorder hands its events over when it stops, so they can be taken as they are, rather
+        # than copied.
+        events = Recorder.stop_recording()
+        if not self.events:
+            self.events = events
+        else:
+            self.events += events
 
     def is_running(self):
         if not Env.current.enabled:
@@ -82,50 +97,149 @@ class NoopRecording:
         return False
 
 
+def _gzip_level():
+    """
+    Return the level AppMaps should be compressed at, or None if they shouldn't be compressed.
+    """
+    env = Env.current
+    if env.get("APPMAP_GZIP", "false").lower() != "true":
+        return None
+    level = env.get_int("APPMAP_GZIP_LEVEL", _DEFAULT_GZIP_LEVEL)
+    if not 0 <= level <= 9:
+        logger.warning(
+            "APPMAP_GZIP_LEVEL should be between 0 and 9, not %d, using %d",
+            level,
+            _DEFAULT_GZIP_LEVEL,
+        )
+        return _DEFAULT_GZIP_LEVEL
+    return level
+
+
+def _binary_format():
+    """Return True if AppMaps should be written in the binary format."""
+    fmt = Env.current.get("APPMAP_FORMAT", "json").lower()
+    if fmt not in ("json", "binary"):
+        logger.warning("unknown APPMAP_FORMAT %r, using json", fmt)
+    return fmt == "binary"
+
+
+def appmap_file_path(appmap_fname, recorder_type, basedir=Env.current.output_dir):
+    """Return the path of the file write_appmap writes the AppMap named appmap_fname to.
+
+    Adds APPMAP_SUFFIX (or BINARY_SUFFIX, if APPMAP_FORMAT is "binary") to basename, and
+    GZIP_SUFFIX, if APPMAP_GZIP is "true"; shortens the name if necessary.
+    """
+    suffix = BINARY_SUFFIX if _binary_format() else APPMAP_SUFFIX
+    if _gzip_level() is not None:
+        suffix += GZIP_SUFFIX
+    if len(appmap_fname) > NAME_MAX - len(suffix):
+        part = NAME_MAX - len(suffix) - 1 - HASH_LEN
+        appmap_fname = appmap_fname[:part] + "-" + name_hash(appmap_fname[part:])[:HASH_LEN]
+    return basedir / recorder_type / (appmap_fname + suffix)
+
+
 def write_appmap(
     appmap, appmap_fname, recorder_type, metadata=None, basedir=Env.current.output_dir
 ):
     """Write an appmap file into basedir.
 
-    Adds APPMAP_SUFFIX to basename; shortens the name if necessary.
-    Atomically replaces existing files. Creates the basedir if required.
+    The file is named by appmap_file_path. Atomically replaces existing files. Creates the basedir
+    if required.
     """
 
-    if len(appmap_fname) > NAME_MAX - len(APPMAP_SUFFIX):
-        part = NAME_MAX - len(APPMAP_SUFFIX) - 1 - HASH_LEN
-        appmap_fname = appmap_fname[:part] + "-" + name_hash(appmap_fname[part:])[:HASH_LEN]
-    filename = appmap_fname + APPMAP_SUFFIX
-
-    basedir = basedir / recorder_type
+    binary_format = _binary_format()
+    gzip_level = _gzip_level()
+    appmap_file = appmap_file_path(appmap_fname, recorder_type, basedir)
+    basedir = appmap_file.parent
     basedir.mkdir(parents=True, exist_ok=True)
 
-    with NamedTemporaryFile(mode="w", dir=basedir, delete=False) as tmp:
-        tmp.write(generation.dump(appmap, metadata))
-    appmap_file = basedir / filename
+    tmp_name = None
+    try:
+        if gzip_level is None and not binary_format:
+            with NamedTemporaryFile(mode="w", dir=basedir, delete=False) as tmp:
+                tmp_name = tmp.name
+                generation.write(appmap, tmp, metadata)
+        else:
+            with NamedTemporaryFile(
+                mode="wb", dir=basedir, delete=False
+            ) as tmp, ExitStack() as stack:
+                tmp_name = tmp.name
+                f = tmp
+                if gzip_level is not None:
+                    # Compress the AppMap as it's written, rather than compressing the file
+                    # afterwards.
+                    f = stack.enter_context(
+                        gzip.GzipFile(
+                            filename=appmap_file.name[: -len(GZIP_SUFFIX)],
+                            mode="wb",
+                            compresslevel=gzip_level,
+                            fileobj=tmp,
+                        )
+                    )
+                if binary_format:
+                    binary.write(appmap, f, metadata)
+                else:
+                    f = stack.enter_context(io.TextIOWrapper(f, encoding="utf-8"))
+                    generation.write(appmap, f, metadata)
+    except BaseException:
+        # Don't leave a partial file behind.
+        if tmp_name is not None:
+            with suppress(OSError):
+                os.remove(tmp_name)
+        raise
     logger.info("writing %s", appmap_file)
-    os.replace(tmp.name, appmap_file)
+    os.replace(tmp_name, appmap_file)
+    return appmap_file
+
+
+def write_process_appmap(rec, recorder_name="process", name_suffix=""):
+    now = datetime.now(timezone.utc)
+    iso_time = now.isoformat(timespec="seconds").replace("+00:00", "Z")
+    process_id = os.getpid()
+    appmap_name = f"{iso_time}-{process_id}{name_suffix}".replace(":", "-")
+    recorder_type = "process"
+    metadata = {
+        "name": appmap_name,
+        "recorder": {
+            "name": recorder_name,
+            "type": recorder_type,
+        },
+    }
+    return write_appmap(rec, appmap_name, recorder_type, metadata)
+
+
+_flight_recording_count = itertools.count(1)
+
+
+def _write_flight_recording(events, reason):
+    rec = Recording()
+    rec.events = events
+    # Several recordings may be written in the same second, so number them.
+    name_suffix = f"-{reason}-{next(_flight_recording_count)}"
+    return write_process_appmap(rec, recorder_name="flight_recorder", name_suffix=name_suffix)
 
 
 def initialize():
     if Env.current.enables("process", Env.RECORD_PROCESS_DEFAULT):
         r = Recording()
         r.start()
+        # A process recording can run for a very long time. Either keep only its most recent events,
+        # or keep its events on disk, rather than in memory.
+        ring = flight_recorder.ring_from_env()
+        if ring is not None:
+            Recorder.get_global().clear(events=ring)
+            flight_recorder.install(_write_flight_recording)
+        elif Env.current.get("APPMAP_SPILL_EVENTS", "false").lower() == "true":
+            Recorder.get_global().clear(events=SpilledEvents())
 
         def save_at_exit():
             nonlocal r
             r.stop()
-            now = datetime.now(timezone.utc)
-            iso_time = now.isoformat(timespec="seconds").replace("+00:00", "Z")
-            process_id = os.getpid()
-            appmap_name = f"{iso_time}-{process_id}".replace(":","-")
-            recorder_type = "process"
-            metadata = {
-                "name": appmap_name,
-                "recorder": {
-                    "name": "process",
-                    "type": recorder_type,
-                },
-            }
-            write_appmap(r, appmap_name, recorder_type, metadata)
+            try:
+                write_process_appmap(r, "flight_recorder" if ring is not None else "process")
+            finally:
+                # Remove the segment file the events were spilled to, if there is one.
+                if isinstance(r.events, SpilledEvents):
+                    r.events.close()
 
         atexit.register(save_at_exit)
@@ -32,8 +32,11 @@ def stop():
     with _enabled_lock:
         if not _enabled:
             return "No recording is in progress", 404
-        r = Recorder.get_global()
-        r.stop_recording()
+        # recording depends (indirectly) on this module
+        from .recording import Recording  # pylint: disable=import-outside-toplevel
+
+        r = Recording()
+        r.events = Recorder.get_global().stop_recording()
         _enabled = False
         return generation.dump(r), 200
 
@@ -0,0 +1,127 @@
+"""
+Render the reprs of values, truncated to a limit without rendering the whole value if it can be
+helped.
+"""
+
+from array import array
+from collections import deque
+from functools import lru_cache
+
+TRUNCATION_MARKER = "… (%d more)"
+
+# The containers whose reprs are rendered element by element. A subclass of one of them is too, as
+# long as it doesn't override __repr__. Its elements are taken using the methods of the class it
+# inherits __repr__ from, so a subclass's own __iter__ and items can't change them.
+_CONTAINER_CLASSES = (list, tuple, dict, set, frozenset, deque, array)
+
+# The brackets around the elements of each container. The reprs of sets other than set itself, and
+# of deques, have the name of their class before them too.
+_BRACKETS = {
+    list: ("[", "]"),
+    tuple: ("(", ")"),
+    dict: ("{", "}"),
+    set: ("{", "}"),
+    frozenset: ("{", "}"),
+    deque: ("[", "]"),
+}
+
+
+@lru_cache(maxsize=4096)
+def _container_class(val_type):
+    """Return the container class val_type inherits its repr from, or None if there isn't one."""
+    val_repr = val_type.__repr__
+    for cls in _CONTAINER_CLASSES:
+        if val_repr is cls.__repr__:
+            return cls
+    return None
+
+
+def _brackets(val, cls):
+    """Return the text that goes before and after the elements in the repr of val."""
+    val_type = type(val)
+    if cls in (list, tuple, dict) or val_type is set:
+        return _BRACKETS[cls]
+    name = val_type.__name__
+    if cls is array:
+        return f"{name}({val.typecode!r}, [", "])"
+    if cls is deque and val.maxlen is not None:
+        return f"{name}([", f"], maxlen={val.maxlen})"
+    open_bracket, close_bracket = _BRACKETS[cls]
+    return f"{name}({open_bracket}", f"{close_bracket})"
+
+
+def _truncate(text, limit):
+    length = len(text)
+    if length <= limit:
+        return text, None
+    return text[:limit] + TRUNCATION_MARKER % (length - limit), length
+
+
+def _limited_elements(val, cls, limit, active):
+    """
+    Return the reprs of the elements of the container val that fit within limit, and the number of
+    elements val has.
+    """
+    parts = []
+    used = 0
+    # pylint: disable-next=unnecessary-dunder-call
+    elts = dict.items(val) if cls is dict else cls.__iter__(val)
+    for elt in elts:
+        if used >= limit:
+            break
+        if cls is dict:
+            key = _limited_repr(elt[0], limit - used, active)[0]
+            value = _limited_repr(elt[1], max(limit - used - len(key) - 2, 0), active)[0]
+            part = f"{key}: {value}"
+        else:
+            part = _limited_repr(elt, limit - used, active)[0]
+        parts.append(part)
+        used += len(part) + 2
+    return parts, cls.__len__(val)  # pylint: disable=unnecessary-dunder-call
+
+
+def _limited_repr(val, limit, active):
+    """
+    Return repr(val) if it's no longer than limit. Otherwise, return a truncated version of it,
+    and the length of val.
+
+    strs and bytes are truncated to limit characters (or bytes), and containers (see
+    _CONTAINER_CLASSES) to the elements that fit within limit, so a large value doesn't have to be
+    rendered in full just to be truncated. For other values, the length is the length of their repr.
+    """
+    val_type = type(val)
+    if val_type in (str, bytes, bytearray):
+        length = len(val)
+        if length <= limit:
+            return repr(val), None
+        return repr(val[:limit]) + TRUNCATION_MARKER % (length - limit), length
+
+    cls = _container_class(val_type)
+    if cls is None or not cls.__len__(val):  # pylint: disable=unnecessary-dunder-call
+        return _truncate(repr(val), limit)
+
+    open_bracket, close_bracket = _brackets(val, cls)
+    if id(val) in active:
+        # val contains itself.
+        return open_bracket + "..." + close_bracket, None
+
+    active.add(id(val))
+    try:
+        parts, length = _limited_elements(val, cls, limit, active)
+    finally:
+        active.discard(id(val))
+
+    truncated = len(parts) < length
+    if truncated:
+        parts.append(TRUNCATION_MARKER % (length - len(parts)))
+    elif cls is tuple and length == 1:
+        parts[0] += ","
+    return open_bracket + ", ".join(parts) + close_bracket, length if truncated else None
+
+
+def limited_repr(val, limit):
+    """
+    Return repr(val) if it's no longer than (about) limit, and None. Otherwise, return a truncated
+    version of it, and the length of val.
+    """
+    return _limited_repr(val, limit, set())
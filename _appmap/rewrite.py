@@ -0,0 +1,430 @@
+"""
+Instrumentation that rewrites the source of modules as they're imported, in the spirit of pytest's
+assertion rewriting.
+
+When APPMAP_INSTRUMENTATION is "rewrite", modules that may have something instrumented in them are
+loaded by a RewritingLoader. It rewrites each function defined in the module, or in a class in the
+module, so that it starts by looking up its site, an entry in the module's __appmap_sites__. If the
+site is set, the function calls its enter method. Each return statement stores the value it's
+returning with result_, and the function reports how it exited to return_ (or raise_):
+
+    def fn(self, x):
+        __appmap_call__ = __appmap_sites__[3]
+        if __appmap_call__ is not None:
+            __appmap_call__ = __appmap_call__.enter()
+        try:
+            ...
+            return x if __appmap_call__ is None else __appmap_result__(__appmap_call__, x)
+        except BaseException:
+            if __appmap_call__ is not None:
+                __appmap_raise__(__appmap_call__)
+            raise
+        finally:
+            if __appmap_call__ is not None:
+                __appmap_return__(__appmap_call__)
+
+The return is only recorded when the function exits, after the finally clauses of its own try
+statements have run. If one of them raises, the exception is recorded instead. If one of them
+returns a different value, that value is recorded.
+
+The site, and then the call in progress, are held in the local __appmap_call__, so it shows up in
+the function's locals() and frame.f_locals (e.g. in a debugger, or in a Django view that passes
+locals() to render). It's never recorded as a parameter, and a function that already uses the name
+isn't rewritten.
+
+The Importer still decides which functions are instrumented. When it instruments a rewritten
+function, the function is left in place and its site is set, rather than being wrapped. Functions
+that aren't rewritten (generators, coroutines, functions defined inside other functions, and the
+wrappers made by decorators) are wrapped as usual.
+
+The rewritten code doesn't depend on the configuration, only on the source, so it's cached next to
+the usual bytecode, in a .pyc tagged with this module's format version.
+"""
+
+import ast
+import copy
+import importlib.machinery
+import importlib.util
+import marshal
+import os
+import struct
+import sys
+import time
+from tempfile import NamedTemporaryFile
+
+from . import event, instrument
+from .env import Env
+from .recorder import AppMapLimitExceeded, Recorder
+from .utils import appmap_tls
+
+logger = Env.current.getLogger(__name__)
+
+# Change this when the rewritten code changes.
+_FORMAT_VERSION = 3
+
+# The header of a cached .pyc: the magic number, and the mtime and size of the source.
+_HEADER = struct.Struct("<4sqq")
+
+_CALL = "__appmap_call__"
+_SITES = "__appmap_sites__"
+_SITE_INDEX = "__appmap_site_index__"
+_RESULT = "__appmap_result__"
+_RETURN = "__appmap_return__"
+_RAISE = "__appmap_raise__"
+
+_MODULE_PROLOGUE = f"""\
+from _appmap.rewrite import raise_ as {_RAISE}, result_ as {_RESULT}, return_ as {_RETURN}
+{_SITES} = [None] * {{count}}
+{_SITE_INDEX} = {{index!r}}
+"""
+
+_FUNCTION_TEMPLATE = f"""\
+def _():
+    {_CALL} = {_SITES}[{{index}}]
+    if {_CALL} is not None:
+        {_CALL} = {_CALL}.enter()
+    try:
+        pass
+    except BaseException:
+        if {_CALL} is not None:
+            {_RAISE}({_CALL})
+        raise
+    finally:
+        if {_CALL} is not None:
+            {_RETURN}({_CALL})
+"""
+
+
+def enabled():
+    """Return True if modules should be rewritten as they're imported."""
+    return Env.current.get("APPMAP_INSTRUMENTATION", "wrapper").lower() == "rewrite"
+
+
+class Site:  # pylint: disable=too-few-public-methods
+    """What's needed to record the calls to a rewritten function that's been instrumented."""
+
+    __slots__ = ["make_call_event", "params", "display_params", "schema", "shallow"]
+
+    def __init__(
+        self, make_call_event, params, display_params, schema, shallow
+    ):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+        self.make_call_event = make_call_event
+        self.params = params
+        self.display_params = display_params
+        self.schema = schema
+        self.shallow = shallow
+
+    def enter(self):
+        """
+        Start a call to the function. Returns the _Call to pass to return_ or raise_, or None if
+        nothing's being recorded.
+        """
+        if not Recorder._active_recorders:  # pylint: disable=protected-access
+            return None
+
+        call = _Call(self, appmap_tls().get("last_rule", None))
+        if (
+            (not Recorder.get_enabled())
+            or instrument.is_instrumentation_disabled()
+            or instrument.track_shallow_rule(self.shallow)
+        ):
+            return call
+
+        frame_locals = sys._getframe(1).f_locals  # pylint: disable=protected-access
+        with instrument.recording_disabled():
+            params = self.params.bind_locals(frame_locals, self.display_params, self.schema)
+            call_event = self.make_call_event(parameters=params)
+        Recorder.add_event(call_event)
+        call.event_id = call_event.id
+        call.start_time = time.time()
+        try:
+            Recorder.check_time(call.start_time)
+        except AppMapLimitExceeded:
+            appmap_tls()["last_rule"] = call.last_rule
+            raise
+        return call
+
+
+class _Call:  # pylint: disable=too-few-public-methods
+    __slots__ = ["site", "last_rule", "event_id", "start_time", "value"]
+
+    def __init__(self, site, last_rule):
+        self.site = site
+        self.last_rule = last_rule
+        self.event_id = None
+        self.start_time = None
+        self.value = None
+
+
+def result_(call, value):
+    """Store value, which call is returning, until it exits. Returns value."""
+    call.value = value
+    return value
+
+
+def return_(call):
+    """Finish call, which returned the value last stored by result_, if it didn't raise."""
+    appmap_tls()["last_rule"] = call.last_rule
+    call_event_id = call.event_id
+    if call_event_id is not None:
+        call.event_id = None
+        site = call.site
+        Recorder.add_event(
+            event.FuncReturnEvent(
+                return_value=call.value,
+                parent_id=call_event_id,
+                elapsed=time.time() - call.start_time,
+                display_value=site.display_params,
+                schema=site.schema,
+            )
+        )
+
+
+def raise_(call):
+    """Finish call, which is raising the exception being handled."""
+    appmap_tls()["last_rule"] = call.last_rule
+    call_event_id = call.event_id
+    # Nothing else gets recorded for the call, including the return when the function exits.
+    call.event_id = None
+    exc_info = sys.exc_info()
+    if call_event_id is None or isinstance(exc_info[1], AppMapLimitExceeded):
+        return
+    Recorder.add_event(
+        event.ExceptionEvent(
+            parent_id=call_event_id, elapsed=time.time() - call.start_time, exc_info=exc_info
+        )
+    )
+
+
+def _site(fn):
+    """Return the sites of fn's module, and the index of its site, if fn was rewritten."""
+    fn = getattr(fn, "__func__", fn)
+    if not event._is_plain_function(fn):  # pylint: disable=protected-access
+        return None
+    fn_globals = fn.__globals__
+    index = fn_globals.get(_SITE_INDEX)
+    if index is None:
+        return None
+    code = fn.__code__
+    i = index.get((code.co_firstlineno, code.co_name))
+    # If the module was reloaded without being rewritten, its globals still have the index, but its
+    # functions don't use their sites.
+    if i is None or code.co_filename != fn_globals.get("__file__") or _SITES not in code.co_names:
+        return None
+    return fn_globals[_SITES], i
+
+
+def site_of(filterable):
+    """
+    Return the site of the function filterable, if it was rewritten, as (the sites of its module,
+    the index of its site). Returns None if it should be wrapped instead.
+    """
+    return _site(filterable.static_fn)
+
+
+def is_registered(fn):
+    site = _site(fn)
+    return site is not None and site[0][site[1]] is not None
+
+
+def register(
+    site, make_call_event, params, display_params, schema, shallow
+):  # pylint: disable=too-many-arguments,too-many-positional-arguments
+    """Start recording the calls to the rewritten function whose site is site."""
+    sites, i = site
+    if sites[i] is None:
+        sites[i] = Site(make_call_event, params, display_params, schema, shallow)
+
+
+def _set_location(nodes, location):
+    for node in nodes:
+        for n in ast.walk(node):
+            if "lineno" in n._attributes:  # pylint: disable=protected-access
+                ast.copy_location(n, location)
+
+
+def _is_scope(node):
+    return isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef))
+
+
+def _walk_body(nodes):
+    """Walk the nodes in a function's body, without going into nested scopes."""
+    todo = [n for n in nodes if not _is_scope(n)]
+    while todo:
+        node = todo.pop()
+        yield node
+        todo.extend(c for c in ast.iter_child_nodes(node) if not _is_scope(c))
+
+
+def _uses_call_local(node):
+    """Return True if the function node already has a parameter, or local, named _CALL."""
+    args = node.args
+    params = args.posonlyargs + args.args + args.kwonlyargs + [args.vararg, args.kwarg]
+    return any(a is not None and a.arg == _CALL for a in params) or any(
+        isinstance(n, ast.Name) and n.id == _CALL for n in _walk_body(node.body)
+    )
+
+
+class _ReturnRewriter(ast.NodeTransformer):
+    def visit_Return(self, node):  # pylint: disable=invalid-name
+        def located(new_node):
+            return ast.copy_location(new_node, node)
+
+        value = node.value if node.value is not None else located(ast.Constant(None))
+        node.value = located(
+            ast.IfExp(
+                test=located(
+                    ast.Compare(
+                        located(ast.Name(_CALL, ast.Load())),
+                        [ast.Is()],
+                        [located(ast.Constant(None))],
+                    )
+                ),
+                body=value,
+                orelse=located(
+                    ast.Call(
+                        located(ast.Name(_RESULT, ast.Load())),
+                        [located(ast.Name(_CALL, ast.Load())), copy.deepcopy(value)],
+                        [],
+                    )
+                ),
+            )
+        )
+        return node
+
+    def generic_visit(self, node):
+        # Don't rewrite the returns of nested functions.
+        for child in ast.iter_child_nodes(node):
+            if not _is_scope(child):
+                self.visit(child)
+        return node
+
+
+class _Rewriter(ast.NodeTransformer):
+    def __init__(self):
+        # The index of each function's site, by its (first line number, name).
+        self.index = {}
+
+    def visit_FunctionDef(self, node):  # pylint: disable=invalid-name
+        if any(isinstance(n, (ast.Yield, ast.YieldFrom)) for n in _walk_body(node.body)):
+            return node
+        if _uses_call_local(node):
+            return node
+
+        i = len(self.index)
+        # This is the co_firstlineno of the function's code.
+        lineno = min([node.lineno] + [d.lineno for d in node.decorator_list])
+        self.index[(lineno, node.name)] = i
+
+        body = node.body
+        docstring = []
+        if (
+            isinstance(body[0], ast.Expr)
+            and isinstance(body[0].value, ast.Constant)
+            and isinstance(body[0].value.value, str)
+        ):
+            docstring, body = body[:1], body[1:] or [ast.Pass()]
+        returns = _ReturnRewriter()
+        for stmt in body:
+            if not _is_scope(stmt):
+                returns.visit(stmt)
+
+        template = ast.parse(_FUNCTION_TEMPLATE.format(index=i)).body[0].body
+        _set_location(template, node)
+        template[2].body = body
+        node.body = docstring + template
+        return node
+
+    def visit_AsyncFunctionDef(self, node):  # pylint: disable=invalid-name
+        return node
+
+    def visit_Lambda(self, node):  # pylint: disable=invalid-name
+        return node
+
+
+def rewrite(tree):
+    """Rewrite the functions in tree, the AST of a module. Returns the number rewritten."""
+    rewriter = _Rewriter()
+    rewriter.visit(tree)
+    if not rewriter.index:
+        return 0
+
+    # The prologue goes after the docstring and any __future__ imports.
+    pos = 0
+    body = tree.body
+    if (
+        body
+        and isinstance(body[0], ast.Expr)
+        and isinstance(body[0].value, ast.Constant)
+        and isinstance(body[0].value.value, str)
+    ):
+        pos = 1
+    while (
+        pos < len(body)
+        and isinstance(body[pos], ast.ImportFrom)
+        and body[pos].module == "__future__"
+    ):
+        pos += 1
+    prologue = ast.parse(
+        _MODULE_PROLOGUE.format(count=len(rewriter.index), index=rewriter.index)
+    ).body
+    _set_location(prologue, body[pos] if pos < len(body) else body[-1])
+    body[pos:pos] = prologue
+    ast.fix_missing_locations(tree)
+    return len(rewriter.index)
+
+
+def cache_path(source_path):
+    """Return the path of the .pyc the rewritten code for source_path is cached in."""
+    head, tail = os.path.split(source_path)
+    stem = tail.rpartition(".")[0]
+    tag = f"{sys.implementation.cache_tag}-appmap-{_FORMAT_VERSION}"
+    return os.path.join(head, "__pycache__", f"{stem}.{tag}.pyc")
+
+
+def _read_cache(path, stamp):
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+    except OSError:
+        return None
+    if len(data) < _HEADER.size:
+        return None
+    magic, mtime_ns, size = _HEADER.unpack_from(data)
+    if magic != importlib.util.MAGIC_NUMBER or (mtime_ns, size) != stamp:
+        return None
+    try:
+        return marshal.loads(data[_HEADER.size :])
+    except (EOFError, ValueError, TypeError):
+        return None
+
+
+def _write_cache(path, stamp, code):
+    try:
+        cache_dir = os.path.dirname(path)
+        os.makedirs(cache_dir, exist_ok=True)
+        with NamedTemporaryFile(mode="wb", dir=cache_dir, delete=False) as tmp:
+            tmp.write(_HEADER.pack(importlib.util.MAGIC_NUMBER, *stamp))
+            marshal.dump(code, tmp)
+        os.replace(tmp.name, path)
+    except OSError:
+        logger.debug("failed to cache rewritten code in %s", path, exc_info=True)
+
+
+class RewritingLoader(importlib.machinery.SourceFileLoader):
+    """A loader for source files, that rewrites their functions, and caches the result."""
+
+    def get_code(self, fullname):
+        source_path = self.get_filename(fullname)
+        st = os.stat(source_path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        pyc = cache_path(source_path)
+        code = _read_cache(pyc, stamp)
+        if code is None:
+            tree = ast.parse(self.get_data(source_path), source_path)
+            count = rewrite(tree)
+            logger.debug("rewrote %d functions in %s", count, source_path)
+            code = compile(tree, source_path, "exec", dont_inherit=True)
+            if not sys.dont_write_bytecode:
+                _write_cache(pyc, stamp, code)
+        return code
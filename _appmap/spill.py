@@ -0,0 +1,184 @@
+"""Spill the events of long recordings to disk"""
+
+import json
+import shutil
+import threading
+from collections import deque
+from itertools import islice
+from tempfile import TemporaryFile
+
+from . import generation
+from .env import Env
+
+logger = Env.current.getLogger(__name__)
+
+_DEFAULT_BATCH_SIZE = 1000
+
+
+def _batched(iterable, n):
+    it = iter(iterable)
+    while batch := list(islice(it, n)):
+        yield batch
+
+
+class _Segment:
+    """
+    The temporary file the events of a SpilledEvents are serialized to, one line per batch. It's
+    opened lazily, so short recordings never touch the disk.
+    """
+
+    def __init__(self):
+        self._file = None
+        self.spilled = 0
+        self.lock = threading.Lock()
+        self._serializer = generation.EventSerializer()
+
+    def write(self, batch):
+        if self._file is None:
+            self._file = TemporaryFile(mode="w+", encoding="utf-8")
+
+        prefix = ", " if self.spilled else ""
+        # The JSON for an event has no newlines in it, so each batch can be read back by itself.
+        self._file.write(prefix + self._serializer.encode(batch) + "\n")
+        self.spilled += len(batch)
+        logger.debug("spilled %d events, %d total", len(batch), self.spilled)
+
+    def copy_to(self, f):
+        if self._file is None:
+            return
+
+        self._file.seek(0)
+        shutil.copyfileobj(self._file, f)
+        self._file.seek(0, 2)
+
+    def batches(self):
+        if self._file is None:
+            return
+
+        self._file.seek(0)
+        try:
+            for line in self._file:
+                line = line.strip().lstrip(",")
+                if line:
+                    yield json.loads("[" + line + "]")
+        finally:
+            self._file.seek(0, 2)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class SpilledEvents:
+    """
+    A replacement for the list of events held by a Recorder, for recordings that may run for a long
+    time (e.g. a process recording).
+
+    Events are collected into batches. When a batch is full, each of its events is serialized to a
+    temporary segment file, one line per batch, and the function it called is added to the classmap.
+    Only the classmap and the current batch are kept in memory.
+
+    append only queues a batch when it's full. The batch isn't serialized until spill is called, so
+    a SharedRecorder can do that after it releases its lock, rather than making every other thread
+    that's recording wait for it.
+
+    Events that have been spilled can't be updated, so this shouldn't be used for recordings that
+    change their events after they're added (e.g. request recordings, which update the HTTP request
+    and response events).
+    """
+
+    def __init__(self, batch_size=None):
+        if batch_size is None:
+            batch_size = int(Env.current.get("APPMAP_SPILL_BATCH_SIZE", _DEFAULT_BATCH_SIZE))
+        self._batch_size = batch_size
+        self._batch = []
+        self._full = deque()
+        self._count = 0
+        self._segment = _Segment()
+        self.classmap = generation.ClassMap()
+
+    def append(self, event):
+        self._batch.append(event)
+        self._count += 1
+        if len(self._batch) >= self._batch_size:
+            self._full.append(self._batch)
+            self._batch = []
+
+    def extend(self, events):
+        # A store that has a classmap of its own (e.g. another SpilledEvents, or a ColumnarEvents)
+        # may produce dicts when it's iterated, so spill its events as they are, and merge its
+        # classmap.
+        if isinstance(events, SpilledEvents):
+            batches = events.event_dicts()
+        elif getattr(events, "classmap", None) is not None:
+            batches = _batched(events, self._batch_size)
+        else:
+            for e in events:
+                self.append(e)
+            self.spill()
+            return
+
+        self.flush()
+        with self._segment.lock:
+            self.classmap.update(events.classmap)
+            for batch in batches:
+                self._segment.write(batch)
+                self._count += len(batch)
+
+    def __iadd__(self, events):
+        self.extend(events)
+        return self
+
+    def __len__(self):
+        return self._count
+
+    def __bool__(self):
+        return self._count > 0
+
+    def __iter__(self):
+        # Like ColumnarEvents, this produces a dict for each event.
+        for batch in self.event_dicts():
+            yield from batch
+
+    def flush(self):
+        """Spill all the events, including those in the current batch, to the segment file."""
+        if self._batch:
+            self._full.append(self._batch)
+            self._batch = []
+        self.spill()
+
+    def spill(self):
+        """Spill the batches that are full to the segment file."""
+        if not self._full:
+            return
+
+        # The batches are taken in the order they filled up, so they're written in that order too.
+        with self._segment.lock:
+            while self._full:
+                batch = self._full.popleft()
+                for e in batch:
+                    self.classmap.add(e)
+                self._segment.write(batch)
+
+    def write_events(self, f):
+        """
+        Write all the events to f, as the members of a JSON array (without the enclosing brackets).
+        """
+        self.flush()
+        self._segment.copy_to(f)
+
+    def event_dicts(self):
+        """
+        Yield the events a batch at a time, as lists of the dicts they were serialized from, e.g.
+        to write them in another format.
+        """
+        self.flush()
+        yield from self._segment.batches()
+
+    def close(self):
+        """Remove the segment file."""
+        self._segment.close()
+
+    def __repr__(self):
+        return f"<SpilledEvents count: {self._count} spilled: {self._segment.spilled}>"
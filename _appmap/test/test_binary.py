@@ -0,0 +1,151 @@
+"""Test the binary AppMap format, and converting it to JSON."""
+# pylint: disable=missing-function-docstring
+
+import io
+import json
+from enum import Enum
+from http import HTTPStatus
+
+import pytest
+
+import appmap
+from _appmap import binary, generation, recording
+from _appmap.env import Env
+from _appmap.spill import SpilledEvents
+from appmap.command import appmap_convert
+
+
+def _without_elapsed(appmap_dict):
+    elapsed = [e.pop("elapsed", None) for e in appmap_dict["events"]]
+    return appmap_dict, elapsed
+
+
+@pytest.fixture(name="example_recording")
+def _example_recording(with_data_dir):  # pylint: disable=unused-argument
+    # pylint: disable=import-outside-toplevel,import-error
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    r = appmap.Recording()
+    with r:
+        ExampleClass().instance_with_param({"a": [1, -2, 2.5, None, True, "é"], 3: "x"})
+        ExampleClass.class_method()
+        try:
+            ExampleClass().test_exception()
+        except Exception:  # pylint: disable=broad-except
+            pass
+    return r
+
+
+@pytest.mark.appmap_enabled
+def test_convert_matches_json(example_recording):
+    metadata = {"name": "test"}
+    f = io.BytesIO()
+    binary.write(example_recording, f, metadata)
+    f.seek(0)
+    out = io.StringIO()
+    binary.convert(f, out)
+
+    actual, actual_elapsed = _without_elapsed(json.loads(out.getvalue()))
+    expected, expected_elapsed = _without_elapsed(
+        json.loads(generation.dump(example_recording, metadata))
+    )
+    assert actual == expected
+    assert actual_elapsed == pytest.approx(expected_elapsed, abs=1e-9)
+
+
+@pytest.mark.appmap_enabled
+def test_strings_interned(example_recording):
+    f = io.BytesIO()
+    example_recording.events = list(example_recording.events) * 10
+    binary.write(example_recording, f)
+    # once for the events, once for the classMap
+    assert f.getvalue().count(b"instance_with_param") == 2
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_FORMAT": "binary", "APPMAP_GZIP": "true"})
+def test_write_appmap_and_convert(example_recording, tmp_path, capsys):
+    binary_file = recording.write_appmap(example_recording, "foo", "test", None, tmp_path)
+    assert binary_file == tmp_path / "test" / "foo.appmap.bin.gz"
+
+    assert appmap_convert._run([str(binary_file)]) == 0  # pylint: disable=protected-access
+    json_file = tmp_path / "test" / "foo.appmap.json"
+    assert capsys.readouterr().out.strip() == str(json_file)
+
+    Env.current.set("APPMAP_FORMAT", "json")
+    Env.current.set("APPMAP_GZIP", "false")
+    expected, _ = _without_elapsed(json.loads(generation.dump(example_recording)))
+    actual, _ = _without_elapsed(json.loads(json_file.read_text()))
+    assert actual == expected
+
+
+class _Color(str, Enum):
+    RED = "red"
+
+
+def test_subclasses_written_as_json_would_be():
+    value = {"color": _Color.RED, "status": HTTPStatus.OK, "bytes": b"ab", "pi": 3.5}
+    body = binary._Encoder().batch([value])  # pylint: disable=protected-access
+    decoded = binary._Decoder().batch(body)  # pylint: disable=protected-access
+    assert decoded == [json.loads(generation.json_encoder()(value))]
+    assert decoded[0]["status"] == 200
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_FORMAT": "binary"})
+def test_write_spilled_events(example_recording, tmp_path):
+    expected, _ = _without_elapsed(json.loads(generation.dump(example_recording)))
+
+    spilled = SpilledEvents(batch_size=2)
+    for e in example_recording.events:
+        spilled.append(e)
+    example_recording.events = spilled
+    binary_file = recording.write_appmap(example_recording, "foo", "test", None, tmp_path)
+
+    out = io.StringIO()
+    with open(binary_file, "rb") as f:
+        binary.convert(f, out)
+    actual, _ = _without_elapsed(json.loads(out.getvalue()))
+    assert actual == expected
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_FORMAT": "binary"})
+def test_failed_write_removed(example_recording, tmp_path, monkeypatch):
+    def fail(*_):
+        raise ValueError("failed")
+
+    monkeypatch.setattr(binary, "write", fail)
+    with pytest.raises(ValueError):
+        recording.write_appmap(example_recording, "foo", "test", None, tmp_path)
+    assert not list((tmp_path / "test").iterdir())
+
+
+def test_convert_rejects_other_files(tmp_path, capsys):
+    not_binary = tmp_path / "foo.appmap.bin"
+    not_binary.write_text("{}")
+    assert appmap_convert._run([str(not_binary)]) == 1  # pylint: disable=protected-access
+    assert "not a binary AppMap" in capsys.readouterr().err
+    assert not (tmp_path / "foo.appmap.json").exists()
+
+
+@pytest.mark.appmap_enabled
+def test_convert_rejects_damaged_files(example_recording):
+    f = io.BytesIO()
+    binary.write(example_recording, f)
+    data = f.getvalue()
+
+    def convert(damaged):
+        try:
+            binary.convert(io.BytesIO(damaged), io.StringIO())
+        except binary.BinaryFormatError:
+            pass
+
+    # Nothing but a BinaryFormatError gets raised, wherever the file is cut short or corrupted.
+    for i in range(len(binary.MAGIC), len(data)):
+        convert(data[:i])
+        convert(data[:i] + bytes([data[i] ^ 0xFF]) + data[i + 1 :])
+
+
+def test_convert_reports_truncated_files(tmp_path, capsys):
+    truncated = tmp_path / "foo.appmap.bin"
+    truncated.write_bytes(binary.MAGIC + bytes([binary.EVENTS, 10, binary.STRING]))
+    assert appmap_convert._run([str(truncated)]) == 1  # pylint: disable=protected-access
+    assert "truncated record" in capsys.readouterr().err
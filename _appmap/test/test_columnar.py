@@ -0,0 +1,82 @@
+"""Test the columnar event store."""
+# pylint: disable=missing-function-docstring, import-outside-toplevel
+
+import json
+import os
+
+import pytest
+
+import appmap
+from _appmap.columnar import ColumnarEvents
+from _appmap.generation import AppMapEncoder
+
+from .normalize import normalize_appmap, remove_line_numbers
+
+
+def _record_example():
+    from example_class import (  # pyright: ignore[reportMissingImports] pylint: disable=import-error
+        ExampleClass,
+    )
+
+    r = appmap.Recording()
+    with r:
+        ExampleClass.static_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+        ExampleClass.what_time_is_it()
+        try:
+            ExampleClass().test_exception()
+        except:  # pylint: disable=bare-except  # noqa: E722
+            pass
+        ExampleClass.call_yaml()
+    return r
+
+
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+def test_columnar_matches_events():
+    r = _record_example()
+    expected_events = json.dumps(r.events, cls=AppMapEncoder)
+    expected_classmap = json.loads(appmap.generation.dump(r))["classMap"]
+
+    columnar = ColumnarEvents()
+    for e in r.events:
+        columnar.append(e)
+    assert len(columnar) == len(r.events)
+
+    r.events = columnar
+    assert json.dumps(list(columnar), cls=AppMapEncoder) == expected_events
+    assert json.loads(appmap.generation.dump(r))["classMap"] == expected_classmap
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_EVENT_STORE": "columnar"})
+@pytest.mark.usefixtures("with_data_dir")
+def test_columnar_recording(with_data_dir):
+    expected_path = os.path.join(with_data_dir, "expected.appmap.json")
+    with open(expected_path, encoding="utf-8") as f:
+        expected_appmap = json.load(f)
+
+    r = _record_example()
+    assert isinstance(r.events, ColumnarEvents)
+
+    generated_appmap = normalize_appmap(appmap.generation.dump(r))
+    assert remove_line_numbers(generated_appmap) == expected_appmap
+
+
+def test_only_names_and_classes_interned():
+    def copy(s):
+        # An equal string that isn't the same object.
+        return (s + ".")[:-1]
+
+    columnar = ColumnarEvents()
+    # pylint: disable=protected-access
+    first = columnar._compact({"name": "total", "class": "builtins.str", "value": "'abc'"})
+    second = columnar._compact(
+        {"name": copy("total"), "class": copy("builtins.str"), "value": copy("'abc'")}
+    )
+    assert first[0] is second[0]
+    name, class_, value = second[1]
+    assert name is first[1][0]
+    assert class_ is first[1][1]
+    assert value == first[1][2]
+    assert value is not first[1][2]
@@ -1,6 +1,7 @@
 """Test Configuration"""
 # pylint: disable=missing-function-docstring
 
+import inspect
 from contextlib import contextmanager
 from shutil import copytree
 from pathlib import Path
@@ -11,9 +12,11 @@ import yaml
 
 import _appmap
 import appmap
-from _appmap.configuration import Config, ConfigFilter
+from _appmap.configuration import Config, ConfigFilter, DistMatcher, MatcherTrie, PathMatcher
 from _appmap.env import Env
-from _appmap.importer import Filterable, NullFilter
+from _appmap.event import SchemaLimits
+from _appmap.importer import Filterable, FilterableFn, FilterableMod, NullFilter
+from _appmap.instrument import plain_wrapper
 
 
 @pytest.mark.appmap_enabled
@@ -101,6 +104,58 @@ def test_function_included_by_class():
     assert cf().filter(f) is True
 
 
+@pytest.mark.appmap_enabled(config="appmap-schema.yml")
+def test_schema_limits_per_package():
+    assert Config.current.schema == SchemaLimits(max_depth=5, max_items=3)
+    example_class, package1 = cf().matchers
+    assert example_class.schema == SchemaLimits(max_depth=2, max_items=3)
+    assert package1.schema == SchemaLimits(max_depth=5, max_items=3)
+
+
+def test_trie_matching():
+    trie = MatcherTrie(
+        [
+            PathMatcher("package1.package2", ["Mod1Class.excluded"]),
+            PathMatcher("package1", ["package2.Mod1Class"]),
+            PathMatcher("package1.package2.Mod1Class.excluded"),
+            PathMatcher("package3.Cls.func"),
+        ]
+    )
+    assert trie.matching("package1.package2.Mod1Class.func") == [0]
+    assert trie.matching("package1.package2.Mod2Class") == [0, 1]
+    assert trie.matching("package1.package2.Mod1Class.excluded") == [2]
+    assert trie.matching("package1_prefix.cls") == []
+    assert trie.matching("package3.Cls") == []
+
+
+def test_trie_could_match():
+    trie = MatcherTrie(
+        [PathMatcher("package1", ["package2", "package3.excluded"]), PathMatcher("package4.Cls")]
+    )
+    assert trie.could_match("package1")
+    assert trie.could_match("package1.package3")
+    assert not trie.could_match("package1.package2")
+    assert not trie.could_match("package1.package2.mod")
+    assert not trie.could_match("package1.package3.excluded")
+    assert trie.could_match("package4")
+    assert not trie.could_match("package5")
+
+
+def test_dist_matcher():
+    matcher = DistMatcher("PyYAML", None)
+    assert matcher._files is None  # pylint: disable=protected-access
+
+    assert matcher.matches(Filterable(None, "yaml.dump", yaml.dump))
+    assert not matcher.matches(Filterable(None, "pytest.fixture", pytest.fixture))
+    assert not matcher.matches(Filterable(None, "builtins.len", len))
+    assert matcher.files
+
+    # A plain wrapper is matched by the file of the function it wraps, not its own.
+    dump = inspect.unwrap(yaml.dump)
+    wrapper = plain_wrapper(FilterableFn(FilterableMod(yaml), "dump", dump, dump), None)
+    assert matcher.matches(Filterable(None, "yaml.dump", wrapper))
+
+
 @pytest.mark.appmap_enabled
 class TestConfiguration:
     def test_package_included(self):
@@ -1,6 +1,9 @@
+from array import array
+from collections import deque
+
 import pytest
 
-from _appmap.event import describe_value
+from _appmap.event import describe_value, display_string
 from _appmap.test.helpers import DictIncluding
 
 
@@ -41,6 +44,13 @@ class TestDictValue:
         assert "builtins.dict object at" in actual["value"]
         assert actual["object_id"] == id(value)
 
+    def test_flat_properties_shared(self):
+        first = describe_value(None, {"id": 1, True: "a"}, display_value=True)
+        second = describe_value(None, {"id": 2, 1: 1.5}, display_value=True)
+        assert first["properties"][0] is second["properties"][0]
+        assert first["properties"][1] == {"name": True, "class": "builtins.str"}
+        assert second["properties"][1] == {"name": 1, "class": "builtins.float"}
+
 
 class TestNestedDictValue:
     @pytest.fixture
@@ -122,3 +132,95 @@ class TestNestedArrays:
             ],
         }
         assert actual == DictIncluding(expected)
+
+
+class TestLongList:
+    @pytest.fixture
+    def value(self):
+        return [{"id": i, "name": f"item {i}"} for i in range(1000)] + [{"id": "last"}]
+
+    def test_identical_schemas_merged(self, value):
+        actual = describe_value(None, value, display_value=True)
+        assert actual["items"] == [
+            {
+                "class": "builtins.dict",
+                "properties": [
+                    {"name": "id", "class": "builtins.int"},
+                    {"name": "name", "class": "builtins.str"},
+                ],
+            }
+        ]
+        assert actual["size"] == 1001
+
+    def test_samples_max_items(self, value):
+        actual = describe_value(None, value[-2:], display_value=True, max_items=1)
+        assert len(actual["items"]) == 1
+
+        actual = describe_value(None, value[-2:], display_value=True)
+        assert actual["items"][1] == {
+            "class": "builtins.dict",
+            "properties": [{"name": "id", "class": "builtins.str"}],
+        }
+
+
+class TestTruncation:
+    def test_short_values_unchanged(self):
+        for value in ("text", b"bytes", [1, "two", (3,)], {"a": {1, 2}}, ()):
+            expected = value if isinstance(value, str) else repr(value)
+            assert display_string(value, display_value=True, max_length=40) == expected
+
+    def test_long_str(self):
+        actual = describe_value(None, "x" * 1000, display_value=True)
+        assert "value_length" not in actual
+
+        value = "x" * 20_000
+        actual = describe_value(None, value, display_value=True)
+        assert actual["value"] == "x" * 10_000 + "… (10000 more)"
+        assert actual["value_length"] == 20_000
+
+    def test_long_bytes(self):
+        actual = display_string(b"\0" * 100, display_value=True, max_length=2)
+        assert actual == "b'\\x00\\x00'… (98 more)"
+
+    def test_long_list(self):
+        actual = display_string(list(range(1000)), display_value=True, max_length=10)
+        assert actual == "[0, 1, 2, 3, … (996 more)]"
+
+    def test_other_containers_unchanged(self):
+        class Items(list):
+            def __iter__(self):
+                raise RuntimeError("__iter__ called")
+
+        class Tags(frozenset):
+            pass
+
+        values = (Items([1, 2]), Tags({3}), deque([4], maxlen=2), array("i", [5]), {6})
+        for value in values:
+            assert display_string(value, display_value=True, max_length=40) == repr(value)
+
+    def test_long_containers(self):
+        class Items(list):
+            pass
+
+        for value, expected in (
+            (Items(range(1000)), "[0, 1, 2, 3, … (996 more)]"),
+            (deque(range(1000)), "deque([0, 1, 2, 3, … (996 more)])"),
+            (deque(range(1000), maxlen=1000), "deque([0, 1, 2, 3, … (996 more)], maxlen=1000)"),
+            (array("i", range(1000)), "array('i', [0, 1, 2, 3, … (996 more)])"),
+        ):
+            assert display_string(value, display_value=True, max_length=10) == expected
+
+    def test_nested_values_truncated(self):
+        actual = display_string({"body": "x" * 1000}, display_value=True, max_length=10)
+        assert actual == "{'body': 'xx'… (998 more)}"
+
+    def test_recursive_list(self):
+        value = [1]
+        value.append(value)
+        assert display_string(value, display_value=True, max_length=40) == repr(value)
+
+    @pytest.mark.appmap_enabled(env={"APPMAP_MAX_VALUE_LENGTH": "5"})
+    def test_configured_length(self):
+        actual = describe_value(None, "some text", display_value=True)
+        assert actual["value"] == "some … (4 more)"
+        assert actual["value_length"] == 9
@@ -0,0 +1,100 @@
+"""Tests for value describers"""
+# pylint: disable=missing-function-docstring,missing-class-docstring,too-few-public-methods
+
+from importlib.metadata import EntryPoint
+
+import pytest
+
+import appmap
+from _appmap import describers
+from _appmap.event import describe_value
+
+
+class Order:
+    def __init__(self, total):
+        self.total = total
+
+
+class SpecialOrder(Order):
+    pass
+
+
+def describe_order(val, display_value):
+    ret = {"value": f"Order total={val.total}" if display_value else "Order"}
+    if display_value:
+        ret["properties"] = [{"name": "total", "class": "builtins.int"}]
+    return ret
+
+
+@pytest.fixture(autouse=True)
+def registry(monkeypatch):
+    monkeypatch.setattr(describers, "_describers", {})
+    describers.initialize()
+    yield
+    describers.initialize()
+
+
+def test_registered_describer():
+    appmap.register_describer(Order, describe_order)
+    order = Order(42)
+    actual = describe_value("order", order, display_value=True)
+    assert actual == {
+        "name": "order",
+        "value": "Order total=42",
+        "properties": [{"name": "total", "class": "builtins.int"}],
+        "class": "_appmap.test.test_describers.Order",
+        "object_id": id(order),
+    }
+
+    actual = describe_value("order", order, display_value=False)
+    assert actual["value"] == "Order"
+    assert "properties" not in actual
+
+
+def test_subclasses_use_describer():
+    appmap.register_describer(Order, describe_order)
+    actual = describe_value(None, SpecialOrder(1), display_value=True)
+    assert actual["value"] == "Order total=1"
+    assert actual["class"] == "_appmap.test.test_describers.SpecialOrder"
+
+
+def test_resolution_is_cached(mocker):
+    appmap.register_describer(Order, describe_order)
+    describers.describer_for(SpecialOrder)
+
+    get = mocker.spy(describers, "_from_entry_point")
+    assert describers.describer_for(SpecialOrder) is describe_order
+    get.assert_not_called()
+
+
+def test_undescribed_values_unchanged():
+    appmap.register_describer(Order, describe_order)
+    actual = describe_value(None, {"id": 1}, display_value=True)
+    assert actual["value"] == "{'id': 1}"
+    assert actual["properties"] == [{"name": "id", "class": "builtins.int"}]
+
+
+def test_failing_describer(caplog):
+    def describe_badly(val, display_value):
+        raise ValueError("broken")
+
+    appmap.register_describer(Order, describe_badly)
+    order = Order(42)
+    actual = describe_value("order", order, display_value=True)
+    assert actual["name"] == "order"
+    assert actual["class"] == "_appmap.test.test_describers.Order"
+    assert actual["object_id"] == id(order)
+    assert actual["value"].startswith("<_appmap.test.test_describers.Order object at")
+    assert "describer for _appmap.test.test_describers.Order failed" in caplog.text
+
+
+def test_entry_point(mocker):
+    ep = EntryPoint(
+        name="_appmap.test.test_describers.Order",
+        value="_appmap.test.test_describers:describe_order",
+        group=describers.ENTRY_POINT_GROUP,
+    )
+    mocker.patch.object(describers, "_load_entry_points", return_value={ep.name: ep})
+
+    actual = describe_value(None, SpecialOrder(7), display_value=True)
+    assert actual["value"] == "Order total=7"
@@ -19,6 +19,7 @@ from django.test.client import MULTIPART_CONTENT
 import appmap
 import appmap.django  # noqa: F401
 from _appmap.metadata import Metadata
+from _appmap.recorder import Recorder
 
 from ..test.helpers import DictIncluding
 from .web_framework import (
@@ -173,6 +174,20 @@ def test_exception(client, events, monkeypatch):
     assert events[1].parent_id == events[0].id
 
 
+@pytest.mark.appmap_enabled
+def test_exception_stops_request_recorder(client, monkeypatch):
+    def raise_on_call(*args):
+        raise RuntimeError("An error")
+
+    monkeypatch.setattr(django.core.handlers.exception, "response_for_exception", raise_on_call)
+    monkeypatch.setattr(Recorder, "_active_recorders", 0)
+
+    with pytest.raises(RuntimeError):
+        client.get("/exception")
+
+    assert Recorder._active_recorders == 0  # pylint: disable=protected-access
+
+
 @pytest.mark.appmap_enabled(env={"APPMAP_RECORD_REQUESTS": "false"})
 def test_deeply_nested_routes(client, events):
     client.get("/admincp/permissions/edit/1")
@@ -8,6 +8,7 @@ from threading import Thread
 
 import pytest
 
+import _appmap.event
 import appmap
 from _appmap.event import _EventIds
 
@@ -173,6 +174,20 @@ class TestEvents:
         # Parameter value should be the opaque object string
         assert "object at" in call_event.parameters[0]["value"]
 
+    def test_call_events_share_function_info(self, mocker):
+        get_function_location = mocker.spy(_appmap.event, "get_function_location")
+        r = appmap.Recording()
+        with r:
+            from example_class import ExampleClass  # pylint: disable=import-outside-toplevel
+
+            ExampleClass.static_method()
+            ExampleClass.static_method()
+
+        first, second = [e for e in r.events if e.event == "call"]
+        assert first.fninfo is second.fninfo
+        assert (first.path, first.lineno) == (second.path, second.lineno)
+        get_function_location.assert_called_once()
+
     # There should be an exception return event generated even when the raised exception is a
     # BaseException.
     def test_exception_event_with_base_exception(self):
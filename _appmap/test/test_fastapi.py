@@ -8,6 +8,7 @@ from fastapi.testclient import TestClient
 import appmap
 from _appmap.env import Env
 from _appmap.metadata import Metadata
+from _appmap.recorder import Recorder
 
 from .web_framework import (
     _TestRecordRequests,
@@ -71,6 +72,25 @@ def test_framework_metadata(client, events):  # pylint: disable=unused-argument
     assert Metadata()["frameworks"] == [{"name": "FastAPI", "version": version("fastapi")}]
 
 
+@pytest.mark.appmap_enabled
+def test_exception_stops_request_recorder(monkeypatch):
+    # A FastAPI app turns exceptions into responses before they get to the middleware, so use a
+    # bare Router.
+    from starlette.routing import Route, Router  # pylint: disable=import-outside-toplevel
+
+    def raise_exception(_):
+        raise RuntimeError("An exception")
+
+    app = appmap.fastapi.Middleware(Router(routes=[Route("/exception", raise_exception)]))
+    client = TestClient(app.init_app())
+    monkeypatch.setattr(Recorder, "_active_recorders", 0)
+
+    with pytest.raises(RuntimeError):
+        client.get("/exception")
+
+    assert Recorder._active_recorders == 0  # pylint: disable=protected-access
+
+
 @pytest.fixture(name="server")
 def fastapi_server(xprocess, server_base):
     debug = server_base.debug
@@ -0,0 +1,147 @@
+"""Test the flight recorder's ring of events."""
+# pylint: disable=missing-function-docstring
+
+import json
+import signal
+import sys
+import threading
+from shutil import copy, copytree
+
+import pytest
+
+from _appmap import flight_recorder
+from _appmap.event import Event, ReturnEvent
+from _appmap.flight_recorder import RingEvents
+from _appmap.recorder import Recorder
+
+
+def _call():
+    return Event("call")
+
+
+def test_ring_keeps_last_events():
+    ring = RingEvents(max_events=3)
+    events = [_call() for _ in range(5)]
+    for e in events:
+        ring.append(e)
+
+    assert len(ring) == 3
+    assert list(ring) == events[2:]
+
+
+def test_ring_drops_orphaned_returns():
+    ring = RingEvents(max_events=3)
+    outer = _call()
+    inner = _call()
+    ring.append(outer)
+    ring.append(inner)
+    ring.append(ReturnEvent(inner.id, 0))
+    ring.append(ReturnEvent(outer.id, 0))
+
+    # outer has been dropped, so its return should be too
+    assert [(e.event, e.id) for e in ring] == [
+        ("call", inner.id),
+        ("return", inner.id + 1),
+    ]
+
+
+def test_ring_keeps_last_seconds(mocker):
+    now = mocker.patch("_appmap.flight_recorder.time.monotonic")
+    ring = RingEvents(max_seconds=10)
+    events = []
+    for t in (0, 5, 12, 14):
+        now.return_value = t
+        events.append(_call())
+        ring.append(events[-1])
+
+    assert list(ring) == events[1:]
+
+
+@pytest.mark.appmap_enabled
+def test_dump_not_reentered(monkeypatch):
+    ring = RingEvents(max_events=3)
+    Recorder.get_global().clear(events=ring)
+    ring.append(_call())
+
+    dumps = []
+
+    def writer(events, reason):
+        # e.g. a signal arriving while the ring is being written
+        dumps.append((len(events), reason, flight_recorder.dump("signal")))
+        return "written"
+
+    monkeypatch.setattr(flight_recorder, "_writer", writer)
+    assert flight_recorder.dump() == "written"
+    assert dumps == [(1, "api", None)]
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_THREAD_BUFFERS": "true"})
+def test_ring_used_with_thread_buffers():
+    rec = Recorder.get_global()
+    ring = RingEvents(max_events=3)
+    rec.clear(events=ring)
+    rec.start_recording()
+    for _ in range(5):
+        Recorder.add_event(_call())
+    assert rec.stop_recording() is ring
+    assert len(ring) == 3
+
+
+def test_hooks_installed_once(monkeypatch):
+    # pylint: disable=protected-access
+    monkeypatch.setattr(flight_recorder, "_hooks_installed", False)
+    monkeypatch.setattr(flight_recorder, "_writer", None)
+    monkeypatch.setattr(sys, "excepthook", sys.excepthook)
+    monkeypatch.setattr(threading, "excepthook", threading.excepthook)
+    previous_handler = signal.getsignal(signal.SIGUSR1)
+    try:
+        flight_recorder.install(lambda events, reason: "first")
+        hooks = (sys.excepthook, threading.excepthook, signal.getsignal(signal.SIGUSR1))
+
+        def second(events, reason):  # pylint: disable=unused-argument
+            return "second"
+
+        flight_recorder.install(second)
+        assert (sys.excepthook, threading.excepthook, signal.getsignal(signal.SIGUSR1)) == hooks
+        assert flight_recorder._writer is second
+    finally:
+        signal.signal(signal.SIGUSR1, previous_handler)
+
+
+def test_flight_recording(data_dir, shell, tmp_path):
+    fixture = data_dir / "package1"
+    tmp = tmp_path / "process"
+    copytree(fixture, str(tmp / "package1"), dirs_exist_ok=True)
+    copy(data_dir / "appmap.yml", str(tmp))
+    copytree(data_dir / "flask" / "init", str(tmp / "init"), dirs_exist_ok=True)
+
+    ret = shell.run(
+        "python",
+        "-c",
+        "import os, signal, appmap; from package1.package2.mod1 import Mod1Class; "
+        "[Mod1Class().func() for _ in range(10)]; "
+        "print(appmap.dump_flight_recording()); "
+        "os.kill(os.getpid(), signal.SIGUSR1)",
+        env={
+            "PYTHONPATH": "init",
+            "APPMAP_RECORD_PROCESS": "true",
+            "APPMAP_FLIGHT_RECORDER_EVENTS": "5",
+        },
+        cwd=tmp,
+    )
+    assert ret.returncode == 0
+
+    appmap_dir = tmp / "tmp" / "appmap" / "process"
+    dumped = list(appmap_dir.glob("*-api-1.appmap.json"))
+    assert len(dumped) == 1
+    assert str(dumped[0]) in ret.stdout
+    assert len(list(appmap_dir.glob("*-signal-2.appmap.json"))) == 1
+    # The ring also gets written at exit
+    assert len(list(appmap_dir.glob("*.appmap.json"))) == 3
+
+    actual = json.loads(dumped[0].read_text())
+    events = actual["events"]
+    assert len(events) == 4
+    assert events[0]["event"] == "call"
+    assert actual["metadata"]["recorder"]["name"] == "flight_recorder"
+    assert len(actual["classMap"]) > 0
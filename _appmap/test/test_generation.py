@@ -1,8 +1,12 @@
+import io
 import json
 import pytest
 
 import numpy as np
 
+import appmap
+from _appmap import generation
+from _appmap.env import Env
 from _appmap.generation import AppMapEncoder
 
 
@@ -54,6 +58,77 @@ class TestGeneration:
 
         verify_example_appmap(check_comment, "instance_method")
 
+    def test_classmap_built_while_recording(self, mocker):
+        # pylint: disable=import-outside-toplevel,import-error
+        from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+        add_to_classmap = mocker.spy(generation, "add_to_classmap")
+        r = appmap.Recording()
+        with r:
+            for _ in range(10):
+                ExampleClass.class_method()
+                ExampleClass().instance_method()
+        assert add_to_classmap.call_count == 2
+
+        add_to_classmap.reset_mock()
+        expected = json.dumps(generation.classmap(r), cls=AppMapEncoder)
+        add_to_classmap.assert_not_called()
+
+        # Building the classmap from the events should produce the same thing.
+        r.events = list(r.events)
+        assert json.dumps(generation.classmap(r), cls=AppMapEncoder) == expected
+
+
+    @pytest.mark.parametrize("backend", ["json", "orjson", "msgspec"])
+    def test_write_matches_dumps(self, backend):
+        if backend != "json":
+            pytest.importorskip(backend)
+        Env.current.set("APPMAP_JSON_BACKEND", backend)
+        # pylint: disable=import-outside-toplevel,import-error
+        from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+        r = appmap.Recording()
+        with r:
+            ExampleClass().instance_with_param({"a": [1, 2.5, None, "\u00e9"]})
+            ExampleClass.class_method()
+            try:
+                ExampleClass().test_exception()
+            except Exception:  # pylint: disable=broad-except
+                pass
+
+        metadata = {"name": "test"}
+        expected = json.dumps(generation.appmap(r, metadata), cls=AppMapEncoder)
+        f = io.StringIO()
+        generation.write(r, f, metadata)
+        if backend == "json":
+            assert f.getvalue() == expected
+        else:
+            assert json.loads(f.getvalue()) == json.loads(expected)
+
+
+class TestJsonEncoder:
+    def test_orjson_fallback(self):
+        pytest.importorskip("orjson")
+        Env.current.set("APPMAP_JSON_BACKEND", "orjson")
+        encode = generation.json_encoder()
+        # orjson can't encode ints this big, so json should be used instead.
+        assert encode({"value": 2**70}) == '{"value": %d}' % 2**70
+        assert encode({"value": np.int64(42), 1: None}) == '{"value":"42","1":null}'
+
+    def test_msgspec(self):
+        pytest.importorskip("msgspec")
+        Env.current.set("APPMAP_JSON_BACKEND", "msgspec")
+        encode = generation.json_encoder()
+        # Unlike orjson, msgspec can encode ints this big itself.
+        assert encode({"value": 2**70}) == '{"value":%d}' % 2**70
+        assert encode({"value": np.int64(42), 1: None}) == '{"value":"42","1":null}'
+
+    def test_unknown_backend(self, caplog):
+        Env.current.set("APPMAP_JSON_BACKEND", "bogus")
+        assert generation.json_encoder()({"a": 1}) == '{"a": 1}'
+        assert "Unknown APPMAP_JSON_BACKEND" in caplog.text
+
+
 class TestAppMapEncoder:
     def test_np_int64_type(self):
         data = {
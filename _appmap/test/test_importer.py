@@ -1,11 +1,19 @@
 # pylint: disable=missing-function-docstring
 
+import inspect
+import json
+import os
 import sys
+from types import FunctionType
 
 import pytest
 
+import appmap
+from _appmap import importer
 from _appmap.importer import Importer, wrap_exec_module
-from _appmap.wrapt.wrappers import BoundFunctionWrapper
+from _appmap.wrapt.wrappers import BoundFunctionWrapper, FunctionWrapper
+
+from .normalize import normalize_appmap, remove_line_numbers
 
 
 def test_exec_module_protection(monkeypatch):
@@ -46,3 +54,72 @@ def test_excluded(verify_example_appmap):
         assert not isinstance(ExampleClass.another_method, BoundFunctionWrapper)
 
     verify_example_appmap(check_imports, "instance_method")
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_PLAIN_WRAPPERS": "true"})
+def test_plain_wrappers(with_data_dir):
+    #  pylint: disable=import-outside-toplevel, import-error
+    import example_class  # pyright: ignore[reportMissingImports]
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    #  pylint: enable=import-outside-toplevel, import-error
+
+    members = ExampleClass.__dict__
+    assert type(members["instance_with_param"]) is FunctionType
+    assert type(members["wrapped_class_method"]) is classmethod
+    assert type(members["static_method"]) is staticmethod
+    class_method = example_class.ClassMethodMixin.__dict__["class_method"]
+    assert class_method.__func__._appmap_instrumented  # pylint: disable=protected-access
+
+    # Functions that aren't plain functions, like this lru_cache, are still wrapped with wrapt.
+    assert isinstance(members["static_cached"], FunctionWrapper)
+    ExampleClass.static_cached.cache_clear()
+    assert inspect.getfile(example_class.modfunc) == "<appmap wrapper>"
+    assert inspect.getfile(example_class.modfunc.__wrapped__) == example_class.__file__
+    assert example_class.modfunc.__name__ == "modfunc"
+    assert example_class.modfunc.__code__.co_name == "modfunc"
+    assert inspect.signature(ExampleClass.instance_with_param) == inspect.signature(
+        ExampleClass.instance_with_param.__wrapped__
+    )
+
+    with open(os.path.join(with_data_dir, "expected.appmap.json"), encoding="utf-8") as f:
+        expected_appmap = json.load(f)
+    r = appmap.Recording()
+    with r:
+        ExampleClass.static_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+        ExampleClass.what_time_is_it()
+        try:
+            ExampleClass().test_exception()
+        except:  # pylint: disable=bare-except  # noqa: E722
+            pass
+        ExampleClass.call_yaml()
+
+    generated_appmap = normalize_appmap(appmap.generation.dump(r))
+    assert remove_line_numbers(generated_appmap) == expected_appmap
+
+
+@pytest.mark.appmap_enabled(config="appmap-class.yml")
+@pytest.mark.usefixtures("with_data_dir")
+def test_finder_skips_other_modules(mocker):
+    assert sys.meta_path[0] is importer._finder  # pylint: disable=protected-access
+
+    # Finders inserted at the front go after it.
+    other = mocker.Mock(spec=["find_spec"])
+    other.find_spec.return_value = None
+    sys.meta_path.insert(0, other)
+    try:
+        assert sys.meta_path[0] is importer._finder  # pylint: disable=protected-access
+        assert sys.meta_path[1] is other
+
+        # Nothing in colorsys can be instrumented, so the other finders aren't asked about it.
+        assert importer._finder.find_spec("colorsys") is None  # pylint: disable=protected-access
+        other.find_spec.assert_not_called()
+
+        spec = importer._finder.find_spec("example_class")  # pylint: disable=protected-access
+        other.find_spec.assert_called_once_with("example_class", None, None)
+        assert spec.name == "example_class"
+        assert getattr(spec.loader, "_appmap_wrapped_exec_module", False)
+    finally:
+        sys.meta_path.remove(other)
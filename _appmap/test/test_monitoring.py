@@ -0,0 +1,101 @@
+"""Test instrumenting functions with sys.monitoring."""
+# pylint: disable=missing-function-docstring, import-outside-toplevel, import-error
+
+import json
+import os
+import sys
+
+import pytest
+
+import appmap
+from _appmap import monitoring
+from _appmap.wrapt import FunctionWrapper
+
+from .normalize import normalize_appmap, remove_line_numbers
+
+pytestmark = [
+    pytest.mark.skipif(sys.version_info < (3, 12), reason="sys.monitoring needs Python 3.12"),
+    pytest.mark.appmap_enabled(env={"APPMAP_INSTRUMENTATION": "monitoring"}),
+    pytest.mark.usefixtures("with_data_dir"),
+]
+
+
+def test_functions_not_wrapped():
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    assert not isinstance(ExampleClass.__dict__["instance_with_param"], FunctionWrapper)
+    assert monitoring.is_monitored(ExampleClass.instance_with_param)
+    assert monitoring.is_monitored(ExampleClass.class_method)
+
+    # Decorated functions are still wrapped.
+    assert isinstance(ExampleClass.__dict__["wrapped_instance_method"], FunctionWrapper)
+
+
+def test_recording_works(with_data_dir):
+    expected_path = os.path.join(with_data_dir, "expected.appmap.json")
+    with open(expected_path, encoding="utf-8") as f:
+        expected_appmap = json.load(f)
+
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    # Calls made while nothing is recorded turn the events off, until recording starts.
+    ExampleClass().instance_method()
+
+    r = appmap.Recording()
+    with r:
+        ExampleClass.static_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+        ExampleClass.what_time_is_it()
+        try:
+            ExampleClass().test_exception()
+        except:  # pylint: disable=bare-except  # noqa: E722
+            pass
+        ExampleClass.call_yaml()
+
+    generated_appmap = normalize_appmap(appmap.generation.dump(r))
+    assert remove_line_numbers(generated_appmap) == expected_appmap
+
+
+def test_events_restarted_for_monitored_functions(mocker):
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    # pylint: disable-next=no-member
+    restart_events = mocker.patch.object(sys.monitoring, "restart_events")
+    ExampleClass.class_method()
+
+    for _ in range(2):
+        r = appmap.Recording()
+        with r:
+            ExampleClass.class_method()
+        assert len(r.events) == 2
+        ExampleClass.class_method()
+
+    restart_events.assert_not_called()
+
+
+def test_recording_shallow():
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    rec = appmap.Recording()
+    with rec:
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+
+    assert len(rec.events) == 8
+
+
+def test_params():
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    rec = appmap.Recording()
+    with rec:
+        ExampleClass().instance_with_param("hello")
+
+    call, ret = rec.events
+    assert [p["name"] for p in call.parameters] == ["p"]
+    assert call.parameters[0]["class"] == "builtins.str"
+    assert ret.parent_id == call.id
+    assert ret.return_value["class"] == "builtins.str"
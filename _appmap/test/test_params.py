@@ -8,8 +8,8 @@ import sys
 import pytest
 
 from _appmap import wrapt
-from _appmap.event import CallEvent
-from _appmap.importer import FilterableCls, FilterableFn
+from _appmap.event import DEFAULT_SCHEMA_LIMITS, CallEvent, LazyParamBinder, params_from_shape
+from _appmap.importer import FilterableCls, FilterableFn, FilterableMod
 
 empty_args = {"name": "args", "class": "builtins.tuple", "kind": "rest", "value": "()"}
 
@@ -325,3 +325,75 @@ class TestInstanceMethods(TestMethodBase):
         self.assert_parameter(
             evt, 1, {"class": "builtins.int", "kind": "opt", "name": "p2", "value": "4"}
         )
+
+    @pytest.mark.parametrize("params", ["with_defaults"], indirect=True)
+    def test_defaults_with_positional_args(self, params):
+        evt = params.C().with_defaults(3, 4)
+        assert len(evt.parameters) == 2
+
+        self.assert_parameter(
+            evt, 0, {"class": "builtins.int", "kind": "opt", "name": "p1", "value": "3"}
+        )
+
+        self.assert_parameter(
+            evt, 1, {"class": "builtins.int", "kind": "opt", "name": "p2", "value": "4"}
+        )
+
+
+# Every kind of parameter, in the order they can appear in. b has to have a default to be "opt", so
+# it comes before *args.
+# pylint: disable-next=unused-argument,keyword-arg-before-vararg
+def _with_defaults(a, /, b=1, *args, c, d=2, **kwargs):
+    pass
+
+
+def test_params_from_shape():
+    ffn = FilterableFn(FilterableMod(sys.modules[__name__]), "_with_defaults", _with_defaults, None)
+    binder = CallEvent.make_params(ffn)
+    assert binder.shape == (
+        ("a", "req"),
+        ("b", "opt"),
+        ("args", "rest"),
+        ("c", "keyreq"),
+        ("d", "key"),
+        ("kwargs", "keyrest"),
+    )
+
+    params = params_from_shape(_with_defaults, binder.shape)
+    assert [(p.name, p.kind, getattr(p, "default", None)) for p in params] == [
+        (p.name, p.kind, getattr(p, "default", None)) for p in binder.params
+    ]
+
+    # A shape that doesn't fit the function isn't used.
+    assert params_from_shape(_with_defaults, (("a", "req"),)) is None
+    assert params_from_shape(wrapt.decorator(lambda *_: None)(_with_defaults), binder.shape) is None
+
+
+def test_lazy_param_binder(mocker):
+    ffn = FilterableFn(FilterableMod(sys.modules[__name__]), "_with_defaults", _with_defaults, None)
+    make_params = mocker.spy(CallEvent, "make_params")
+    binder = LazyParamBinder(ffn)
+    assert binder.shape is None
+    make_params.assert_not_called()
+
+    params = binder.bind(None, (1,), {"c": 3}, False, DEFAULT_SCHEMA_LIMITS)
+    assert [p["name"] for p in params] == ["a", "b", "args", "c", "d", "kwargs"]
+    assert binder.shape[0] == ("a", "req")
+    binder.bind(None, (1,), {"c": 3}, False, DEFAULT_SCHEMA_LIMITS)
+    make_params.assert_called_once()
+
+    # A shape that's already known is available without making the binder.
+    assert LazyParamBinder(ffn, binder.shape).shape == binder.shape
+
+
+def _takes_call_local(__appmap_call__):  # pylint: disable=unused-argument
+    pass
+
+
+def test_bind_locals_skips_instrumentation_locals():
+    ffn = FilterableFn(
+        FilterableMod(sys.modules[__name__]), "_takes_call_local", _takes_call_local, None
+    )
+    binder = CallEvent.make_params(ffn)
+    (param,) = binder.bind_locals({"__appmap_call__": object()}, True, DEFAULT_SCHEMA_LIMITS)
+    assert param["class"] == "builtins.NoneType"
@@ -0,0 +1,130 @@
+"""Test the cache of instrumentation plans."""
+# pylint: disable=missing-function-docstring
+
+import inspect
+import json
+import sys
+import types
+
+import pytest
+
+import appmap
+from _appmap import event, plan_cache
+from _appmap.configuration import MatcherFilter
+from _appmap.env import Env
+from _appmap.plan_cache import PlanCache
+
+
+def test_module_plan(tmp_path):
+    source = tmp_path / "m.py"
+    source.write_text("x = 1")
+    mod = types.ModuleType("m")
+    mod.__file__ = str(source)
+    path = tmp_path / "cache.json"
+
+    plan = PlanCache(path).module_plan(mod)
+    assert not plan.cached
+
+    cache = PlanCache(path)
+    plan = cache.module_plan(mod)
+    plan.add_function("m", "fn", 0, (("a", "req"),))
+    cache.save()
+    plan = PlanCache(path).module_plan(mod)
+    assert plan.cached
+    assert plan.functions("m") == {"fn": (0, (("a", "req"),))}
+    # Only data is saved.
+    saved = json.loads(path.read_text())["modules"]["m"]
+    assert saved["scopes"] == {"m": {"fn": [0, [["a", "req"]]]}}
+
+    # The plan isn't used once the module changes.
+    source.write_text("x = 12")
+    assert not PlanCache(path).module_plan(mod).cached
+
+
+def test_concurrent_saves_merged(tmp_path):
+    mods = []
+    for name in ("m1", "m2"):
+        source = tmp_path / f"{name}.py"
+        source.write_text("x = 1")
+        mod = types.ModuleType(name)
+        mod.__file__ = str(source)
+        mods.append(mod)
+    path = tmp_path / "cache.json"
+
+    # Two processes start with the same (empty) cache, and each instruments a different module.
+    first, second = PlanCache(path), PlanCache(path)
+    first.module_plan(mods[0]).add_function("m1", "f", 0, None)
+    second.module_plan(mods[1]).add_function("m2", "g", 0, None)
+    first.save()
+    second.save()
+
+    cache = PlanCache(path)
+    assert cache.module_plan(mods[0]).functions("m1") == {"f": (0, None)}
+    assert cache.module_plan(mods[1]).functions("m2") == {"g": (0, None)}
+
+
+@pytest.mark.parametrize(
+    "contents",
+    [
+        b"not json",
+        b"[]",
+        json.dumps({"version": 2, "modules": {"m": {"stamp": 1}}}).encode(),
+        json.dumps(
+            {"version": 2, "modules": {"m": {"stamp": [1, 2], "scopes": {"m": []}}}}
+        ).encode(),
+    ],
+)
+def test_invalid_cache_ignored(tmp_path, caplog, contents):
+    path = tmp_path / "cache.json"
+    path.write_bytes(contents)
+    mod = types.ModuleType("m")
+    mod.__file__ = str(path)
+    assert not PlanCache(path).module_plan(mod).cached
+    assert "ignoring invalid plan cache" in caplog.text
+
+
+def _instrumented(cls):
+    return sorted(
+        k
+        for k in vars(cls)
+        if getattr(inspect.getattr_static(cls, k), "_appmap_instrumented", False)
+    )
+
+
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+def test_plan_followed(tmp_path, mocker):
+    Env.current.set("APPMAP_PLAN_CACHE", "true")
+    Env.current.set("APPMAP_PLAN_CACHE_DIR", str(tmp_path))
+    plan_cache.initialize()
+
+    # pylint: disable=import-outside-toplevel,import-error,reimported
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    expected = _instrumented(ExampleClass)
+    assert "instance_with_param" in expected
+    # The shape of a function's parameters is only known, and saved, once a call to it is recorded.
+    with appmap.Recording():
+        ExampleClass().instance_with_param(42)
+    plan_cache.save()
+    assert list(tmp_path.iterdir())
+
+    # Start again, as a new process would.
+    sys.modules.pop("example_class")
+    plan_cache.initialize()
+    filter_spy = mocker.spy(MatcherFilter, "filter")
+    shape_spy = mocker.spy(event, "params_from_shape")
+
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    assert _instrumented(ExampleClass) == expected
+    filtered = [c.args[1].fqname for c in filter_spy.call_args_list]
+    assert not [f for f in filtered if f.startswith("example_class")]
+
+    # The parameters were made from the plan, too.
+    r = appmap.Recording()
+    with r:
+        ExampleClass().instance_with_param(42)
+    call = r.events[0]
+    assert [(p["name"], p["kind"], p["value"]) for p in call.parameters] == [("p", "req", "42")]
+    assert shape_spy.spy_return is not None
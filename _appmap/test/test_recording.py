@@ -9,9 +9,14 @@ from threading import Thread
 import pytest
 
 import appmap
+from _appmap.columnar import ColumnarEvents
 from _appmap.configuration import Config
+from _appmap.env import Env
 from _appmap.event import Event
+from _appmap.flight_recorder import RingEvents
+from _appmap.generation import EventList
 from _appmap.recorder import Recorder, ThreadRecorder
+from _appmap.spill import SpilledEvents
 from _appmap.wrapt import FunctionWrapper
 
 from .normalize import normalize_appmap, remove_line_numbers
@@ -149,6 +154,116 @@ class TestRecordingWhenEnabled:
         p.join()
 
 
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+def test_spilled_events():
+    from example_class import (  # pyright: ignore[reportMissingImports] pylint: disable=import-error
+        ExampleClass,
+    )
+
+    rec = appmap.Recording()
+    with rec:
+        ExampleClass.static_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+    expected = json.loads(appmap.generation.dump(rec))
+
+    spilled = SpilledEvents(batch_size=2)
+    for e in rec.events:
+        spilled.append(e)
+    rec.events = spilled
+    assert json.loads(appmap.generation.dump(rec)) == expected
+    assert json.loads(appmap.generation.dump(rec, indent=2)) == expected
+    assert list(spilled) == expected["events"]
+
+    # The other stores can take the events of a SpilledEvents, which are dicts.
+    for events in (EventList(), ColumnarEvents(), RingEvents()):
+        events += spilled
+        rec.events = events
+        assert json.loads(appmap.generation.dump(rec)) == expected
+    spilled.close()
+
+
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+def test_spilled_by_shared_recorder():
+    from example_class import (  # pyright: ignore[reportMissingImports] pylint: disable=import-error
+        ExampleClass,
+    )
+
+    spilled = SpilledEvents(batch_size=2)
+    rec = Recorder.get_global()
+    rec.start_recording()
+    rec.clear(events=spilled)
+    ExampleClass.static_method()
+    ExampleClass.class_method()
+    events = rec.stop_recording()
+
+    # The full batches were spilled once the recorder's lock was released.
+    assert events is spilled
+    assert repr(spilled) == "<SpilledEvents count: 4 spilled: 4>"
+    assert [e["event"] for e in spilled] == ["call", "return", "call", "return"]
+    spilled.close()
+
+
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+@pytest.mark.parametrize(
+    "event_store,first_events",
+    [
+        ("columnar", None),
+        ("list", lambda: SpilledEvents(batch_size=1)),
+        ("columnar", lambda: SpilledEvents(batch_size=1)),
+        ("list", RingEvents),
+    ],
+)
+def test_recording_reused(event_store, first_events):
+    from example_class import (  # pyright: ignore[reportMissingImports] pylint: disable=import-error
+        ExampleClass,
+    )
+
+    def record(rec, first_events=None):
+        rec.start()
+        if first_events is not None:
+            Recorder.get_current().clear(events=first_events())
+        ExampleClass.static_method()
+        rec.stop()
+        with rec:
+            ExampleClass.class_method()
+            ExampleClass().instance_method()
+        return normalize_appmap(appmap.generation.dump(rec))
+
+    expected = record(appmap.Recording())
+
+    Env.current.set("APPMAP_EVENT_STORE", event_store)
+    rec = appmap.Recording()
+    actual = record(rec, first_events)
+    assert len(rec.events) == 6
+    assert actual == expected
+
+
+@pytest.mark.appmap_enabled
+@pytest.mark.usefixtures("with_data_dir")
+def test_idle_fast_path(mocker, monkeypatch):
+    # pylint: disable=protected-access
+    from example_class import (  # pyright: ignore[reportMissingImports] pylint: disable=import-error
+        ExampleClass,
+    )
+
+    # Other tests may have left recorders enabled.
+    monkeypatch.setattr(Recorder, "_active_recorders", 0)
+    get_enabled = mocker.spy(Recorder, "get_enabled")
+    assert ExampleClass.class_method() == "ClassMethodMixin#class_method, cls ExampleClass"
+    get_enabled.assert_not_called()
+
+    rec = appmap.Recording()
+    with rec:
+        assert Recorder._active_recorders == 1
+        ExampleClass.class_method()
+    assert Recorder._active_recorders == 0
+    assert len(rec.events) == 2
+
+
 @pytest.mark.appmap_enabled
 @pytest.mark.usefixtures("with_data_dir")
 def test_static_cached(events):
@@ -166,23 +281,27 @@ def test_static_cached(events):
 class TestRecordingPerThread:
     def test_default_thread(self):
         rec = Recorder.get_current()
+        rec.start_recording()
         evt = Event({})
         rec.add_event(evt)
-        actual = rec.events
+        actual = rec.stop_recording()
         assert len(actual) == 1
         assert actual[0].id == 1
+        assert not rec.events
 
     def test_explicit_thread(self):
         thread_count = 100
         rec_default = Recorder.get_current()
+        rec_default.start_recording()
 
         recorders = {}
 
         def add_event(name):
             r = ThreadRecorder()
             Recorder.set_current(r)
+            r.start_recording()
             r.add_event(Event({"name": name}))
-            recorders[name] = r
+            recorders[name] = r.stop_recording()
 
         threads = [Thread(target=add_event, args=(f"thread{i}",)) for i in range(thread_count)]
         for _, t in enumerate(threads):
@@ -194,17 +313,90 @@ class TestRecordingPerThread:
         assert len(recorders) == thread_count
 
         # All events should show up in the global recorder
-        default_events = rec_default.events
+        default_events = rec_default.stop_recording()
         assert len(default_events) == thread_count
 
         # Each event should be added as the first event to the correct recorder
         for n in range(thread_count):
-            events = recorders[f"thread{n}"].events
+            events = recorders[f"thread{n}"]
             assert len(events) == 1
             assert events[0].event["name"] == f"thread{n}"
 
+    def test_only_enabled_recorders_get_events(self):
+        # This is what happens when requests are recorded: each request has a recorder of its own,
+        # and the global recorder isn't recording.
+        rec_default = Recorder.get_global()
+        r = ThreadRecorder()
+        Recorder.set_current(r)
+        try:
+            r.start_recording()
+            Recorder.add_event(Event({}))
+            events = r.stop_recording()
+            Recorder.add_event(Event({}))
+        finally:
+            Recorder.set_current(None)
+
+        assert len(events) == 1
+        assert not r.events
+        assert not rec_default.events
+
+    @pytest.mark.appmap_enabled(env={"APPMAP_THREAD_BUFFERS": "true"})
+    def test_thread_buffers(self):
+        thread_count = 16
+        events_per_thread = 2000
+        rec = Recorder.get_global()
+        rec.clear()
+        rec.start_recording()
+
+        def add_events():
+            for _ in range(events_per_thread):
+                Recorder.add_event(Event({}))
+
+        threads = [Thread(target=add_events) for _ in range(thread_count)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
 
-def test_process_recording(data_dir, shell, tmp_path):
+        events = rec.stop_recording()
+        ids = [e.id for e in events]
+        assert len(set(ids)) == thread_count * events_per_thread
+
+        # Each thread's events are in the order it added them.
+        ids_by_thread = {}
+        for e in events:
+            ids_by_thread.setdefault(e.thread_id, []).append(e.id)
+        assert all(ids == sorted(ids) for ids in ids_by_thread.values())
+
+        # Clearing the recorder should restart the ids, even for threads that had reserved a block.
+        rec.clear()
+        rec.start_recording()
+        rec.add_event(Event({}))
+        assert [e.id for e in rec.stop_recording()] == [1]
+
+    @pytest.mark.appmap_enabled(env={"APPMAP_THREAD_BUFFERS": "true"})
+    def test_thread_buffers_merged_in_order(self):
+        rec = Recorder.get_global()
+        rec.clear()
+        rec.start_recording()
+
+        Recorder.add_event(Event({"name": "first"}))
+        t = Thread(target=lambda: Recorder.add_event(Event({"name": "second"})))
+        t.start()
+        t.join()
+        Recorder.add_event(Event({"name": "third"}))
+
+        # The events are in the order they were added. Each thread reserves a block of ids, so the
+        # ids aren't in that order, and there are gaps in them.
+        events = rec.stop_recording()
+        assert [e.event["name"] for e in events] == ["first", "second", "third"]
+        assert [e.id for e in events] == [1, 1025, 2]
+
+
+@pytest.mark.parametrize(
+    "spill_env", [{}, {"APPMAP_SPILL_EVENTS": "true", "APPMAP_SPILL_BATCH_SIZE": "1"}]
+)
+def test_process_recording(data_dir, shell, tmp_path, spill_env):
     fixture = data_dir / "package1"
     tmp = tmp_path / "process"
     copytree(fixture, str(tmp / "package1"), dirs_exist_ok=True)
@@ -215,7 +407,7 @@ def test_process_recording(data_dir, shell, tmp_path):
         "python",
         "-m",
         "package1.package2",
-        env={"PYTHONPATH": "init", "APPMAP_RECORD_PROCESS": "true"},
+        env={"PYTHONPATH": "init", "APPMAP_RECORD_PROCESS": "true", **spill_env},
         cwd=tmp,
     )
     assert ret.returncode == 0
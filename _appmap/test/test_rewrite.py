@@ -0,0 +1,292 @@
+"""Test instrumenting functions by rewriting them as they're imported."""
+# pylint: disable=missing-function-docstring, import-outside-toplevel, import-error
+
+import importlib.util
+import json
+import os
+import sys
+from textwrap import dedent
+
+import pytest
+
+import appmap
+from _appmap import rewrite
+from _appmap.wrapt import FunctionWrapper
+
+from .normalize import normalize_appmap, remove_line_numbers
+
+pytestmark = [
+    pytest.mark.appmap_enabled(env={"APPMAP_INSTRUMENTATION": "rewrite"}),
+    pytest.mark.usefixtures("with_data_dir"),
+]
+
+
+@pytest.fixture(name="write_bytecode")
+def write_bytecode_fixture(monkeypatch):
+    monkeypatch.setattr(sys, "dont_write_bytecode", False)
+
+
+def test_functions_not_wrapped(write_bytecode):  # pylint: disable=unused-argument
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    assert not isinstance(ExampleClass.__dict__["instance_with_param"], FunctionWrapper)
+    assert rewrite.is_registered(ExampleClass.instance_with_param)
+    assert rewrite.is_registered(ExampleClass.class_method)
+
+    # Decorated functions are still wrapped.
+    assert isinstance(ExampleClass.__dict__["wrapped_instance_method"], FunctionWrapper)
+
+    cached = rewrite.cache_path(sys.modules["example_class"].__file__)
+    assert os.path.exists(cached)
+    os.remove(cached)
+
+
+def test_recording_works(with_data_dir):
+    expected_path = os.path.join(with_data_dir, "expected.appmap.json")
+    with open(expected_path, encoding="utf-8") as f:
+        expected_appmap = json.load(f)
+
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    r = appmap.Recording()
+    with r:
+        ExampleClass.static_method()
+        ExampleClass.class_method()
+        ExampleClass().instance_method()
+        ExampleClass.what_time_is_it()
+        try:
+            ExampleClass().test_exception()
+        except:  # pylint: disable=bare-except  # noqa: E722
+            pass
+        ExampleClass.call_yaml()
+
+    generated_appmap = normalize_appmap(appmap.generation.dump(r))
+    assert remove_line_numbers(generated_appmap) == expected_appmap
+
+
+def test_params():
+    from example_class import ExampleClass  # pyright: ignore[reportMissingImports]
+
+    rec = appmap.Recording()
+    with rec:
+        ExampleClass().instance_with_param("hello")
+
+    call, ret = rec.events
+    assert [p["name"] for p in call.parameters] == ["p"]
+    assert call.parameters[0]["class"] == "builtins.str"
+    assert ret.parent_id == call.id
+    assert ret.return_value["class"] == "builtins.str"
+
+
+def _load(path, name="rewritten"):
+    loader = rewrite.RewritingLoader(name, str(path))
+    spec = importlib.util.spec_from_file_location(name, str(path), loader=loader)
+    mod = importlib.util.module_from_spec(spec)
+    loader.exec_module(mod)
+    return mod
+
+
+_SOURCE = dedent(
+    '''\
+    """A module."""
+    from __future__ import annotations
+
+    def returns(x):
+        """A docstring."""
+        if x:
+            return x + 1
+        return
+
+    def falls_off(x):
+        x.append(1)
+
+    def raises():
+        raise ValueError("oops")
+
+    def generator():
+        yield 1
+
+    def outer():
+        def inner():
+            return 1
+        return inner
+
+    class C:
+        @staticmethod
+        def method(*args, **kwargs):
+            return args, kwargs
+    '''
+)
+
+
+def test_rewritten_functions(tmp_path, write_bytecode):  # pylint: disable=unused-argument
+    source = tmp_path / "rewritten.py"
+    source.write_text(_SOURCE)
+    mod = _load(source)
+
+    assert mod.__doc__ == "A module."
+    assert mod.returns.__doc__ == "A docstring."
+    assert len(mod.__appmap_sites__) == 5
+    for fn in (mod.returns, mod.falls_off, mod.raises, mod.outer, mod.C.method):
+        assert rewrite._site(fn) is not None  # pylint: disable=protected-access
+    assert rewrite._site(mod.generator) is None  # pylint: disable=protected-access
+    assert rewrite._site(mod.outer()) is None  # pylint: disable=protected-access
+
+    # Nothing's registered, so the functions behave as they did.
+    assert mod.returns(1) == 2
+    assert mod.returns(0) is None
+    assert list(mod.generator()) == [1]
+    assert mod.C.method(1, k=2) == ((1,), {"k": 2})
+    with pytest.raises(ValueError):
+        mod.raises()
+
+    assert os.path.exists(rewrite.cache_path(str(source)))
+
+
+def test_reloaded_without_rewriting(tmp_path):
+    source = tmp_path / "rewritten.py"
+    source.write_text(_SOURCE)
+    mod = _load(source)
+    assert rewrite._site(mod.returns) is not None  # pylint: disable=protected-access
+
+    # Executing the original code in the same module, as importlib.reload does, leaves the sites in
+    # its globals.
+    exec(compile(_SOURCE, str(source), "exec"), vars(mod))  # pylint: disable=exec-used
+    assert rewrite._site(mod.returns) is None  # pylint: disable=protected-access
+
+
+def test_cached_code_used(tmp_path, write_bytecode, monkeypatch):  # pylint: disable=unused-argument
+    source = tmp_path / "rewritten.py"
+    source.write_text(_SOURCE)
+    _load(source)
+
+    def fail(_):
+        raise AssertionError("rewrote again")
+
+    monkeypatch.setattr(rewrite, "rewrite", fail)
+    mod = _load(source)
+    assert mod.returns(1) == 2
+
+    # Changing the source invalidates the cache.
+    source.write_text(_SOURCE + "\nX = 1\n")
+    with pytest.raises(AssertionError, match="rewrote again"):
+        _load(source)
+
+
+def test_recording_rewritten(tmp_path):
+    source = tmp_path / "rewritten.py"
+    source.write_text(_SOURCE)
+    mod = _load(source)
+
+    from _appmap.importer import FilterableFn, FilterableMod
+    from _appmap.instrument import instrument
+
+    fm = FilterableMod(mod)
+    for name in ("returns", "falls_off", "raises"):
+        fn = getattr(mod, name)
+        assert instrument(FilterableFn(fm, name, fn, fn)) is fn
+
+    rec = appmap.Recording()
+    with rec:
+        mod.returns(1)
+        mod.falls_off([])
+        with pytest.raises(ValueError):
+            mod.raises()
+        mod.returns(0)
+
+    events = [e.to_dict() for e in rec.events]
+    assert [(e["event"], e.get("method_id")) for e in events] == [
+        ("call", "returns"),
+        ("return", None),
+        ("call", "falls_off"),
+        ("return", None),
+        ("call", "raises"),
+        ("return", None),
+        ("call", "returns"),
+        ("return", None),
+    ]
+    assert events[1]["return_value"]["class"] == "builtins.int"
+    assert events[5]["exceptions"][0]["class"] == "builtins.ValueError"
+    assert "return_value" not in events[5]
+
+
+def test_call_local(tmp_path):
+    source = tmp_path / "rewritten.py"
+    source.write_text(
+        dedent(
+            """\
+            def local_names(x):
+                return sorted(locals())
+
+            def uses_name(__appmap_call__=None):
+                return __appmap_call__
+            """
+        )
+    )
+    mod = _load(source)
+    assert rewrite._site(mod.uses_name) is None  # pylint: disable=protected-access
+    assert mod.uses_name(1) == 1
+
+    from _appmap.importer import FilterableFn, FilterableMod
+    from _appmap.instrument import instrument
+
+    fn = mod.local_names
+    instrument(FilterableFn(FilterableMod(mod), "local_names", fn, fn))
+    rec = appmap.Recording()
+    with rec:
+        # The local that holds the call is visible, but isn't recorded as a parameter.
+        assert mod.local_names(1) == ["__appmap_call__", "x"]
+    assert [p["name"] for p in rec.events[0].parameters] == ["x"]
+
+
+def test_return_in_try_finally(tmp_path):
+    source = tmp_path / "rewritten.py"
+    source.write_text(
+        dedent(
+            """\
+            def cleans_up(log):
+                try:
+                    return 1
+                finally:
+                    log.append("cleaned up")
+
+            def fails_cleaning_up():
+                try:
+                    return 1
+                finally:
+                    raise ValueError("cleanup failed")
+
+            def overrides():
+                try:
+                    return 1
+                finally:
+                    return "overridden"
+            """
+        )
+    )
+    mod = _load(source)
+
+    from _appmap.importer import FilterableFn, FilterableMod
+    from _appmap.instrument import instrument
+
+    fm = FilterableMod(mod)
+    for name in ("cleans_up", "fails_cleaning_up", "overrides"):
+        fn = getattr(mod, name)
+        assert instrument(FilterableFn(fm, name, fn, fn)) is fn
+
+    log = []
+    rec = appmap.Recording()
+    with rec:
+        assert mod.cleans_up(log) == 1
+        with pytest.raises(ValueError):
+            mod.fails_cleaning_up()
+        assert mod.overrides() == "overridden"
+
+    # Each return is recorded once the function has exited, after its finally clause ran.
+    events = [e.to_dict() for e in rec.events]
+    assert [e["event"] for e in events] == ["call", "return"] * 3
+    assert log == ["cleaned up"]
+    assert events[1]["return_value"]["value"] == "1"
+    assert "return_value" not in events[3]
+    assert events[3]["exceptions"][0]["class"] == "builtins.ValueError"
+    assert events[5]["return_value"]["value"] == "overridden"
@@ -2,6 +2,7 @@
 
 # pylint: disable=missing-function-docstring
 
+import gzip
 import json
 import re
 import sys
@@ -12,6 +13,7 @@ from pathlib import Path
 import pytest
 
 from _appmap import recording
+from _appmap.env import Env
 
 from .helpers import DictIncluding, check_call_stack, package_version
 from .normalize import normalize_appmap
@@ -192,6 +194,30 @@ def test_write_appmap(recorder_outdir):
     expected_shortname = longname[:235] + "-5d6e10d.appmap.json"
     assert (recorder_outdir / expected_shortname).read_text().startswith('{"version"')
 
+
+@pytest.mark.appmap_enabled(env={"APPMAP_GZIP": "true", "APPMAP_GZIP_LEVEL": "1"})
+def test_write_appmap_gzip(recorder_outdir):
+    recording.write_appmap(EMPTY_APPMAP, "foo", RECORDER_TYPE, None, recorder_outdir.parent)
+    assert not (recorder_outdir / "foo.appmap.json").exists()
+    with gzip.open(recorder_outdir / "foo.appmap.json.gz", "rt", encoding="utf-8") as f:
+        assert json.load(f)["version"]
+
+    longname = "-".join(["testing"] * 42)
+    recording.write_appmap(EMPTY_APPMAP, longname, RECORDER_TYPE, None, recorder_outdir.parent)
+    expected_shortname = longname[:232] + "-4694f26.appmap.json.gz"
+    assert (recorder_outdir / expected_shortname).exists()
+
+
+@pytest.mark.parametrize("level", ["fast", "10"])
+def test_write_appmap_invalid_gzip_level(recorder_outdir, caplog, level):
+    Env.current.set("APPMAP_GZIP", "true")
+    Env.current.set("APPMAP_GZIP_LEVEL", level)
+    recording.write_appmap(EMPTY_APPMAP, "foo", RECORDER_TYPE, None, recorder_outdir.parent)
+    with gzip.open(recorder_outdir / "foo.appmap.json.gz", "rt", encoding="utf-8") as f:
+        assert json.load(f)["version"]
+    assert "APPMAP_GZIP_LEVEL" in caplog.text
+
+
 @pytest.mark.example_dir("pytest-instrumented")
 @pytest.mark.appmap_enabled
 def test_pytest_instrumented(testdir):
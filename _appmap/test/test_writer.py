@@ -0,0 +1,130 @@
+"""Test the pool that writes AppMaps in the background."""
+# pylint: disable=missing-function-docstring
+
+import json
+import threading
+import types
+
+import pytest
+
+from _appmap import recording, writer
+from _appmap.env import Env
+from _appmap.event import Event
+from _appmap.web_framework import AppmapMiddleware
+
+RECORDER_TYPE = "test"
+
+
+@pytest.fixture(name="pool_env")
+def _pool_env():
+    def set_env(**kwargs):
+        for k, v in kwargs.items():
+            Env.current.set(k, v)
+        writer.flush()
+
+    yield set_env
+    writer.flush()
+
+
+@pytest.fixture(name="blocked_writes")
+def _blocked_writes(monkeypatch):
+    """Make writes in the background wait until the returned event is set."""
+    release = threading.Event()
+    write_appmap = recording.write_appmap
+
+    def blocking_write(*args):
+        if threading.current_thread().name.startswith("appmap-writer"):
+            release.wait(10)
+        return write_appmap(*args)
+
+    monkeypatch.setattr(recording, "write_appmap", blocking_write)
+    yield release
+    release.set()
+
+
+def test_writes_in_background(pool_env, tmp_path):
+    pool_env(APPMAP_WRITER_THREADS="2")
+    events = [Event("call")]
+    appmap = types.SimpleNamespace(events=events)
+    appmap_file = writer.write_appmap(appmap, "foo", RECORDER_TYPE, None, tmp_path)
+
+    # The events were taken when the write was submitted.
+    appmap.events = []
+    writer.flush()
+    assert appmap_file == tmp_path / RECORDER_TYPE / "foo.appmap.json"
+    assert len(json.loads(appmap_file.read_text())["events"]) == 1
+
+
+def test_writes_synchronously_by_default(tmp_path):
+    appmap = types.SimpleNamespace(events=[])
+    appmap_file = writer.write_appmap(appmap, "foo", RECORDER_TYPE, None, tmp_path)
+    assert appmap_file.exists()
+
+
+def test_overflow_drop(pool_env, blocked_writes, tmp_path):
+    pool_env(
+        APPMAP_WRITER_THREADS="1", APPMAP_WRITER_QUEUE_SIZE="1", APPMAP_WRITER_OVERFLOW="drop"
+    )
+    appmap = types.SimpleNamespace(events=[])
+    first = writer.write_appmap(appmap, "first", RECORDER_TYPE, None, tmp_path)
+    second = writer.write_appmap(appmap, "second", RECORDER_TYPE, None, tmp_path)
+
+    blocked_writes.set()
+    writer.flush()
+    assert first.exists()
+    assert not second.exists()
+
+
+def test_overflow_sync(pool_env, blocked_writes, tmp_path):
+    pool_env(
+        APPMAP_WRITER_THREADS="1", APPMAP_WRITER_QUEUE_SIZE="1", APPMAP_WRITER_OVERFLOW="sync"
+    )
+    appmap = types.SimpleNamespace(events=[])
+    first = writer.write_appmap(appmap, "first", RECORDER_TYPE, None, tmp_path)
+    second = writer.write_appmap(appmap, "second", RECORDER_TYPE, None, tmp_path)
+
+    # The second was written on this thread, while the first is still waiting.
+    assert second.exists()
+    assert not first.exists()
+    blocked_writes.set()
+    writer.flush()
+    assert first.exists()
+
+
+@pytest.mark.parametrize(
+    "env",
+    [
+        {"APPMAP_WRITER_THREADS": "two"},
+        {"APPMAP_WRITER_THREADS": "1", "APPMAP_WRITER_QUEUE_SIZE": "lots"},
+        {"APPMAP_WRITER_THREADS": "1", "APPMAP_WRITER_QUEUE_SIZE": "0"},
+        {"APPMAP_WRITER_THREADS": "1", "APPMAP_WRITER_OVERFLOW": "explode"},
+    ],
+)
+def test_invalid_settings_fall_back(pool_env, tmp_path, caplog, env):
+    pool_env(**env)
+    appmap = types.SimpleNamespace(events=[])
+    appmap_file = writer.write_appmap(appmap, "foo", RECORDER_TYPE, None, tmp_path)
+    writer.flush()
+    assert appmap_file.exists()
+    assert "APPMAP_WRITER" in caplog.text
+
+
+@pytest.mark.appmap_enabled(env={"APPMAP_RECORD_REQUESTS": "true"})
+def test_request_recorder_stopped_before_write(mocker, tmp_path):
+    class Middleware(AppmapMiddleware):
+        def before_request_main(self, rec, req):
+            return 0, Event("call").id
+
+    def write_appmap(appmap, *args, **kwargs):  # pylint: disable=unused-argument
+        # Nothing more can be added to the events being written.
+        assert not rec.get_enabled()
+        assert appmap.events is not rec.events
+        assert len(appmap.events) == 1
+        return tmp_path / "foo.appmap.json"
+
+    write = mocker.patch.object(writer, "write_appmap", side_effect=write_appmap)
+    middleware = Middleware("test")
+    rec, start, call_event_id = middleware.before_request_hook(None)
+    return_event = middleware.after_request_main("/test", 200, {}, start, call_event_id)
+    middleware.after_request_hook("/test", "GET", "http://localhost/test", 200, {}, return_event)
+    write.assert_called_once()
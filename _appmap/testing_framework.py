@@ -8,7 +8,7 @@ from pathlib import PurePath
 
 import inflection
 
-from _appmap import env, recording
+from _appmap import env, writer
 from _appmap.configuration import Config
 from _appmap.recording import Recording
 from _appmap.utils import fqname, root_relative_path
@@ -119,7 +119,7 @@ class session:  # pylint: disable=too-few-public-methods
             with rec, environ.disabled("requests"):
                 yield metadata
         finally:
-            recording.write_appmap(rec, item.filename, self.name, metadata)
+            writer.write_appmap(rec, item.filename, self.name, metadata)
 
 
 @contextmanager
@@ -13,9 +13,9 @@ from hashlib import sha256
 from json.decoder import JSONDecodeError
 from typing import Any, Optional, Protocol, Tuple
 
-from _appmap import recording
+from _appmap import writer
 
-from . import remote_recording
+from . import recording, remote_recording
 from .env import Env
 from .event import (
     Event,
@@ -123,7 +123,6 @@ def create_appmap_file(
         + start_time.strftime("%T.%f")[:-3]
     )
     appmap_basename = scenario_filename("_".join([str(start_time.timestamp()), request_full_path]))
-    appmap_file_path = os.path.join(output_dir, appmap_basename)
 
     recorder_type = "requests"
     metadata = {
@@ -131,9 +130,11 @@ def create_appmap_file(
         "timestamp": start_time.timestamp(),
         "recorder": {"name": "record_requests", "type": recorder_type},
     }
-    recording.write_appmap(rec, appmap_basename, recorder_type, metadata)
+    appmap_file = writer.write_appmap(
+        rec, appmap_basename, recorder_type, metadata, basedir=output_dir.parent
+    )
     headers["AppMap-Name"] = os.path.abspath(appmap_name)
-    headers["AppMap-File-Name"] = os.path.abspath(appmap_file_path) + APPMAP_SUFFIX
+    headers["AppMap-File-Name"] = os.path.abspath(appmap_file)
 
 
 class AppmapMiddleware(ABC):
@@ -213,21 +214,24 @@ class AppmapMiddleware(ABC):
 
             try:
                 return_event.update(status, headers)
-
-                output_dir = Env.current.output_dir / "requests"
-                create_appmap_file(
-                    output_dir,
-                    request_method,
-                    request_path,
-                    request_base_url,
-                    status,
-                    headers,
-                    rec,
-                )
             finally:
-                rec.stop_recording()
+                # Stop recording before the AppMap is written. It may be written on another thread,
+                # and this thread mustn't go on adding events to it.
+                request_recording = recording.Recording()
+                request_recording.events = rec.stop_recording()
                 Recorder.set_current(None)
                 request_recorder.set(None)
+
+            output_dir = Env.current.output_dir / "requests"
+            create_appmap_file(
+                output_dir,
+                request_method,
+                request_path,
+                request_base_url,
+                status,
+                headers,
+                request_recording,
+            )
         elif env.enables("remote"):
             rec = Recorder.get_global()
             assert rec is not None
@@ -235,13 +239,21 @@ class AppmapMiddleware(ABC):
                 return_event.update(status, headers)
 
     def on_exception(self, rec, start, call_event_id, exc_info):
-        duration = time.monotonic() - start
-        exception_event = ExceptionEvent(
-            parent_id=call_event_id,
-            elapsed=duration,
-            exc_info=exc_info,
-        )
-        rec.add_event(exception_event)
+        try:
+            duration = time.monotonic() - start
+            exception_event = ExceptionEvent(
+                parent_id=call_event_id,
+                elapsed=duration,
+                exc_info=exc_info,
+            )
+            rec.add_event(exception_event)
+        finally:
+            # after_request_hook won't be called, so the request's recorder gets discarded here.
+            # Disable it first, so it's no longer counted as active.
+            if Env.current.enables("requests"):
+                rec._enabled = False  # pylint: disable=protected-access
+                Recorder.set_current(None)
+                request_recorder.set(None)
 
 
 class MiddlewareInserter(ABC):
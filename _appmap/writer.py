@@ -0,0 +1,145 @@
+"""
+A pool of threads that write AppMaps in the background.
+
+By default, the AppMaps for recorded requests and test cases are written on the thread that
+recorded them, before the response is returned, or the next test case starts. When
+APPMAP_WRITER_THREADS is set to a positive number, that many threads write them instead.
+
+At most APPMAP_WRITER_QUEUE_SIZE AppMaps (default 64) wait to be written. When that many are
+waiting, APPMAP_WRITER_OVERFLOW decides what happens to the next one:
+  * "block" (the default): wait until there's room for it
+  * "drop": log a warning, and don't write it
+  * "sync": write it on the thread that recorded it
+
+AppMaps that are waiting are written when flush is called, e.g. at the end of a pytest session, and
+when the process exits.
+"""
+
+import atexit
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import recording
+from .env import Env
+
+logger = Env.current.getLogger(__name__)
+
+OVERFLOW_POLICIES = ("block", "drop", "sync")
+_DEFAULT_QUEUE_SIZE = 64
+
+# pylint: disable=global-statement
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class _Pool:
+    def __init__(self, threads, queue_size, overflow):
+        self.overflow = overflow
+        self._executor = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="appmap-writer")
+        self._slots = threading.BoundedSemaphore(queue_size)
+
+    def submit(self, fn, *args):
+        # The slot is released when the write is done, on another thread.
+        # pylint: disable-next=consider-using-with
+        if not self._slots.acquire(blocking=self.overflow == "block"):
+            return False
+        try:
+            future = self._executor.submit(_run, fn, *args)
+        except RuntimeError:
+            # The executor has been shut down, because the interpreter is exiting.
+            self._slots.release()
+            _run(fn, *args)
+            return True
+        future.add_done_callback(lambda _: self._slots.release())
+        return True
+
+    def shutdown(self):
+        self._executor.shutdown(wait=True)
+
+
+def _run(fn, *args):
+    try:
+        fn(*args)
+    except Exception:  # pylint: disable=broad-except
+        logger.exception("failed to write AppMap")
+
+
+def _pool_from_env():
+    env = Env.current
+    threads = env.get_int("APPMAP_WRITER_THREADS", 0)
+    if threads <= 0:
+        return None
+
+    overflow = env.get("APPMAP_WRITER_OVERFLOW", "block").lower()
+    if overflow not in OVERFLOW_POLICIES:
+        logger.warning("unknown APPMAP_WRITER_OVERFLOW %r, using block", overflow)
+        overflow = "block"
+    queue_size = env.get_int("APPMAP_WRITER_QUEUE_SIZE", _DEFAULT_QUEUE_SIZE)
+    if queue_size <= 0:
+        logger.warning(
+            "APPMAP_WRITER_QUEUE_SIZE should be positive, not %d, using %d",
+            queue_size,
+            _DEFAULT_QUEUE_SIZE,
+        )
+        queue_size = _DEFAULT_QUEUE_SIZE
+    return _Pool(threads, queue_size, overflow)
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = _pool_from_env() or False
+        return _pool
+
+
+def write_appmap(
+    appmap, appmap_fname, recorder_type, metadata=None, basedir=Env.current.output_dir
+):
+    """
+    Write the AppMap for the recording appmap, as recording.write_appmap does, in the background if
+    the writer pool has been configured. Returns the path the AppMap is (or will be) written to.
+
+    The recording's events are taken when this is called. They're written on another thread, so
+    nothing may add to them afterwards: the recorder they came from must have been stopped.
+    """
+    appmap_file = recording.appmap_file_path(appmap_fname, recorder_type, basedir)
+    pool = _get_pool()
+    if not pool:
+        return recording.write_appmap(appmap, appmap_fname, recorder_type, metadata, basedir)
+
+    snapshot = recording.Recording()
+    snapshot.events = appmap.events
+    args = (snapshot, appmap_fname, recorder_type, metadata, basedir)
+    if not pool.submit(recording.write_appmap, *args):
+        if pool.overflow == "drop":
+            logger.warning("too many AppMaps waiting to be written, dropping %s", appmap_file)
+        else:
+            recording.write_appmap(*args)
+    return appmap_file
+
+
+def flush():
+    """Wait for the AppMaps waiting to be written to be written."""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool:
+        pool.shutdown()
+
+
+def _reset_after_fork():
+    # The pool's threads don't exist in a child process, and its lock may be held by one of them.
+    global _pool, _pool_lock
+    _pool = None
+    _pool_lock = threading.Lock()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+atexit.register(flush)
+
+
+def initialize():
+    flush()
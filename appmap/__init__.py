@@ -17,7 +17,9 @@ if _enabled is None or _enabled.upper() == "TRUE":
         os.environ.setdefault("_APPMAP_DISPLAY_PARAMS", _display_params)
 
         from _appmap import generation  # noqa: F401
+        from _appmap.describers import register as register_describer  # noqa: F401
         from _appmap.env import Env  # noqa: F401
+        from _appmap.flight_recorder import dump as dump_flight_recording  # noqa: F401
         from _appmap.importer import instrument_module  # noqa: F401
         from _appmap.labels import labels  # noqa: F401
         from _appmap.noappmap import decorator as noappmap  # noqa: F401
@@ -66,3 +68,11 @@ if not _recording_exported:
     # This prevents:
     #   ImportError: cannot import name 'Recording' from 'appmap'...
     from _appmap.recording import NoopRecording as Recording # noqa: F401
+
+    # These are only defined when the ones imported above weren't.
+    # pylint: disable=function-redefined
+    def dump_flight_recording():
+        return None
+
+    def register_describer(cls, describer):  # pylint: disable=unused-argument
+        return None
@@ -0,0 +1,90 @@
+import gzip
+import sys
+from argparse import ArgumentParser
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from _appmap import binary
+from _appmap.recording import BINARY_SUFFIX, GZIP_SUFFIX
+from _appmap.web_framework import APPMAP_SUFFIX
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def _open(path):
+    f = open(path, "rb")  # pylint: disable=consider-using-with
+    if f.peek(len(_GZIP_MAGIC))[: len(_GZIP_MAGIC)] == _GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=f, mode="rb")
+    return f
+
+
+def json_path(path):
+    """
+    Return the path of the .appmap.json a binary AppMap is converted to, which is next to it.
+    """
+    name = path.name
+    if name.endswith(GZIP_SUFFIX):
+        name = name[: -len(GZIP_SUFFIX)]
+    if name.endswith(BINARY_SUFFIX):
+        name = name[: -len(BINARY_SUFFIX)]
+    return path.with_name(name + APPMAP_SUFFIX)
+
+
+def convert(path, out_path=None):
+    """Convert the binary AppMap at path to JSON, written to out_path. Returns out_path."""
+    if out_path is None:
+        out_path = json_path(path)
+    with _open(path) as f, NamedTemporaryFile(
+        mode="w", encoding="utf-8", dir=out_path.parent, delete=False
+    ) as tmp:
+        try:
+            binary.convert(f, tmp)
+        except BaseException:
+            tmp.close()
+            Path(tmp.name).unlink()
+            raise
+    Path(tmp.name).replace(out_path)
+    return out_path
+
+
+def _run(args):
+    parser = ArgumentParser(
+        description="Convert AppMaps recorded in the binary format (APPMAP_FORMAT=binary) to JSON."
+    )
+    parser.add_argument("files", nargs="+", type=Path, metavar="FILE", help="binary AppMaps")
+    parser.add_argument(
+        "-o",
+        "--output",
+        type=Path,
+        help=(
+            "where to write the AppMap, if there's only one"
+            " (default: next to it, as .appmap.json)"
+        ),
+    )
+    parser.add_argument(
+        "--delete", action="store_true", help="delete each binary AppMap once it's converted"
+    )
+    args = parser.parse_args(args)
+    if args.output is not None and len(args.files) > 1:
+        parser.error("--output can only be used with a single file")
+
+    rc = 0
+    for path in args.files:
+        try:
+            out_path = convert(path, args.output)
+        except (OSError, binary.BinaryFormatError) as exc:
+            print(f"{path}: {exc}", file=sys.stderr)
+            rc = 1
+            continue
+        print(out_path)
+        if args.delete:
+            path.unlink()
+    return rc
+
+
+def run():
+    sys.exit(_run(sys.argv[1:]))
+
+
+if __name__ == "__main__":
+    run()
@@ -9,7 +9,7 @@ except ImportError:
         return False
 
 
-from _appmap import noappmap, testing_framework, wrapt
+from _appmap import noappmap, testing_framework, wrapt, writer
 from _appmap.env import Env
 
 logger = Env.current.getLogger(__name__)
@@ -38,6 +38,10 @@ if not Env.current.is_appmap_repo and Env.current.enables("tests"):
             name="pytest", recorder_type="tests", version=version("pytest")
         )
 
+    @pytest.hookimpl
+    def pytest_sessionfinish(session):  # pylint: disable=unused-argument
+        writer.flush()
+
     @pytest.hookimpl
     def pytest_runtest_call(item):
         # The presence of a `_testcase` attribute on an item indicates
@@ -0,0 +1,98 @@
+"""
+Compare writing an AppMap by building the whole document with json.dumps, with streaming it to the
+file with generation.write, using each of the JSON backends, and with writing it in the binary
+format.
+
+Each mode runs in a process of its own, which records calls to a few instrumented functions from the
+test data, then writes the AppMap. It reports how long writing took, and how much it grew the
+process's peak RSS. Run it from the root of the repo:
+
+    APPMAP=true python benchmarks/appmap_writer.py [--calls N]
+"""
+
+import argparse
+import importlib.util
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.join(os.getcwd(), "_appmap", "test", "data"))
+
+# pylint: disable=wrong-import-position,import-error
+import _appmap  # noqa: E402
+import appmap  # noqa: E402
+from _appmap import binary, generation  # noqa: E402
+
+MODES = ("dumps", "json", "orjson", "msgspec", "binary")
+
+
+def _max_rss_mb():
+    # ru_maxrss is in kilobytes on Linux, and bytes on macOS.
+    scale = 2**20 if sys.platform == "darwin" else 2**10
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+
+def run(mode, calls):
+    _appmap.initialize(
+        env={
+            "_APPMAP": "true",
+            "_APPMAP_DISPLAY_PARAMS": "true",
+            "APPMAP_CONFIG": "_appmap/test/data/appmap.yml",
+            "APPMAP_JSON_BACKEND": mode if mode in ("orjson", "msgspec") else "json",
+        }
+    )
+    from example_class import ExampleClass  # pylint: disable=import-outside-toplevel
+
+    example = ExampleClass()
+    r = appmap.Recording()
+    with r:
+        for i in range(calls):
+            example.instance_with_param(i)
+            ExampleClass.class_method()
+
+    rss_before = _max_rss_mb()
+    with tempfile.TemporaryFile(mode="wb" if mode == "binary" else "w") as f:
+        start = time.perf_counter()
+        if mode == "binary":
+            binary.write(r, f)
+        elif mode == "dumps":
+            f.write(json.dumps(generation.appmap(r, None), cls=generation.AppMapEncoder))
+        else:
+            generation.write(r, f)
+        elapsed = time.perf_counter() - start
+        size = f.tell()
+    return len(r.events), size, elapsed, _max_rss_mb() - rss_before
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--calls", type=int, default=200_000, help="iterations to record")
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        print(json.dumps(run(args.mode, args.calls)))
+        return
+
+    print(f"{'mode':>8} {'events':>10} {'MB written':>11} {'seconds':>9} {'peak RSS +MB':>13}")
+    for mode in MODES:
+        if mode in ("orjson", "msgspec") and importlib.util.find_spec(mode) is None:
+            print(f"{mode:>8} not installed")
+            continue
+        out = subprocess.run(
+            [sys.executable, __file__, "--mode", mode, "--calls", str(args.calls)],
+            check=True,
+            capture_output=True,
+            text=True,
+        ).stdout
+        count, size, elapsed, rss = json.loads(out.splitlines()[-1])
+        print(f"{mode:>8} {count:>10} {size / 2**20:>11.1f} {elapsed:>9.2f} {rss:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
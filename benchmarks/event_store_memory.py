@@ -0,0 +1,67 @@
+"""
+Compare the memory used to hold recorded events in a list, and in a ColumnarEvents store.
+
+Each run records calls to a few instrumented functions from the test data, and reports the memory
+(as measured by tracemalloc) and GC time. Run it from the root of the repo:
+
+    APPMAP=true python benchmarks/event_store_memory.py [--calls N]
+"""
+
+import argparse
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.getcwd())
+sys.path.insert(0, os.path.join(os.getcwd(), "_appmap", "test", "data"))
+
+# pylint: disable=wrong-import-position,import-error
+import _appmap  # noqa: E402
+import appmap  # noqa: E402
+
+
+def run(calls):
+    from example_class import ExampleClass  # pylint: disable=import-outside-toplevel
+
+    example = ExampleClass()
+    gc.collect()
+    tracemalloc.start()
+    r = appmap.Recording()
+    with r:
+        for _ in range(calls):
+            example.instance_method()
+            ExampleClass.static_method()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    gc.collect()
+    gc_time = time.perf_counter() - start
+    return len(r.events), current, gc_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--calls", type=int, default=50_000, help="iterations to record")
+    args = parser.parse_args()
+
+    print(f"{'store':>10} {'events':>10} {'MB':>8} {'bytes/event':>12} {'gc seconds':>11}")
+    for store in ("list", "columnar"):
+        _appmap.initialize(
+            env={
+                "_APPMAP": "true",
+                "APPMAP_CONFIG": "_appmap/test/data/appmap.yml",
+                "APPMAP_EVENT_STORE": store,
+            }
+        )
+        sys.modules.pop("example_class", None)
+        count, size, gc_time = run(args.calls)
+        print(
+            f"{store:>10} {count:>10} {size / 2**20:>8.1f} {size / count:>12.0f} {gc_time:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
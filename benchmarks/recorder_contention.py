@@ -0,0 +1,72 @@
+"""
+Measure how event recording scales with the number of threads recording concurrently.
+
+Each thread creates and records a fixed number of events, with and without APPMAP_THREAD_BUFFERS.
+Run it from the root of the repo:
+
+    python benchmarks/recorder_contention.py [--events N] [--threads 1,2,4,8,16,32]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+os.environ.setdefault("_APPMAP", "true")
+os.environ.setdefault("APPMAP_CONFIG", "appmap.yml")
+sys.path.insert(0, os.getcwd())
+
+# pylint: disable=wrong-import-position
+import _appmap  # noqa: E402
+from _appmap.event import Event  # noqa: E402
+from _appmap.recorder import Recorder  # noqa: E402
+
+
+def run(thread_count, events_per_thread):
+    rec = Recorder.get_global()
+    rec.clear()
+    rec.start_recording()
+    barrier = threading.Barrier(thread_count + 1)
+
+    def record():
+        barrier.wait()
+        for _ in range(events_per_thread):
+            Recorder.add_event(Event("call"))
+
+    threads = [threading.Thread(target=record) for _ in range(thread_count)]
+    for t in threads:
+        t.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    events = rec.stop_recording()
+    assert len(events) == thread_count * events_per_thread
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n", 1)[0])
+    parser.add_argument("--events", type=int, default=50_000, help="events per thread")
+    parser.add_argument(
+        "--threads",
+        type=lambda v: [int(n) for n in v.split(",")],
+        default=[1, 2, 4, 8, 16, 32],
+        help="comma-separated thread counts",
+    )
+    args = parser.parse_args()
+
+    print(f"{'threads':>8} {'mode':>8} {'seconds':>10} {'events/s':>12}")
+    for thread_count in args.threads:
+        for mode in ("false", "true"):
+            _appmap.initialize(env={"APPMAP_THREAD_BUFFERS": mode})
+            elapsed = run(thread_count, args.events)
+            label = "buffers" if mode == "true" else "locked"
+            rate = thread_count * args.events / elapsed
+            print(f"{thread_count:>8} {label:>8} {elapsed:>10.3f} {rate:>12,.0f}")
+
+
+if __name__ == "__main__":
+    main()